@@ -141,7 +141,11 @@ setup(
     # dependencies). You can install these using the following syntax,
     # for example:
     # $ pip install -e .[testing]
-    extras_require={'testing': ['pytest', 'pytest-runner', 'pytest-html', 'pytest-cov', 'pytest-mock']},
+    # 异步资源/控制器(async_pool, async_crud, async_controller)需要Python 3.7+，另需安装异步数据库驱动
+    extras_require={'testing': ['pytest', 'pytest-runner', 'pytest-html', 'pytest-cov', 'pytest-mock'],
+                    'async': ["falcon>=3.0.0,<4.0; python_version>='3.7'",
+                              "SQLAlchemy>=1.4.0,<2.0; python_version>='3.7'",
+                              "greenlet; python_version>='3.7'"]},
 
     # If there are data files included in your packages that need to be
     # installed, specify them here.  If using Python 2.6 or less, then these
@@ -0,0 +1,345 @@
+# coding=utf-8
+"""
+本模块提供falcon ASGI应用(falcon.asgi.App)使用的异步控制器
+
+依赖:
+    Python 3.7+
+    falcon 3.0+
+
+控制器的resource需为AsyncResourceBase，请求体通过req.get_media()获取，响应直接序列化为JSON，无需JSONTranslator中间件，
+响应缓存(response_cache)的读写在线程池中执行，不会阻塞事件循环
+
+import falcon.asgi
+from talos.common import async_controller
+
+class CollectionUser(async_controller.AsyncCollectionController):
+    name = 'users'
+    resource = resource.AsyncUser
+
+app = falcon.asgi.App()
+app.add_error_handler(Exception, async_controller.error_http_exception)
+app.set_error_serializer(base.error_serializer)
+app.add_route('/v1/users', CollectionUser())
+"""
+
+from __future__ import absolute_import
+
+import asyncio
+import copy
+import functools
+import json
+
+import falcon
+import six
+
+from talos.common import controller
+from talos.core import config
+from talos.core import exceptions
+from talos.core import utils
+from talos.core.i18n import _
+from talos.db import crud
+
+CONF = config.CONF
+
+
+async def error_http_exception(req, resp, ex, params):
+    """ASGI应用的异常处理，同talos.server.base.error_http_exception"""
+    from talos.server import base
+    base.error_http_exception(ex, req, resp, params)
+
+
+def _write_json(resp, data):
+    resp.content_type = falcon.MEDIA_JSON
+    resp.text = _dumps(data)
+
+
+def _dumps(data):
+    return json.dumps(data, cls=utils.ComplexEncoder)
+
+
+async def _run_in_executor(func, *args, **kwargs):
+    return await asyncio.get_event_loop().run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+
+class _AsyncControllerMixin(object):
+
+    def _response_cache_enabled(self):
+        response_cache = self.response_cache
+        if response_cache is None:
+            response_cache = CONF.controller.response_cache
+        return bool(response_cache) and self.resource is not None
+
+    async def _response_cache_lookup_async(self, req, resp, **kwargs):
+        if not self._response_cache_enabled():
+            return False, None
+        return await _run_in_executor(self._response_cache_lookup, req, resp, **kwargs)
+
+    async def _get_data(self, req):
+        try:
+            return await req.get_media()
+        except falcon.MediaNotFoundError:
+            raise falcon.HTTPBadRequest(title=_("JSON Required"), description=_("body malformat, json required"))
+
+    async def _respond(self, req, resp, data, cache_key=None):
+        if cache_key is not None:
+            await _run_in_executor(self._response_cache_store_body, req, resp, cache_key, _dumps(data))
+            return
+        _write_json(resp, data)
+
+
+class AsyncCollectionController(_AsyncControllerMixin, controller.CollectionController):
+    """异步集合控制器"""
+
+    async def on_get(self, req, resp, **kwargs):
+        """
+        处理GET请求，请求中指定了游标(__cursor)时使用游标分页，响应中额外返回next_cursor
+
+        :param req: 请求对象
+        :type req: Request
+        :param resp: 相应对象
+        :type resp: Response
+        """
+        self._validate_method(req)
+        hit, cache_key = await self._response_cache_lookup_async(req, resp, **kwargs)
+        if hit:
+            return
+        refs = []
+        count = 0
+        count_strategy = None
+        next_cursor = None
+        criteria = self._build_criteria(req)
+        if criteria:
+            single_pass_count = self.single_pass_count
+            if single_pass_count is None:
+                single_pass_count = CONF.controller.single_pass_count
+            stream_list = self.stream_list
+            if stream_list is None:
+                stream_list = CONF.controller.stream_list
+            if stream_list and 'cursor' not in criteria:
+                count, count_strategy = await self.count_with_strategy(req, criteria, **kwargs)
+                refs = self.iter_list(req, criteria, **kwargs)
+                resp.content_type = falcon.MEDIA_JSON
+                resp.stream = self._aiter_json(self._count_result(count, count_strategy), 'data', refs)
+                return
+            if 'cursor' in criteria:
+                refs, next_cursor = await self.list_by_cursor(req, criteria, **kwargs)
+                count, count_strategy = await self.count_with_strategy(req, criteria, results=refs, **kwargs)
+            elif single_pass_count:
+                count, refs = await self.list_with_count(req, criteria, **kwargs)
+            else:
+                refs = await self.list(req, criteria, **kwargs)
+                count, count_strategy = await self.count_with_strategy(req, criteria, results=refs, **kwargs)
+        data = self._count_result(count, count_strategy)
+        data['data'] = refs
+        if criteria and 'cursor' in criteria:
+            data['next_cursor'] = next_cursor
+        await self._respond(req, resp, data, cache_key)
+
+    async def count(self, req, criteria, results=None, **kwargs):
+        """同CollectionController.count"""
+        criteria = copy.deepcopy(criteria)
+        filters = criteria.pop('filters', None)
+        return await self.make_resource(req).count(filters)
+
+    async def count_with_strategy(self, req, criteria, results=None, **kwargs):
+        """同CollectionController.count_with_strategy"""
+        if (six.get_unbound_function(type(self).count) is not
+                six.get_unbound_function(AsyncCollectionController.count)):
+            return await self.count(req, criteria, results=results, **kwargs), None
+        filters = copy.deepcopy(criteria.get('filters', None))
+        resource = self.make_resource(req)
+        if not hasattr(resource, 'count_with_strategy'):
+            return await resource.count(filters), None
+        count, count_strategy = await resource.count_with_strategy(filters)
+        if getattr(resource, '_count_strategy', crud.COUNT_EXACT) == crud.COUNT_EXACT:
+            count_strategy = None
+        return count, count_strategy
+
+    async def list(self, req, criteria, **kwargs):
+        """同CollectionController.list"""
+        criteria = self._list_criteria(criteria)
+        criteria.pop('cursor', None)
+        fields = self._pop_fields(criteria)
+        refs = await self.make_resource(req).list(**criteria)
+        if fields is not None:
+            refs = [self._simplify_info(ref, fields) for ref in refs]
+        return refs
+
+    async def iter_list(self, req, criteria, **kwargs):
+        """同CollectionController.iter_list，返回异步生成器"""
+        criteria = self._list_criteria(criteria)
+        criteria.pop('cursor', None)
+        fields = self._pop_fields(criteria)
+        async for ref in self.make_resource(req).iter_list(**criteria):
+            if fields is not None:
+                ref = self._simplify_info(ref, fields)
+            yield ref
+
+    async def _aiter_json(self, data, key, items):
+        """同CollectionController._iter_json，items为异步生成器"""
+        head = json.dumps(data, cls=utils.ComplexEncoder)[:-1]
+        if data:
+            head += ', '
+        yield utils.ensure_bytes('%s%s: [' % (head, json.dumps(key)))
+        chunk = []
+        delimiter = ''
+        async for item in items:
+            chunk.append(json.dumps(item, cls=utils.ComplexEncoder))
+            if len(chunk) >= self.stream_chunk_size:
+                yield utils.ensure_bytes(delimiter + ', '.join(chunk))
+                chunk = []
+                delimiter = ', '
+        if chunk:
+            yield utils.ensure_bytes(delimiter + ', '.join(chunk))
+        yield b']}'
+
+    async def list_with_count(self, req, criteria, **kwargs):
+        """同CollectionController.list_with_count"""
+        criteria = self._list_criteria(criteria)
+        fields = self._pop_fields(criteria)
+        count, refs = await self.make_resource(req).list_with_count(**criteria)
+        if fields is not None:
+            refs = [self._simplify_info(ref, fields) for ref in refs]
+        return count, refs
+
+    async def list_by_cursor(self, req, criteria, **kwargs):
+        """同CollectionController.list_by_cursor"""
+        criteria = self._list_criteria(criteria)
+        criteria.pop('offset', None)
+        fields = self._pop_fields(criteria)
+        refs, next_cursor = await self.make_resource(req).list_by_cursor(**criteria)
+        if fields is not None:
+            refs = [self._simplify_info(ref, fields) for ref in refs]
+        return refs, next_cursor
+
+    async def on_post(self, req, resp, **kwargs):
+        """
+        处理POST请求
+
+        :param req: 请求对象
+        :type req: Request
+        :param resp: 相应对象
+        :type resp: Response
+        """
+        self._validate_method(req)
+        data = await self._get_data(req)
+        if utils.is_list_type(data):
+            refs = await self.create_many(req, data, **kwargs)
+            _write_json(resp, {'count': len(refs), 'data': refs})
+        else:
+            _write_json(resp, await self.create(req, data, **kwargs))
+        resp.status = falcon.HTTP_201
+
+    async def create(self, req, data, **kwargs):
+        """同CollectionController.create"""
+        return await self.make_resource(req).create(data)
+
+    async def create_many(self, req, datas, **kwargs):
+        """同CollectionController.create_many"""
+        return await self.make_resource(req).create_many(datas)
+
+    async def on_patch(self, req, resp, **kwargs):
+        """
+        处理PATCH请求，批量更新资源，需在allow_methods中启用PATCH
+
+        :param req: 请求对象
+        :type req: Request
+        :param resp: 相应对象
+        :type resp: Response
+        """
+        self._validate_method(req)
+        data = await self._get_data(req)
+        if not utils.is_list_type(data):
+            raise exceptions.ValidationError(attribute='body', msg=_('list of resources required'))
+        refs = [after for before, after in await self.update_many(req, data, **kwargs) if after is not None]
+        _write_json(resp, {'count': len(refs), 'data': refs})
+
+    async def update_many(self, req, datas, **kwargs):
+        """同CollectionController.update_many"""
+        return await self.make_resource(req).update_many(datas)
+
+    async def on_delete(self, req, resp, **kwargs):
+        """
+        处理DELETE请求，批量删除资源，需在allow_methods中启用DELETE
+
+        :param req: 请求对象
+        :type req: Request
+        :param resp: 相应对象
+        :type resp: Response
+        """
+        self._validate_method(req)
+        data = await self._get_data(req)
+        if not utils.is_list_type(data):
+            raise exceptions.ValidationError(attribute='body', msg=_('list of resource ids required'))
+        count, details = await self.delete_many(req, data, **kwargs)
+        _write_json(resp, {'count': count, 'data': details})
+
+    async def delete_many(self, req, rids, **kwargs):
+        """同CollectionController.delete_many"""
+        return await self.make_resource(req).delete_many(rids)
+
+
+class AsyncItemController(_AsyncControllerMixin, controller.ItemController):
+    """异步单项资源控制器"""
+
+    async def on_get(self, req, resp, **kwargs):
+        """
+        处理GET请求
+
+        :param req: 请求对象
+        :type req: Request
+        :param resp: 相应对象
+        :type resp: Response
+        """
+        self._validate_method(req)
+        hit, cache_key = await self._response_cache_lookup_async(req, resp, **kwargs)
+        if hit:
+            return
+        ref = await self.get(req, **kwargs)
+        if ref is None:
+            raise exceptions.NotFoundError(resource=self.resource.__name__)
+        await self._respond(req, resp, ref, cache_key)
+
+    async def get(self, req, **kwargs):
+        """同ItemController.get"""
+        return await self.make_resource(req).get(**kwargs)
+
+    async def on_patch(self, req, resp, **kwargs):
+        """
+        处理PATCH请求
+
+        :param req: 请求对象
+        :type req: Request
+        :param resp: 相应对象
+        :type resp: Response
+        """
+        self._validate_method(req)
+        data = await self._get_data(req)
+        ref_before, ref_after = await self.update(req, data, **kwargs)
+        if ref_after is None:
+            raise exceptions.NotFoundError(resource=self.resource.__name__)
+        _write_json(resp, ref_after)
+
+    async def update(self, req, data, **kwargs):
+        """同ItemController.update"""
+        rid = kwargs.pop('rid')
+        return await self.make_resource(req).update(rid, data)
+
+    async def on_delete(self, req, resp, **kwargs):
+        """
+        处理DELETE请求
+
+        :param req: 请求对象
+        :type req: Request
+        :param resp: 相应对象
+        :type resp: Response
+        """
+        self._validate_method(req)
+        ref, details = await self.delete(req, **kwargs)
+        if not ref:
+            raise exceptions.NotFoundError(resource=self.resource.__name__)
+        _write_json(resp, {'count': ref, 'data': details})
+
+    async def delete(self, req, **kwargs):
+        """同ItemController.delete"""
+        return await self.make_resource(req).delete(**kwargs)
@@ -17,24 +17,47 @@
                 "redis_expiration_time": 21600,
                 "distributed_lock": true,
                 "lock_timeout": 30 # 当使用分布式锁时，需要设置此项
-            }
+            },
+            # 可选，进程内二级缓存(near cache)
+            "local_cache": true,
+            "local_cache_size": 1024,
+            "local_cache_ttl": 5,
+            # 进程间失效方式：null(仅依赖local_cache_ttl)，version(共享版本key)，pubsub(redis发布订阅)
+            "local_cache_invalidation": "pubsub"
         }
 
 使用方式:
     get(key)
     set(key, value)
     get_or_create(key, func_value)
+    get_or_create(key, func_value, expires=60, stale=30, jitter=0.1)
     delete(key)
+    get_multi(keys) / set_multi(mapping) / delete_multi(keys)
+    get_or_create_multi(keys, func_values)
+    @cached(expires=60, namespace='ns') / func.invalidate(*args) / invalidate_namespace('ns')
     validate(get(key))
+    stats()
 """
 
 from __future__ import absolute_import
 
+import collections
 import contextlib
+import datetime
+import decimal
+import functools
+import hashlib
+import json
 import logging
+import threading
+import time
+import uuid
+import zlib
 
+import six
 from dogpile.cache import make_region
 from dogpile.cache.api import NO_VALUE
+from dogpile.cache.region import CacheRegion
 from talos.core import config
 from talos.core import utils
 
@@ -78,6 +101,304 @@ class CacheProxy(object):
 
 
 CACHE = CacheProxy()
+# 进程间失效方式
+INVALIDATION_VERSION = 'version'
+INVALIDATION_PUBSUB = 'pubsub'
+_GENERATION_KEY = 'talos.cache.generation'
+# 正在后台刷新的key
+_REFRESHING = {}
+_REFRESHING_LOCK = threading.Lock()
+_INVALIDATION_CHANNEL = 'talos.cache.invalidation'
+# dogpile.cache 1.3+才能获取缓存的创建时间，低版本get_or_create不支持stale/jitter，由后端按expires过期
+_METADATA_SUPPORTED = hasattr(CacheRegion, 'get_value_metadata')
+
+
+class _Metrics(object):
+    """缓存命中统计"""
+
+    def __init__(self):
+        self.local_hits = 0
+        self.remote_hits = 0
+        self.misses = 0
+
+    def to_dict(self):
+        return {'local_hits': self.local_hits, 'remote_hits': self.remote_hits, 'misses': self.misses}
+
+    def clear(self):
+        self.local_hits = 0
+        self.remote_hits = 0
+        self.misses = 0
+
+
+METRICS = _Metrics()
+
+
+def _region_get_with_metadata(region, key, expiration_time=None, ignore_expiration=False):
+    if hasattr(region, 'get_value_metadata'):
+        cached = region.get_value_metadata(key, expiration_time=expiration_time, ignore_expiration=ignore_expiration)
+        if cached is None:
+            return NO_VALUE, None
+        return cached.payload, cached.metadata['ct']
+    # dogpile.cache 1.3以下无法获取创建时间，以读取时间代替(仅用于进程内缓存，get_or_create不使用)
+    value = region.get(key, expiration_time=expiration_time, ignore_expiration=ignore_expiration)
+    return value, None if value is NO_VALUE else time.time()
+
+
+def _region_get_multi_with_metadata(region, keys, expiration_time=None, ignore_expiration=False):
+    if _METADATA_SUPPORTED and hasattr(region, '_get_multi_from_backend'):
+        # 与region.get_multi逻辑一致，但保留缓存值的创建时间
+        mangled_keys = [region.key_mangler(key) for key in keys] if region.key_mangler else keys
+        unexpired = region._unexpired_value_fn(expiration_time, ignore_expiration)
+        results = []
+        for cached in region._get_multi_from_backend(mangled_keys):
+            cached = unexpired(cached)
+            results.append((NO_VALUE, None) if cached is NO_VALUE else (cached.payload, cached.metadata['ct']))
+        return results
+    now = time.time()
+    values = region.get_multi(keys, expiration_time=expiration_time, ignore_expiration=ignore_expiration)
+    return [(value, None if value is NO_VALUE else now) for value in values]
+
+
+class NearCache(object):
+    """
+    二级缓存，在cache后端(dogpile region)之前增加一层短TTL的进程内LRU，热点key无需每次访问后端
+
+    本进程的set/delete会同步更新进程内缓存，其他进程的写入在local_cache_ttl后可见，
+    或者通过invalidation加速失效：
+
+    * version：写入时变更共享版本key，每check_interval秒检查一次，版本变化时清空进程内缓存
+    * pubsub：写入时通过redis发布key，订阅线程收到后移除进程内对应的key(需使用dogpile.cache.redis)，
+      订阅断开时清空进程内缓存并重新订阅
+
+    注意：与memory后端相同，进程内缓存命中时返回的是同一对象，调用者不应修改返回值
+    """
+
+    def __init__(self, region, maxsize=1024, ttl=5, invalidation=None, check_interval=1, metrics=None):
+        """
+        :param region: cache后端
+        :type region: `dogpile.cache.region.CacheRegion`
+        :param maxsize: 进程内缓存的最大数量
+        :type maxsize: int
+        :param ttl: 进程内缓存的有效时间(秒)
+        :type ttl: float
+        :param invalidation: 进程间失效方式，None/version/pubsub
+        :type invalidation: str
+        :param check_interval: version方式下检查版本的间隔(秒)
+        :type check_interval: float
+        """
+        self.region = region
+        self.local = utils.LRUCache(maxsize=maxsize)
+        self.ttl = ttl
+        self.invalidation = invalidation
+        self.check_interval = check_interval
+        self.metrics = metrics or _Metrics()
+        self._id = uuid.uuid4().hex
+        self._generation = None
+        self._checked_at = 0
+        self._subscriber = None
+        self._lock = threading.Lock()
+
+    def _sync(self):
+        if self.invalidation == INVALIDATION_VERSION:
+            now = time.time()
+            if now - self._checked_at < self.check_interval:
+                return
+            self._checked_at = now
+            generation = self.region.get(_GENERATION_KEY, ignore_expiration=True)
+            if generation != self._generation:
+                self.local.clear()
+                self._generation = generation
+        elif self.invalidation == INVALIDATION_PUBSUB and self._subscriber is None:
+            with self._lock:
+                if self._subscriber is None:
+                    self._subscriber = self._subscribe()
+
+    def _redis_client(self):
+        backend = self.region.backend
+        return getattr(backend, 'writer_client', None) or getattr(backend, 'client', None)
+
+    def _subscribe(self):
+        client = self._redis_client()
+        if client is None or not hasattr(client, 'pubsub'):
+            LOG.warning('cache backend does not support pubsub, local cache relies on ttl only')
+            return False
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(_INVALIDATION_CHANNEL)
+        subscriber = threading.Thread(target=self._listen, args=(client, pubsub), name='talos-cache-invalidation')
+        subscriber.daemon = True
+        subscriber.start()
+        return subscriber
+
+    def _listen(self, client, pubsub):
+        while True:
+            try:
+                for message in pubsub.listen():
+                    try:
+                        data = json.loads(utils.ensure_unicode(message['data']))
+                        if data['s'] != self._id:
+                            self.local.delete(data['k'])
+                    except Exception as e:
+                        LOG.warning('malformed cache invalidation message: %s, reason: %s', message, e)
+            except Exception as e:
+                LOG.warning('cache invalidation subscriber disconnected, resubscribing, reason: %s', e)
+            # 断开期间可能错过失效消息，清空进程内缓存后重新订阅
+            self.local.clear()
+            time.sleep(self.check_interval)
+            try:
+                pubsub.close()
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(_INVALIDATION_CHANNEL)
+            except Exception as e:
+                LOG.warning('failed to resubscribe cache invalidation, reason: %s', e)
+
+    def _notify(self, *keys):
+        try:
+            if self.invalidation == INVALIDATION_VERSION:
+                self._generation = uuid.uuid4().hex
+                self.region.set(_GENERATION_KEY, self._generation)
+            elif self.invalidation == INVALIDATION_PUBSUB:
+                # 无论本进程是否已订阅(如仅写入的进程)，均需通知其他进程
+                client = self._redis_client()
+                if client is None or not hasattr(client, 'publish'):
+                    return
+                pipe = client.pipeline() if len(keys) > 1 else client
+                for key in keys:
+                    pipe.publish(_INVALIDATION_CHANNEL, json.dumps({'s': self._id, 'k': key}))
+                if pipe is not client:
+                    pipe.execute()
+        except Exception as e:
+            LOG.warning('failed to notify cache invalidation: %s, reason: %s', keys, e)
+
+    def get(self, key, expiration_time=None, ignore_expiration=False):
+        return self.get_with_metadata(key, expiration_time=expiration_time, ignore_expiration=ignore_expiration)[0]
+
+    def get_with_metadata(self, key, expiration_time=None, ignore_expiration=False):
+        """
+        获取缓存值以及其创建时间
+
+        :returns: (缓存值, 创建时间戳)，未命中时为(NO_VALUE, None)
+        :rtype: tuple
+        """
+        self._sync()
+        now = time.time()
+        entry = self.local.get(key)
+        if entry is not None:
+            fetched_at, created_at, value = entry
+            if expiration_time is None:
+                expiration_time = self.region.expiration_time
+            if now - fetched_at <= self.ttl and (ignore_expiration or expiration_time is None or
+                                                 now - created_at <= expiration_time):
+                self.metrics.local_hits += 1
+                return value, created_at
+        value, created_at = _region_get_with_metadata(self.region, key, expiration_time, ignore_expiration)
+        if value is NO_VALUE:
+            self.metrics.misses += 1
+            return value, None
+        self.metrics.remote_hits += 1
+        self.local.set(key, (now, created_at, value))
+        return value, created_at
+
+    def set(self, key, value):
+        result = self.region.set(key, value)
+        now = time.time()
+        self.local.set(key, (now, now, value))
+        self._notify(key)
+        return result
+
+    def delete(self, key):
+        result = self.region.delete(key)
+        self.local.delete(key)
+        self._notify(key)
+        return result
+
+    def get_multi(self, keys, expiration_time=None, ignore_expiration=False):
+        """
+        批量获取缓存值，进程内未命中的key通过一次后端请求获取
+
+        :returns: 与keys顺序一致的缓存值列表，未命中为NO_VALUE
+        :rtype: list
+        """
+        self._sync()
+        now = time.time()
+        if expiration_time is None:
+            expiration_time = self.region.expiration_time
+        values = []
+        missing = []
+        for idx, key in enumerate(keys):
+            entry = self.local.get(key)
+            if entry is not None:
+                fetched_at, created_at, value = entry
+                if now - fetched_at <= self.ttl and (ignore_expiration or expiration_time is None or
+                                                     now - created_at <= expiration_time):
+                    self.metrics.local_hits += 1
+                    values.append(value)
+                    continue
+            values.append(NO_VALUE)
+            missing.append(idx)
+        if missing:
+            remote_values = _region_get_multi_with_metadata(self.region, [keys[idx] for idx in missing],
+                                                            expiration_time=expiration_time,
+                                                            ignore_expiration=ignore_expiration)
+            for idx, (value, created_at) in zip(missing, remote_values):
+                if value is NO_VALUE:
+                    self.metrics.misses += 1
+                    continue
+                self.metrics.remote_hits += 1
+                values[idx] = value
+                self.local.set(keys[idx], (now, created_at, value))
+        return values
+
+    def set_multi(self, mapping):
+        result = self.region.set_multi(mapping)
+        now = time.time()
+        for key, value in mapping.items():
+            self.local.set(key, (now, now, value))
+        self._notify(*mapping.keys())
+        return result
+
+    def delete_multi(self, keys):
+        result = self.region.delete_multi(keys)
+        for key in keys:
+            self.local.delete(key)
+        self._notify(*keys)
+        return result
+
+
+# 首次使用时根据配置创建
+_NEAR_CACHES = []
+_NEAR_CACHES_LOCK = threading.Lock()
+
+
+def _client():
+    if not _NEAR_CACHES:
+        with _NEAR_CACHES_LOCK:
+            if not _NEAR_CACHES:
+                near_cache = None
+                if utils.get_config(CONF, 'cache.local_cache', False):
+                    near_cache = NearCache(CACHE,
+                                           maxsize=utils.get_config(CONF, 'cache.local_cache_size', 1024),
+                                           ttl=utils.get_config(CONF, 'cache.local_cache_ttl', 5),
+                                           invalidation=utils.get_config(CONF, 'cache.local_cache_invalidation',
+                                                                         None),
+                                           check_interval=utils.get_config(
+                                               CONF, 'cache.local_cache_check_interval', 1),
+                                           metrics=METRICS)
+                _NEAR_CACHES.append(near_cache)
+    return _NEAR_CACHES[0]
+
+
+def stats():
+    """
+    获取缓存命中统计，未启用进程内缓存时local_hits始终为0
+
+    :returns: {'local_hits': int, 'remote_hits': int, 'misses': int}
+    :rtype: dict
+    """
+    return METRICS.to_dict()
+
+
+# 后端不提供锁时(如memory，或未启用distributed_lock)，使用进程内的分段锁
+_LOCAL_LOCKS = [threading.RLock() for _ in range(64)]
 
 
 def validate(value):
@@ -86,27 +407,281 @@ def validate(value):
     return True
 
 
-def get(key, exipres=None):
-    value = CACHE.get(key, expiration_time=exipres)
+def get(key, exipres=None, ignore_expiration=False):
+    near_cache = _client()
+    if near_cache is not None:
+        return near_cache.get(key, expiration_time=exipres, ignore_expiration=ignore_expiration)
+    value = CACHE.get(key, expiration_time=exipres, ignore_expiration=ignore_expiration)
+    if value is NO_VALUE:
+        METRICS.misses += 1
+    else:
+        METRICS.remote_hits += 1
     return value
 
 
 def set(key, value):
+    near_cache = _client()
+    if near_cache is not None:
+        return near_cache.set(key, value)
     return CACHE.set(key, value)
 
 
-def get_or_create(key, creator, expires=None):
-    value = get(key, exipres=expires)
-    if not validate(value):
+def get_with_metadata(key, exipres=None, ignore_expiration=False):
+    """
+    获取缓存值以及其创建时间
+
+    :returns: (缓存值, 创建时间戳)，未命中时为(NO_VALUE, None)
+    :rtype: tuple
+    """
+    near_cache = _client()
+    if near_cache is not None:
+        return near_cache.get_with_metadata(key, expiration_time=exipres, ignore_expiration=ignore_expiration)
+    value, created_at = _region_get_with_metadata(CACHE, key, exipres, ignore_expiration)
+    if value is NO_VALUE:
+        METRICS.misses += 1
+    else:
+        METRICS.remote_hits += 1
+    return value, created_at
+
+
+def _jittered_expires(key, created_at, expires, jitter):
+    '''
+    为过期时间增加抖动，抖动由key以及创建时间决定，同一条缓存在各个进程中的过期时间一致，
+    而同时写入的不同key不会同时过期
+    '''
+    if not jitter or expires is None:
+        return expires
+    seed = zlib.crc32(utils.ensure_bytes('%s:%s' % (key, created_at))) & 0xffffffff
+    return expires * (1 - jitter * (seed / float(0xffffffff)))
+
+
+def _refresh(key, creator, should_cache_fn=None):
+    try:
+        # 仅有一个进程/线程执行刷新，其余继续使用旧值
+        with distributed_lock(key + ':create', blocking=False) as locked:
+            if locked:
+                value = creator()
+                if should_cache_fn is None or should_cache_fn(value):
+                    set(key, value)
+    except Exception as e:
+        LOG.exception(e)
+    finally:
+        with _REFRESHING_LOCK:
+            _REFRESHING.pop(key, None)
+
+
+def _refresh_async(key, creator, should_cache_fn=None):
+    with _REFRESHING_LOCK:
+        if key in _REFRESHING:
+            return
+        _REFRESHING[key] = True
+    worker = threading.Thread(target=_refresh, args=(key, creator, should_cache_fn), name='talos-cache-refresh')
+    worker.daemon = True
+    worker.start()
+
+
+def get_or_create(key, creator, expires=None, stale=None, jitter=None, should_cache_fn=None):
+    """
+    获取缓存值，不存在或已过期时调用creator生成并写入缓存，
+    同一key并发未命中时，通过distributed_lock保证仅有一个进程/线程调用creator，其余等待并使用其结果
+
+    :param key: 缓存key
+    :type key: str
+    :param creator: 生成缓存值的函数
+    :type creator: callable
+    :param expires: 过期时间(秒)，默认为CONF.cache.expiration_time
+    :type expires: int
+    :param stale: 过期后仍可返回旧值的时间(秒)，期间由后台线程刷新(stale-while-revalidate)，
+                  默认为CONF.cache.stale_while_revalidate，0则不返回旧值
+    :type stale: int
+    :param jitter: 过期时间的随机缩短比例(0~1)，避免同时写入的key同时过期，默认为CONF.cache.expiration_jitter
+    :type jitter: float
+    :param should_cache_fn: 判断creator生成的值是否写入缓存，如lambda value: value is not None，默认均写入
+
+    注意：stale以及jitter需要dogpile.cache 1.3+，低版本中忽略
+    :type should_cache_fn: callable
+    :returns: 缓存值
+    :rtype: any
+    """
+    if expires is None:
+        expires = CACHE.expiration_time
+    if stale is None:
+        stale = utils.get_config(CONF, 'cache.stale_while_revalidate', 0)
+    if jitter is None:
+        jitter = utils.get_config(CONF, 'cache.expiration_jitter', 0)
+
+    def _lookup():
+        if not _METADATA_SUPPORTED:
+            value = get(key, exipres=expires)
+            return value, value is not NO_VALUE
+        value, created_at = get_with_metadata(key, ignore_expiration=True)
+        if value is NO_VALUE:
+            return value, False
+        ttl = _jittered_expires(key, created_at, expires, jitter)
+        if ttl is None:
+            return value, True
+        age = time.time() - created_at
+        if age <= ttl:
+            return value, True
+        if stale and age <= ttl + stale:
+            return value, False
+        return NO_VALUE, False
+
+    value, fresh = _lookup()
+    if fresh:
+        return value
+    if value is not NO_VALUE:
+        _refresh_async(key, creator, should_cache_fn)
+        return value
+    with distributed_lock(key + ':create'):
+        # 等待锁期间可能已由其他进程生成
+        value, fresh = _lookup()
+        if fresh:
+            return value
         value = creator()
-        set(key, value)
+        if should_cache_fn is None or should_cache_fn(value):
+            set(key, value)
     return value
 
 
 def delete(key):
+    near_cache = _client()
+    if near_cache is not None:
+        return near_cache.delete(key)
     return CACHE.delete(key)
 
 
+def get_multi(keys, exipres=None, ignore_expiration=False):
+    """
+    批量获取缓存值，使用后端的批量接口(如redis mget)，仅一次网络请求
+
+    :param keys: 缓存key列表
+    :type keys: list
+    :returns: 与keys顺序一致的缓存值列表，未命中为NO_VALUE
+    :rtype: list
+    """
+    keys = list(keys)
+    if not keys:
+        return []
+    near_cache = _client()
+    if near_cache is not None:
+        return near_cache.get_multi(keys, expiration_time=exipres, ignore_expiration=ignore_expiration)
+    values = CACHE.get_multi(keys, expiration_time=exipres, ignore_expiration=ignore_expiration)
+    for value in values:
+        if value is NO_VALUE:
+            METRICS.misses += 1
+        else:
+            METRICS.remote_hits += 1
+    return values
+
+
+def set_multi(mapping):
+    """
+    批量设置缓存值，使用后端的批量接口(如redis pipeline)
+
+    :param mapping: {key: value}
+    :type mapping: dict
+    """
+    if not mapping:
+        return None
+    near_cache = _client()
+    if near_cache is not None:
+        return near_cache.set_multi(mapping)
+    return CACHE.set_multi(mapping)
+
+
+def delete_multi(keys):
+    """
+    批量删除缓存
+
+    :param keys: 缓存key列表
+    :type keys: list
+    """
+    keys = list(keys)
+    if not keys:
+        return None
+    near_cache = _client()
+    if near_cache is not None:
+        return near_cache.delete_multi(keys)
+    return CACHE.delete_multi(keys)
+
+
+def get_or_create_multi(keys, creator_multi, expires=None):
+    """
+    批量获取缓存值，未命中的key一次性交由creator_multi生成并批量写入缓存
+
+    creator_multi(missing_keys)仅接收未命中的key，可以返回：
+
+    * 与missing_keys顺序一致的列表
+    * {key: value}字典，字典中不存在的key不会写入缓存，返回值中对应为NO_VALUE(如实体已被删除)
+
+    与get_or_create相同，未命中的key通过distributed_lock加锁(按固定顺序逐个获取，避免死锁)，
+    获取锁后再次读取缓存，仅仍未命中的key交由creator_multi生成，并发未命中时同一key仅生成一次；
+    使用远程锁时每个未命中的key需要一次加锁请求
+
+    :param keys: 缓存key列表
+    :type keys: list
+    :param creator_multi: 生成缓存值的函数
+    :type creator_multi: callable
+    :param expires: 过期时间(秒)，默认为CONF.cache.expiration_time
+    :type expires: int
+    :returns: 与keys顺序一致的缓存值列表
+    :rtype: list
+    """
+    keys = list(keys)
+    values = get_multi(keys, exipres=expires)
+    missing = [key for key, value in zip(keys, values) if value is NO_VALUE]
+    if not missing:
+        return values
+    # 去重，同一key仅生成一次
+    missing = list(collections.OrderedDict.fromkeys(missing))
+    with _distributed_locks([key + ':create' for key in missing]):
+        # 等待锁期间可能已由其他进程生成
+        created = dict((key, value) for key, value in zip(missing, get_multi(missing, exipres=expires))
+                       if value is not NO_VALUE)
+        creating = [key for key in missing if key not in created]
+        if creating:
+            values_created = creator_multi(creating)
+            if not isinstance(values_created, dict):
+                values_created = dict(zip(creating, values_created))
+            values_created = dict((key, values_created[key]) for key in creating if key in values_created)
+            set_multi(values_created)
+            created.update(values_created)
+    return [created.get(key, NO_VALUE) if value is NO_VALUE else value for key, value in zip(keys, values)]
+
+
+def _get_mutex(key):
+    """获取key对应的锁，以及用于确定加锁顺序的标识"""
+    lock = CACHE.backend.get_mutex(key)
+    if lock is None:
+        idx = hash(key) % len(_LOCAL_LOCKS)
+        return idx, _LOCAL_LOCKS[idx]
+    return key, lock
+
+
+@contextlib.contextmanager
+def _distributed_locks(keys):
+    '''
+    阻塞式获取多个distributed_lock，按固定顺序加锁，并发批量加锁时不会相互死锁
+
+    :param keys: 锁的名称列表
+    :type keys: list
+    '''
+    mutexes = dict(_get_mutex(key) for key in keys)
+    acquired = []
+    try:
+        for order in sorted(mutexes):
+            mutexes[order].acquire(True)
+            acquired.append(order)
+        yield
+    finally:
+        for order in reversed(acquired):
+            try:
+                mutexes[order].release()
+            except Exception as e:
+                LOG.warning('exception raised when release lock: %s, reason: %s' % (order, e))
+
+
 @contextlib.contextmanager
 def distributed_lock(key, blocking=True):
     '''
@@ -117,6 +692,7 @@ def distributed_lock(key, blocking=True):
     * dogpile中以redis，memcached为后端，锁是跨越线程,进程,主机的
     * dogpile中以dbm为后端，锁是跨越线程,进程的
     * dogpile中以memory为后端，锁是跨越线程
+    * 后端未提供锁时(未设置distributed_lock)，使用进程内的锁，仅跨越线程
     
     使用方式：
     
@@ -129,7 +705,8 @@ def distributed_lock(key, blocking=True):
     :param key: 锁的名称
     :param blocking: 是否阻塞式申请锁
     '''
-    lock = CACHE.backend.get_mutex(key)
+    lock = _get_mutex(key)[1]
+    locked = False
     try:
         # blocking=True(默认)时，进入with代表一定是获取到锁，locked主要用于blocking=False时的判断
         locked = lock.acquire(blocking)
@@ -141,3 +718,134 @@ def distributed_lock(key, blocking=True):
                 lock.release()
         except Exception as e:
             LOG.warning('exception raised when release lock: %s, reason: %s' % (key, e))
+
+
+_NAMESPACE_KEY = 'talos.cache.namespace.%s'
+# 命名空间 -> (获取时间, 代数)，namespace_ttl内无需访问cache后端
+_NAMESPACE_GENERATIONS = {}
+
+
+def _key_default(value):
+    # 本模块的set函数覆盖了内置set
+    if isinstance(value, (frozenset, six.moves.builtins.set)):
+        return sorted(value, key=lambda x: json.dumps(x, sort_keys=True, default=_key_default))
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    if isinstance(value, six.binary_type):
+        return utils.ensure_unicode(value)
+    raise TypeError('can not build cache key from %s, use @cached(key=...) or @cached(method=True) for methods instead' % type(value))
+
+
+def make_key(*args, **kwargs):
+    """
+    根据参数生成稳定的缓存key，字典按key排序，集合排序后参与计算
+
+    :returns: 参数摘要
+    :rtype: str
+    """
+    data = json.dumps([args, kwargs], sort_keys=True, default=_key_default, separators=(',', ':'))
+    return hashlib.sha1(utils.ensure_bytes(data)).hexdigest()
+
+
+def namespace_generation(namespace):
+    """
+    获取命名空间当前的代数，invalidate_namespace后代数变化，旧缓存均不再命中
+
+    代数在进程内缓存CONF.cache.namespace_ttl秒(默认1秒)，本进程的invalidate_namespace立即生效，
+    其他进程的invalidate_namespace最多延迟namespace_ttl秒生效
+
+    :param namespace: 命名空间
+    :type namespace: str
+    :returns: 代数
+    :rtype: str
+    """
+    now = time.time()
+    cached = _NAMESPACE_GENERATIONS.get(namespace)
+    if cached is not None and now - cached[0] <= utils.get_config(CONF, 'cache.namespace_ttl', 1):
+        return cached[1]
+    key = _NAMESPACE_KEY % namespace
+    generation = get(key, ignore_expiration=True)
+    if generation is NO_VALUE:
+        generation = uuid.uuid4().hex
+        set(key, generation)
+    _NAMESPACE_GENERATIONS[namespace] = (now, generation)
+    return generation
+
+
+def invalidate_namespace(namespace):
+    """
+    使命名空间下的所有缓存失效
+
+    :param namespace: 命名空间
+    :type namespace: str
+    """
+    generation = uuid.uuid4().hex
+    set(_NAMESPACE_KEY % namespace, generation)
+    _NAMESPACE_GENERATIONS[namespace] = (time.time(), generation)
+
+
+def cached(expires=None, key=None, namespace=None, cache_none=True, stale=None, jitter=None, method=False):
+    """
+    缓存函数、类函数的返回值，异常不会被缓存
+
+    装饰类函数时需指定method=True，第一个参数(self/cls)仅以类名参与key计算，不同实例共享缓存
+
+    eg.
+
+    @cached(expires=60, namespace='user')
+    def get_user_stats(dep_id, filters=None):
+        pass
+
+    get_user_stats.invalidate(1, filters={'age': 18})  # 使对应参数的缓存失效
+    get_user_stats.invalidate_all()  # 使命名空间下的所有缓存失效
+
+    :param expires: 过期时间(秒)，默认为CONF.cache.expiration_time
+    :type expires: int
+    :param key: 自定义key函数，def key(*args, **kwargs) -> str，默认使用make_key
+    :type key: callable
+    :param namespace: 命名空间，默认为函数完整路径，同一命名空间可通过invalidate_namespace一起失效
+    :type namespace: str
+    :param cache_none: 是否缓存None返回值
+    :type cache_none: bool
+    :param stale: 同get_or_create
+    :type stale: int
+    :param jitter: 同get_or_create
+    :type jitter: float
+    :param method: 是否为类函数(包括classmethod内部的函数)，第一个参数仅以类名参与key计算
+    :type method: bool
+    """
+
+    def _inner(fn):
+        qualname = fn.__module__ + '.' + getattr(fn, '__qualname__', fn.__name__)
+        scope = namespace or qualname
+        should_cache_fn = None if cache_none else (lambda value: value is not None)
+
+        def _build_key(*args, **kwargs):
+            if key is not None:
+                digest = key(*args, **kwargs)
+            elif method and args:
+                owner = args[0] if isinstance(args[0], type) else type(args[0])
+                digest = make_key(owner.__module__ + '.' + owner.__name__, *args[1:], **kwargs)
+            else:
+                digest = make_key(*args, **kwargs)
+            return 'talos.cached:%s:%s:%s:%s' % (scope, namespace_generation(scope), qualname, digest)
+
+        @functools.wraps(fn)
+        def __inner(*args, **kwargs):
+            return get_or_create(_build_key(*args, **kwargs), lambda: fn(*args, **kwargs), expires=expires,
+                                 stale=stale, jitter=jitter, should_cache_fn=should_cache_fn)
+
+        def _invalidate(*args, **kwargs):
+            delete(_build_key(*args, **kwargs))
+
+        def _invalidate_all():
+            invalidate_namespace(scope)
+
+        __inner.invalidate = _invalidate
+        __inner.invalidate_all = _invalidate_all
+        __inner.cache_key = _build_key
+        return __inner
+
+    return _inner
@@ -8,18 +8,39 @@ from __future__ import absolute_import
 
 import copy
 import collections
+import hashlib
+import json
 import logging
 import re
 
 import falcon
+import six
 
+from talos.common import cache
 from talos.core import config
 from talos.core import exceptions
 from talos.core import utils
 from talos.core.i18n import _
+from talos.db import crud
 
 LOG = logging.getLogger(__name__)
 CONF = config.CONF
+_RE_INDEXED_KEY = re.compile(r'^(.+)\[(\d+)\]$')
+# 含有反向引用或全局标记的模式无法合并为单个正则表达式
+_RE_UNCOMBINABLE = re.compile(r'\\\d|\(\?P=|\(\?[aiLmsux]+\)')
+# NOTE(wujj): _LEGACY_COMPARATORS仅用于前向兼容v1.2.2
+_LEGACY_COMPARATORS = {'contains': 'like', 'icontains': 'ilike',  # include
+                       'istartswith': 'istarts', 'startswith': 'starts',  # starts with
+                       'iendswith': 'iends', 'endswith': 'ends',  # ends with
+                       'in': 'in', 'notin': 'nin',  # in options
+                       'notequal': 'ne', 'equal': 'eq',  # =, !=
+                       'less': 'lt', 'lessequal': 'lte', 'greater': 'gt', 'greaterequal': 'gte',  # <,<=,>,>=
+                       # NOTE(wujj): new in v1.2.0
+                       'excludes': 'nlike', 'iexcludes': 'nilike',  # exclude
+                       'notnull': 'nnull', 'null': 'null',  # !=None, None
+                       }
+# tuple(supported_filters) -> 预编译的匹配器
+_FILTER_MATCHERS = utils.LRUCache(maxsize=256)
 
 
 class SimplifyMixin(object):
@@ -31,11 +52,66 @@ class SimplifyMixin(object):
         return info
 
 
+class _FilterMatcher(object):
+    """
+    预编译的supported_filters匹配器，完全匹配使用集合查找，
+    其余模式合并为单个正则表达式，每个参数仅需匹配一次
+    """
+
+    def __init__(self, supported_filters):
+        self.enabled = bool(supported_filters)
+        self.exact = frozenset(supported_filters)
+        self.pattern = None
+        if supported_filters:
+            self.patterns = [re.compile(f) for f in supported_filters]
+            if not any(_RE_UNCOMBINABLE.search(f) for f in supported_filters):
+                try:
+                    self.pattern = re.compile('|'.join(['(?:%s)' % f for f in supported_filters]))
+                    self.patterns = None
+                except re.error:
+                    # 如多个模式使用了同名的命名分组，无法合并，逐个匹配
+                    pass
+
+    def match(self, key):
+        if not self.enabled or key in self.exact:
+            return True
+        if self.pattern is not None:
+            return self.pattern.match(key) is not None
+        for pattern in self.patterns:
+            if pattern.match(key):
+                return True
+        return False
+
+
+def _filter_matcher(supported_filters):
+    """
+    获取supported_filters对应的匹配器，每种supported_filters仅编译一次
+
+    :param supported_filters: 支持的过滤条件
+    :type supported_filters: list
+    :rtype: _FilterMatcher
+    """
+    key = tuple(supported_filters or ())
+    matcher = _FILTER_MATCHERS.get(key)
+    if matcher is None:
+        matcher = _FilterMatcher(key)
+        _FILTER_MATCHERS.set(key, matcher)
+    return matcher
+
+
 class Controller(object):
     name = None
     resource = None
     list_size_limit = None
     allow_methods = tuple()
+    # 默认支持的过滤条件，_build_criteria未指定supported_filters时使用，None则不限制
+    supported_filters = None
+    # 是否缓存GET响应(支持ETag/If-None-Match)，None则取决于全局配置
+    # 缓存key包含resource对应model的数据版本，通过ResourceBase写入该model后缓存自动失效
+    # 注意：响应内容与用户相关时，需重写_response_cache_vary
+    response_cache = None
+    # GET响应的缓存时间(秒)，None则取决于全局配置
+    response_cache_expires = None
 
     def _validate_method(self, req):
         if req.method not in self.allow_methods:
@@ -47,6 +123,117 @@ class Controller(object):
         if not hasattr(req, 'json'):
             raise falcon.HTTPBadRequest(title=_("JSON Required"), description=_("body malformat, json required"))
 
+    def _response_cache_vary(self, req):
+        """
+        响应缓存key的额外组成部分，如响应与用户相关时，应返回用户标识
+
+        :param req: 请求对象
+        :type req: Request
+        :returns: 可JSON序列化的值
+        :rtype: any
+        """
+        return None
+
+    def _response_cache_key(self, req, **kwargs):
+        """
+        生成响应缓存key，由控制器、model数据版本、路由参数以及规范化的查询条件组成
+
+        :param req: 请求对象
+        :type req: Request
+        :returns: 缓存key
+        :rtype: str
+        """
+        data = [req.path, kwargs, self._build_criteria(req), self._response_cache_vary(req)]
+        digest = hashlib.sha1(utils.ensure_bytes(json.dumps(data, sort_keys=True, cls=utils.ComplexEncoder)))
+        return 'talos.response:%s.%s:%s:%s' % (type(self).__module__, type(self).__name__,
+                                               crud.model_version(self.resource.orm_meta), digest.hexdigest())
+
+    def _response_cache_lookup(self, req, resp, **kwargs):
+        """
+        查找GET响应缓存，命中时直接写入响应(ETag匹配时为304)
+
+        :param req: 请求对象
+        :type req: Request
+        :param resp: 相应对象
+        :type resp: Response
+        :returns: (是否命中, 缓存key)，未启用缓存时key为None
+        :rtype: tuple
+        """
+        response_cache = self.response_cache
+        if response_cache is None:
+            response_cache = CONF.controller.response_cache
+        if not response_cache or self.resource is None:
+            return False, None
+        expires = self.response_cache_expires
+        if expires is None:
+            expires = CONF.controller.response_cache_expires
+        try:
+            key = self._response_cache_key(req, **kwargs)
+            cached = cache.get(key, exipres=expires)
+        except Exception as e:
+            LOG.warning('failed to lookup response cache, reason: %s', e)
+            return False, None
+        if not cache.validate(cached):
+            self._response_cache_pin_primary(req)
+            return False, key
+        self._write_cached_response(req, resp, cached['etag'], cached['body'])
+        return True, key
+
+    def _response_cache_pin_primary(self, req):
+        """
+        响应缓存未命中时，本次请求的只读会话固定使用主库，
+        写入后的缓存失效在主库提交后立即发生，若从从库读取，延迟期间的旧数据会被写入缓存直至过期
+
+        :param req: 请求对象
+        :type req: Request
+        """
+        try:
+            dbpool = getattr(self.make_resource(req), '_pool', None)
+            if getattr(dbpool, 'replicas', None) and not dbpool.pinned:
+                dbpool.pin_primary()
+        except Exception as e:
+            LOG.warning('failed to pin primary for response cache, reason: %s', e)
+
+    def _response_cache_store(self, req, resp, key):
+        """
+        缓存GET响应，并设置ETag
+
+        :param req: 请求对象
+        :type req: Request
+        :param resp: 相应对象
+        :type resp: Response
+        :param key: 缓存key，为None时忽略
+        :type key: str
+        """
+        if key is None or not hasattr(resp, 'json'):
+            return
+        body = json.dumps(resp.json, cls=utils.ComplexEncoder)
+        # 已完成序列化，无需再由JSONTranslator处理
+        del resp.json
+        self._response_cache_store_body(req, resp, key, body)
+
+    def _response_cache_store_body(self, req, resp, key, body):
+        etag = hashlib.sha1(utils.ensure_bytes(body)).hexdigest()
+        try:
+            cache.set(key, {'etag': etag, 'body': body})
+        except Exception as e:
+            LOG.warning('failed to store response cache, reason: %s', e)
+        self._write_cached_response(req, resp, etag, body)
+
+    def _write_cached_response(self, req, resp, etag, body):
+        resp.set_header('ETag', '"%s"' % etag)
+        if_none_match = req.get_header('If-None-Match')
+        if if_none_match:
+            for tag in if_none_match.split(','):
+                tag = tag.strip()
+                if tag.startswith('W/'):
+                    tag = tag[2:]
+                if tag == '*' or tag.strip('"') == etag:
+                    resp.status = falcon.HTTP_304
+                    return
+        resp.content_type = 'application/json'
+        resp.body = body
+
     def _build_criteria(self, req, supported_filters=None):
         """
         构造过滤条件，包括filters，offset，limit
@@ -59,20 +246,13 @@ class Controller(object):
                                    ['col__in']意味着col仅支持in查询
                                    ['col__.*']意味着col支持所有带条件查询
                                    ['name(__(ilike|lte))?$']意味仅支持默认(等于/in) & ilike & lte 查询
+                                   未指定时使用类属性supported_filters，每种supported_filters仅编译一次
         :type supported_filters: list
-        :returns: {'filters': filters, 'offset': offset, 'limit': limit, 'fields': fields}
+        :returns: {'filters': filters, 'offset': offset, 'limit': limit, 'fields': fields},
+                  请求中指定了游标时，额外包含'cursor'(为空字符串表示第一页)
         :rtype: dict/None
         """
 
-        def _filter_match(pattern_filters, value):
-            for pattern_filter in pattern_filters:
-                if pattern_filter.match(value):
-                    return True
-            return False
-
-        def _transform_comparator(mappings, comparator):
-            return mappings.get(comparator, comparator)
-
         def none_or_empty_to_value(value, default=None):
             if value is None or (utils.is_string_type(value) and len(value) == 0):
                 return default
@@ -81,17 +261,17 @@ class Controller(object):
         query_dict = collections.OrderedDict()
         # 此处仅处理name[0], name[1] ... 情况，因为需要单独将元素组装为list类型
         # 而name[]情况下，falcon会自动组装为list，不再需要合并
-        reg = re.compile(r'^(.+)\[(\d+)\]$')
         for key, value in req.params.items():
-            matches = reg.match(key)
-            if matches:
-                match_key, match_index = matches.groups()
-                if match_key in query_dict:
-                    query_dict[match_key].append(value)
-                else:
-                    query_dict[match_key] = [value]
-            else:
-                query_dict[key] = value
+            if key.endswith(']'):
+                matches = _RE_INDEXED_KEY.match(key)
+                if matches:
+                    match_key, match_index = matches.groups()
+                    if match_key in query_dict:
+                        query_dict[match_key].append(value)
+                    else:
+                        query_dict[match_key] = [value]
+                    continue
+            query_dict[key] = value
         # 移除[]后缀,兼容js数组形态查询
         strip_query_dict = collections.OrderedDict()
         for key, value in query_dict.items():
@@ -100,30 +280,24 @@ class Controller(object):
             else:
                 strip_query_dict[key] = value
         query_dict = strip_query_dict
-        # NOTE(wujj): filter_mapping仅用于前向兼容v1.2.2
-        filter_mapping = {'contains': 'like', 'icontains': 'ilike',  # include
-                          'istartswith': 'istarts', 'startswith': 'starts',  # starts with
-                          'iendswith': 'iends', 'endswith': 'ends',  # ends with
-                          'in': 'in', 'notin': 'nin',  # in options
-                          'notequal': 'ne', 'equal': 'eq',  # =, !=
-                          'less': 'lt', 'lessequal': 'lte', 'greater': 'gt', 'greaterequal': 'gte',  # <,<=,>,>=
-                          # NOTE(wujj): new in v1.2.0
-                          'excludes': 'nlike', 'iexcludes': 'nilike',  # exclude
-                          'notnull': 'nnull', 'null': 'null',  # !=None, None
-                          }
         filters = {}
         offset = None
         limit = None
         orders = None
         fields = None
-
-        key_offset = CONF.controller.criteria_key.offset
-        key_limit = CONF.controller.criteria_key.limit
-        key_orders = CONF.controller.criteria_key.orders
-        key_fields = CONF.controller.criteria_key.fields
-        filter_delimiter = CONF.controller.criteria_key.filter_delimiter
-        supported_filters = supported_filters or []
-        compiled_supported_filters = [re.compile(f) for f in supported_filters]
+        cursor = None
+
+        criteria_key = CONF.controller.criteria_key.to_dict()
+        key_offset = criteria_key['offset']
+        key_limit = criteria_key['limit']
+        key_orders = criteria_key['orders']
+        key_fields = criteria_key['fields']
+        key_cursor = criteria_key['cursor']
+        filter_delimiter = criteria_key['filter_delimiter']
+        unsupported_filter_as_empty = CONF.dbcrud.unsupported_filter_as_empty
+        if supported_filters is None:
+            supported_filters = self.supported_filters
+        matcher = _filter_matcher(supported_filters)
 
         if key_offset in query_dict:
             offset = int(none_or_empty_to_value(query_dict.pop(key_offset), 0))
@@ -144,48 +318,34 @@ class Controller(object):
                     fields = [f.strip() for f in fields]
                 else:
                     fields = [fields.strip()]
-        for key in query_dict:
+        if key_cursor in query_dict:
+            cursor = none_or_empty_to_value(query_dict.pop(key_cursor), '')
+        for key, value in query_dict.items():
             # 没有指定支持filters 或者 filter完全匹配, 快速解析
             # ?name=123  supported_filters=['name']                          -> fast
             # ?name__ilike=123  supported_filters=['name__ilike']            -> fast
             # ?name__ilike=123  supported_filters=['name(__[ilike|eq]])?$']  -> match
-            if len(supported_filters) == 0 or key in supported_filters:
-                keys = key.split(filter_delimiter, 1)
-                # key 是简单条件
-                if len(keys) == 1:
-                    filters[key] = query_dict[key]
-                # key 是复杂条件
-                else:
-                    base_key, comparator = keys[0], keys[1]
-                    comparator = _transform_comparator(filter_mapping, comparator)
-                    if base_key in filters and isinstance(filters[base_key], dict):
-                        filters[base_key].update({comparator: query_dict[key]})
-                    else:
-                        filters[base_key] = {comparator: query_dict[key]}
-            # 用户明确支持的filter 且 传入key不在此列表中，需要组合推测是否符合用户要求
+            if not matcher.match(key):
+                if unsupported_filter_as_empty:
+                    # not match for supported_filters
+                    return None
+                continue
+            keys = key.split(filter_delimiter, 1)
+            # key 是简单条件
+            if len(keys) == 1:
+                filters[key] = value
+            # key 是复杂条件
             else:
-                keys = key.split(filter_delimiter, 1)
-                # key 是简单条件
-                if len(keys) == 1:
-                    if _filter_match(compiled_supported_filters, keys[0]):
-                        filters[keys[0]] = query_dict[keys[0]]
-                    elif CONF.dbcrud.unsupported_filter_as_empty:
-                        # not match for supported_filters
-                        return None
-                # key 是复杂条件
+                base_key, comparator = keys[0], keys[1]
+                comparator = _LEGACY_COMPARATORS.get(comparator, comparator)
+                if base_key in filters and isinstance(filters[base_key], dict):
+                    filters[base_key].update({comparator: value})
                 else:
-                    base_key, comparator = keys[0], keys[1]
-                    comparator = _transform_comparator(filter_mapping, comparator)
-                    # 匹配条件
-                    if _filter_match(compiled_supported_filters, key):
-                        if base_key in filters and isinstance(filters[base_key], dict):
-                            filters[base_key].update({comparator: query_dict[key]})
-                        else:
-                            filters[base_key] = {comparator: query_dict[key]}
-                    elif CONF.dbcrud.unsupported_filter_as_empty:
-                        # not match for supported_filters
-                        return None
-        return {'filters': filters, 'offset': offset, 'limit': limit, 'orders': orders, 'fields': fields}
+                    filters[base_key] = {comparator: value}
+        criteria = {'filters': filters, 'offset': offset, 'limit': limit, 'orders': orders, 'fields': fields}
+        if cursor is not None:
+            criteria['cursor'] = cursor
+        return criteria
 
     def make_resource(self, req):
         return self.resource()
@@ -197,10 +357,21 @@ class Controller(object):
 class CollectionController(Controller, SimplifyMixin):
     """集合控制器"""
     allow_methods = ('GET', 'POST',)
+    # 是否使用单次查询获取列表以及总数(ResourceBase.list_with_count)，None则取决于全局配置
+    # 启用后on_get调用list_with_count，而不再调用list，count
+    single_pass_count = None
+    # 是否以流式方式返回列表(ResourceBase.iter_list)，None则取决于全局配置
+    # 启用后on_get将JSON分块写入resp.stream，内存占用取决于分批大小而非结果集大小
+    stream_list = None
+    # 流式返回时，每个分块包含的记录数量
+    stream_chunk_size = 100
+    # 是否将__fields下推至资源查询(仅SELECT请求的列，不加载未请求的relationship)，None则取决于全局配置
+    # 注意：启用后资源的list/list_with_count/list_by_cursor/iter_list需支持fields参数
+    fields_pushdown = None
 
     def on_get(self, req, resp, **kwargs):
         """
-        处理GET请求
+        处理GET请求，请求中指定了游标(__cursor)时使用游标分页，响应中额外返回next_cursor
 
         :param req: 请求对象
         :type req: Request
@@ -208,13 +379,40 @@ class CollectionController(Controller, SimplifyMixin):
         :type resp: Response
         """
         self._validate_method(req)
+        hit, cache_key = self._response_cache_lookup(req, resp, **kwargs)
+        if hit:
+            return
         refs = []
         count = 0
+        count_strategy = None
+        next_cursor = None
         criteria = self._build_criteria(req)
         if criteria:
-            refs = self.list(req, criteria, **kwargs)
-            count = self.count(req, criteria, results=refs, **kwargs)
-        resp.json = {'count': count, 'data': refs}
+            single_pass_count = self.single_pass_count
+            if single_pass_count is None:
+                single_pass_count = CONF.controller.single_pass_count
+            stream_list = self.stream_list
+            if stream_list is None:
+                stream_list = CONF.controller.stream_list
+            if stream_list and 'cursor' not in criteria:
+                count, count_strategy = self.count_with_strategy(req, criteria, **kwargs)
+                refs = self.iter_list(req, criteria, **kwargs)
+                resp.content_type = 'application/json'
+                resp.stream = self._iter_json(self._count_result(count, count_strategy), 'data', refs)
+                return
+            if 'cursor' in criteria:
+                refs, next_cursor = self.list_by_cursor(req, criteria, **kwargs)
+                count, count_strategy = self.count_with_strategy(req, criteria, results=refs, **kwargs)
+            elif single_pass_count:
+                count, refs = self.list_with_count(req, criteria, **kwargs)
+            else:
+                refs = self.list(req, criteria, **kwargs)
+                count, count_strategy = self.count_with_strategy(req, criteria, results=refs, **kwargs)
+        resp.json = self._count_result(count, count_strategy)
+        resp.json['data'] = refs
+        if criteria and 'cursor' in criteria:
+            resp.json['next_cursor'] = next_cursor
+        self._response_cache_store(req, resp, cache_key)
 
     def count(self, req, criteria, results=None, **kwargs):
         """
@@ -234,6 +432,38 @@ class CollectionController(Controller, SimplifyMixin):
         filters = criteria.pop('filters', None)
         return self.make_resource(req).count(filters)
 
+    def _count_result(self, count, count_strategy):
+        """集合响应中的数量字段，仅当资源配置了非精确的统计策略时返回count_strategy"""
+        result = {'count': count}
+        if count_strategy is not None:
+            result['count_strategy'] = count_strategy
+        return result
+
+    def count_with_strategy(self, req, criteria, results=None, **kwargs):
+        """
+        根据过滤条件以及资源的统计策略，统计资源，
+        若重写了count或资源未提供count_with_strategy，则使用count并视为精确统计
+
+        :param req: 请求对象
+        :type req: Request
+        :param criteria: {'filters': filters, 'offset': offset, 'limit': limit}
+        :type criteria: dict
+        :param results: criteria过滤出来的结果集
+        :type results: list
+        :returns: (符合条件的资源数量, 统计策略)，资源配置为精确统计(exact)时统计策略为None
+        :rtype: tuple
+        """
+        if six.get_unbound_function(type(self).count) is not six.get_unbound_function(CollectionController.count):
+            return self.count(req, criteria, results=results, **kwargs), None
+        filters = copy.deepcopy(criteria.get('filters', None))
+        resource = self.make_resource(req)
+        if not hasattr(resource, 'count_with_strategy'):
+            return resource.count(filters), None
+        count, count_strategy = resource.count_with_strategy(filters)
+        if getattr(resource, '_count_strategy', crud.COUNT_EXACT) == crud.COUNT_EXACT:
+            count_strategy = None
+        return count, count_strategy
+
     def list(self, req, criteria, **kwargs):
         """
         根据过滤条件，获取资源
@@ -245,6 +475,117 @@ class CollectionController(Controller, SimplifyMixin):
         :returns: 符合条件的资源
         :rtype: list
         """
+        criteria = self._list_criteria(criteria)
+        criteria.pop('cursor', None)
+        fields = self._pop_fields(criteria)
+        refs = self.make_resource(req).list(**criteria)
+        if fields is not None:
+            refs = [self._simplify_info(ref, fields) for ref in refs]
+        return refs
+
+    def iter_list(self, req, criteria, **kwargs):
+        """
+        根据过滤条件，以生成器方式获取资源
+
+        :param req: 请求对象
+        :type req: Request
+        :param criteria: {'filters': dict, 'offset': None/int, 'limit': None/int, 'fields': []}
+        :type criteria: dict
+        :returns: 符合条件的资源生成器
+        :rtype: generator
+        """
+        criteria = self._list_criteria(criteria)
+        criteria.pop('cursor', None)
+        fields = self._pop_fields(criteria)
+        for ref in self.make_resource(req).iter_list(**criteria):
+            if fields is not None:
+                ref = self._simplify_info(ref, fields)
+            yield ref
+
+    def _iter_json(self, data, key, items):
+        """
+        将data以及items(作为data[key])编码为JSON，每stream_chunk_size条记录生成一个分块
+
+        :param data: 其他字段
+        :type data: dict
+        :param key: 记录列表的字段名称
+        :type key: str
+        :param items: 记录生成器
+        :type items: generator
+        :returns: JSON分块生成器
+        :rtype: generator
+        """
+        head = json.dumps(data, cls=utils.ComplexEncoder)[:-1]
+        if data:
+            head += ', '
+        yield utils.ensure_bytes('%s%s: [' % (head, json.dumps(key)))
+        chunk = []
+        delimiter = ''
+        for item in items:
+            chunk.append(json.dumps(item, cls=utils.ComplexEncoder))
+            if len(chunk) >= self.stream_chunk_size:
+                yield utils.ensure_bytes(delimiter + ', '.join(chunk))
+                chunk = []
+                delimiter = ', '
+        if chunk:
+            yield utils.ensure_bytes(delimiter + ', '.join(chunk))
+        yield b']}'
+
+    def list_with_count(self, req, criteria, **kwargs):
+        """
+        根据过滤条件，获取资源以及资源总数
+
+        :param req: 请求对象
+        :type req: Request
+        :param criteria: {'filters': dict, 'offset': None/int, 'limit': None/int, 'fields': []}
+        :type criteria: dict
+        :returns: (符合条件的资源数量, 符合条件的资源)
+        :rtype: tuple
+        """
+        criteria = self._list_criteria(criteria)
+        fields = self._pop_fields(criteria)
+        count, refs = self.make_resource(req).list_with_count(**criteria)
+        if fields is not None:
+            refs = [self._simplify_info(ref, fields) for ref in refs]
+        return count, refs
+
+    def list_by_cursor(self, req, criteria, **kwargs):
+        """
+        根据过滤条件以及游标，获取资源，游标模式下忽略offset
+
+        :param req: 请求对象
+        :type req: Request
+        :param criteria: {'filters': dict, 'limit': None/int, 'fields': [], 'cursor': str}
+        :type criteria: dict
+        :returns: (符合条件的资源, 下一页游标)
+        :rtype: tuple
+        """
+        criteria = self._list_criteria(criteria)
+        criteria.pop('offset', None)
+        fields = self._pop_fields(criteria)
+        refs, next_cursor = self.make_resource(req).list_by_cursor(**criteria)
+        if fields is not None:
+            refs = [self._simplify_info(ref, fields) for ref in refs]
+        return refs, next_cursor
+
+    def _pop_fields(self, criteria):
+        """
+        从criteria中取出fields，若启用了fields_pushdown，则保留在criteria中传递给资源
+
+        :param criteria: 查询条件
+        :type criteria: dict
+        :returns: 请求的字段
+        :rtype: list
+        """
+        fields = criteria.pop('fields', None)
+        fields_pushdown = self.fields_pushdown
+        if fields_pushdown is None:
+            fields_pushdown = CONF.controller.fields_pushdown
+        if fields is not None and fields_pushdown:
+            criteria['fields'] = fields
+        return fields
+
+    def _list_criteria(self, criteria):
         criteria = copy.deepcopy(criteria)
         # 如果用户没有设置limit并且程序中自带了size limit则使用默认limit值
         # 若都没有设置，则检测全局配置是否启用并设置
@@ -253,11 +594,7 @@ class CollectionController(Controller, SimplifyMixin):
                 criteria['limit'] = self.list_size_limit
             elif CONF.controller.list_size_limit_enabled and CONF.controller.list_size_limit is not None:
                 criteria['limit'] = CONF.controller.list_size_limit
-        fields = criteria.pop('fields', None)
-        refs = self.make_resource(req).list(**criteria)
-        if fields is not None:
-            refs = [self._simplify_info(ref, fields) for ref in refs]
-        return refs
+        return criteria
 
     def on_post(self, req, resp, **kwargs):
         """
@@ -270,7 +607,11 @@ class CollectionController(Controller, SimplifyMixin):
         """
         self._validate_method(req)
         self._validate_data(req)
-        resp.json = self.create(req, req.json, **kwargs)
+        if utils.is_list_type(req.json):
+            refs = self.create_many(req, req.json, **kwargs)
+            resp.json = {'count': len(refs), 'data': refs}
+        else:
+            resp.json = self.create(req, req.json, **kwargs)
         resp.status = falcon.HTTP_201
 
     def create(self, req, data, **kwargs):
@@ -286,6 +627,77 @@ class CollectionController(Controller, SimplifyMixin):
         """
         return self.make_resource(req).create(data)
 
+    def create_many(self, req, datas, **kwargs):
+        """
+        批量创建资源
+
+        :param req: 请求对象
+        :type req: Request
+        :param datas: 资源的内容列表
+        :type datas: list
+        :returns: 创建后的资源信息列表
+        :rtype: list
+        """
+        return self.make_resource(req).create_many(datas)
+
+    def on_patch(self, req, resp, **kwargs):
+        """
+        处理PATCH请求，批量更新资源，需在allow_methods中启用PATCH
+
+        :param req: 请求对象
+        :type req: Request
+        :param resp: 相应对象
+        :type resp: Response
+        """
+        self._validate_method(req)
+        self._validate_data(req)
+        if not utils.is_list_type(req.json):
+            raise exceptions.ValidationError(attribute='body', msg=_('list of resources required'))
+        refs = [after for before, after in self.update_many(req, req.json, **kwargs) if after is not None]
+        resp.json = {'count': len(refs), 'data': refs}
+
+    def update_many(self, req, datas, **kwargs):
+        """
+        批量更新资源
+
+        :param req: 请求对象
+        :type req: Request
+        :param datas: 资源的内容列表，每项需包含主键
+        :type datas: list
+        :returns: (更新前资源, 更新后资源)列表
+        :rtype: list
+        """
+        return self.make_resource(req).update_many(datas)
+
+    def on_delete(self, req, resp, **kwargs):
+        """
+        处理DELETE请求，批量删除资源，需在allow_methods中启用DELETE
+
+        :param req: 请求对象
+        :type req: Request
+        :param resp: 相应对象
+        :type resp: Response
+        """
+        self._validate_method(req)
+        self._validate_data(req)
+        if not utils.is_list_type(req.json):
+            raise exceptions.ValidationError(attribute='body', msg=_('list of resource ids required'))
+        count, details = self.delete_many(req, req.json, **kwargs)
+        resp.json = {'count': count, 'data': details}
+
+    def delete_many(self, req, rids, **kwargs):
+        """
+        批量删除资源
+
+        :param req: 请求对象
+        :type req: Request
+        :param rids: 资源主键列表
+        :type rids: list
+        :returns: (删除的资源数量, 删除的资源列表)
+        :rtype: tuple
+        """
+        return self.make_resource(req).delete_many(rids)
+
 
 class ItemController(Controller, SimplifyMixin):
     """单项资源控制器"""
@@ -301,9 +713,13 @@ class ItemController(Controller, SimplifyMixin):
         :type resp: Response
         """
         self._validate_method(req)
+        hit, cache_key = self._response_cache_lookup(req, resp, **kwargs)
+        if hit:
+            return
         ref = self.get(req, **kwargs)
         if ref is not None:
             resp.json = ref
+            self._response_cache_store(req, resp, cache_key)
         else:
             raise exceptions.NotFoundError(resource=self.resource.__name__)
 
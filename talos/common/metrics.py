@@ -0,0 +1,68 @@
+# coding=utf-8
+"""
+本模块提供连接池指标的查询接口
+
+使用方式:
+    from talos.common import metrics
+    metrics.add_metrics_route(api, '/metrics', allow_hosts=['127.0.0.1', '10.0.0.0/8'])
+
+    GET /metrics              Prometheus文本格式
+    GET /metrics?format=json  JSON格式
+"""
+
+from __future__ import absolute_import
+
+import ipaddress
+
+from talos.core import exceptions
+from talos.core import utils
+from talos.db import pool
+
+
+class MetricsController(object):
+    """输出所有具名连接池(defaultPool以及POOLS.*)的指标"""
+
+    def __init__(self, allow_hosts=None):
+        """
+        :param allow_hosts: 允许访问的客户端地址/网段，None则不限制
+        :type allow_hosts: list
+        """
+        self.allow_hosts = None
+        if allow_hosts is not None:
+            self.allow_hosts = [ipaddress.ip_network(utils.ensure_unicode(h), strict=False) for h in allow_hosts]
+
+    def _check_auth(self, req):
+        if self.allow_hosts is None:
+            return
+        try:
+            client = ipaddress.ip_address(utils.ensure_unicode(req.remote_addr))
+        except (ValueError, TypeError):
+            raise exceptions.ForbiddenError()
+        clients = [client]
+        # 双栈监听时IPv4客户端地址可能为::ffff:a.b.c.d
+        if client.version == 6 and client.ipv4_mapped is not None:
+            clients.append(client.ipv4_mapped)
+        if not any(c in network for c in clients for network in self.allow_hosts if c.version == network.version):
+            raise exceptions.ForbiddenError()
+
+    def on_get(self, req, resp):
+        self._check_auth(req)
+        if req.get_param('format') == 'json':
+            resp.json = pool.metrics()
+            return
+        resp.content_type = 'text/plain; version=0.0.4'
+        resp.body = pool.format_metrics()
+
+
+def add_metrics_route(api, url='/metrics', allow_hosts=None):
+    """
+    将连接池指标注册到url route中
+
+    :param api: falcon.Api对象
+    :type api: falcon.Api
+    :param url: 路径
+    :type url: str
+    :param allow_hosts: 允许访问的客户端地址/网段，None则不限制
+    :type allow_hosts: list
+    """
+    api.add_route(url, MetricsController(allow_hosts=allow_hosts))
@@ -264,11 +264,17 @@ CONFIG_OPTS = {
     'controller': {
         'list_size_limit_enabled': False,
         'list_size_limit': None,
+        'single_pass_count': False,
+        'stream_list': False,
+        'fields_pushdown': False,
+        'response_cache': False,
+        'response_cache_expires': 60,
         'criteria_key': {
             'offset': '__offset',
             'limit': '__limit',
             'orders': '__orders',
             'fields': '__fields',
+            'cursor': '__cursor',
             'filter_delimiter': '__'
         }
     },
@@ -294,11 +300,33 @@ CONFIG_OPTS = {
         'unsupported_filter_as_empty': False,
         'dynamic_relationship': True,
         'dynamic_load_method': 'joinedload',
+        'selectin_batch_size': 500,
         'detail_relationship_as_summary': False,
+        'query_plan_cache': False,
+        'query_plan_cache_size': 256,
+        'count_strategy': 'exact',
+        'count_cap': 10000,
+        'count_cache_expires': 60,
+        'stream_batch_size': 1000,
+        'bulk_chunk_size': 500,
+        'delete_all_returning': 'records',
+        'entity_cache': False,
+        'entity_cache_expires': 60,
+        'entity_cache_size': 1024,
+        'entity_cache_local_ttl': 5,
+        'model_version_ttl': 1,
+        'cache_invalidation': None,
     },
     'cache': {
         'type': 'dogpile.cache.memory',
-        'expiration_time': 60
+        'expiration_time': 60,
+        'local_cache': False,
+        'local_cache_size': 1024,
+        'local_cache_ttl': 5,
+        'local_cache_invalidation': None,
+        'local_cache_check_interval': 1,
+        'stale_while_revalidate': 0,
+        'expiration_jitter': 0,
     },
     'application': {
         'names': []
@@ -19,6 +19,7 @@ import random
 import re
 import socket
 import sys
+import threading
 import traceback
 import uuid
 
@@ -36,6 +37,83 @@ class ComplexEncoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, obj)
 
 
+class LRUCache(object):
+    """线程安全的LRU缓存，超出容量时淘汰最久未使用的元素，并统计命中/未命中次数"""
+
+    def __init__(self, maxsize=128):
+        """
+        :param maxsize: 最大元素数量
+        :type maxsize: int
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        获取缓存值，命中时将元素标记为最近使用
+
+        :param key: 键
+        :type key: hashable
+        :param default: 未命中时的返回值
+        :type default: any
+        :returns: 缓存值
+        :rtype: any
+        """
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """
+        设置缓存值，超出容量时淘汰最久未使用的元素
+
+        :param key: 键
+        :type key: hashable
+        :param value: 值
+        :type value: any
+        """
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """清空缓存以及统计信息"""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        获取缓存统计信息
+
+        :returns: {'hits': int, 'misses': int, 'size': int, 'maxsize': int}
+        :rtype: dict
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data), 'maxsize': self.maxsize}
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+
 def get_hostname():
     """
     获取主机名
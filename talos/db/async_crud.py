@@ -0,0 +1,250 @@
+# coding=utf-8
+"""
+本模块提供基于asyncio的资源操作
+
+依赖:
+    Python 3.7+
+    SQLAlchemy 1.4+(sqlalchemy.ext.asyncio)
+    异步数据库驱动，如aiosqlite，aiomysql，asyncpg
+
+AsyncResourceBase的定义方式与ResourceBase完全一致(orm_meta, _primary_keys, _validate, 各类hook等)，
+查询构造(_apply_filters)、校验器以及DictBase序列化均复用ResourceBase，
+通过AsyncSession.run_sync在greenlet中执行，数据库IO不会阻塞事件循环
+
+class Users(AsyncResourceBase):
+    orm_meta = models.User
+    _primary_keys = 'id'
+
+users = await Users().list(filters={'name': {'ilike': 'a'}})
+
+注意：实体缓存以及count_strategy=cached需要同步访问cache后端，异步资源中不启用；
+写入提交后的缓存失效(model_version等)在线程池中执行，不会阻塞事件循环
+"""
+
+from __future__ import absolute_import
+
+import asyncio
+import contextlib
+
+from talos.core import config
+from talos.db import async_pool
+from talos.db import crud
+
+CONF = config.CONF
+
+# 同步实现中会互相调用的方法，在同步执行时需使用ResourceBase的实现
+_SYNC_METHODS = ('transaction', 'get_session', 'count', 'count_with_strategy', 'list', 'list_with_count',
+                 'list_by_cursor', 'get', 'create', 'create_many', 'update', 'update_many', 'delete',
+                 'delete_many', 'delete_all')
+_WRITE_METHODS = ('create', 'create_many', 'update', 'update_many', 'delete', 'delete_many', 'delete_all')
+
+
+class AsyncResourceBase(crud.ResourceBase):
+    """
+    异步资源操作基类，list/count/get/create/update/delete等方法均为协程，
+    会话以及事务对象为AsyncSession，连接池默认使用async_pool.defaultPool
+    """
+    # 异步连接池对象(AsyncDBPool)，若不指定，默认使用async_pool.defaultPool
+    orm_pool = None
+
+    def __init__(self,
+                 session=None,
+                 transaction=None,
+                 dbpool=None,
+                 dynamic_relationship=None,
+                 dynamic_load_method=None):
+        super(AsyncResourceBase, self).__init__(session=session,
+                                                transaction=transaction,
+                                                dbpool=dbpool or self.orm_pool or async_pool.defaultPool,
+                                                dynamic_relationship=dynamic_relationship,
+                                                dynamic_load_method=dynamic_load_method)
+        # 实体缓存以及cached统计策略会在事件循环中同步访问cache后端，异步资源不使用
+        self._entity_cache = False
+        if self._count_strategy == crud.COUNT_CACHED:
+            self._count_strategy = crud.COUNT_EXACT
+
+    @classmethod
+    def sync_class(cls):
+        """
+        获取用于在run_sync中执行的同步资源类，继承自cls(保留用户定义的hook)，公开方法使用ResourceBase的同步实现
+
+        :returns: 同步资源类
+        :rtype: type
+        """
+        sync_cls = cls.__dict__.get('_sync_class')
+        if sync_cls is None:
+            attrs = dict((name, getattr(crud.ResourceBase, name)) for name in _SYNC_METHODS)
+            sync_cls = type('_Sync%s' % cls.__name__, (cls,), attrs)
+            cls._sync_class = sync_cls
+        return sync_cls
+
+    def _sync_resource(self, sync_session, write):
+        kwargs = {'transaction': sync_session} if write else {'session': sync_session}
+        return self.sync_class()(dbpool=self._pool,
+                                 dynamic_relationship=self._dynamic_relationship,
+                                 dynamic_load_method=self._dynamic_load_method,
+                                 **kwargs)
+
+    def _call_sync(self, sync_session, write, method, args, kwargs):
+        return getattr(self._sync_resource(sync_session, write), method)(*args, **kwargs)
+
+    async def _run(self, method, *args, **kwargs):
+        write = method in _WRITE_METHODS
+        if self._transaction is not None:
+            return await self._transaction.run_sync(self._call_sync, True, method, args, kwargs)
+        if write:
+            async with self.transaction() as session:
+                return await session.run_sync(self._call_sync, True, method, args, kwargs)
+        if self._session is not None:
+            return await self._session.run_sync(self._call_sync, False, method, args, kwargs)
+        async with self.get_session() as session:
+            return await session.run_sync(self._call_sync, False, method, args, kwargs)
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        """
+        异步事务管理上下文, 如果资源初始化时指定使用外部事务，则返回的也是外部事务对象
+
+        async with self.transaction() as session:
+            await self.create(...)
+            await OtherResource(transaction=session).update(...)
+        """
+        if self._transaction is not None:
+            yield self._transaction
+            return
+        old_transaction = self._transaction
+        async with self._pool.transaction() as session:
+            # 提交后的缓存失效会访问cache后端，推迟到线程池中执行
+            crud.defer_invalidation(session.sync_session)
+            async with session.begin():
+                self._transaction = session
+                try:
+                    yield session
+                finally:
+                    self._transaction = old_transaction
+            await asyncio.get_event_loop().run_in_executor(None, crud.flush_deferred_invalidation,
+                                                           session.sync_session)
+
+    @contextlib.asynccontextmanager
+    async def get_session(self, readonly=False):
+        """
+        异步会话管理上下文, 如果资源初始化时指定使用外部会话/事务，则返回的也是外部会话/事务对象
+        """
+        if self._transaction is not None:
+            yield self._transaction
+        elif self._session is not None:
+            yield self._session
+        else:
+            async with self._pool.get_session() as session:
+                yield session
+
+    async def count(self, filters=None, offset=None, limit=None, hooks=None):
+        """同ResourceBase.count"""
+        return await self._run('count', filters=filters, offset=offset, limit=limit, hooks=hooks)
+
+    async def count_with_strategy(self, filters=None, hooks=None):
+        """同ResourceBase.count_with_strategy"""
+        return await self._run('count_with_strategy', filters=filters, hooks=hooks)
+
+    async def list(self, filters=None, orders=None, offset=None, limit=None, hooks=None, fields=None):
+        """同ResourceBase.list"""
+        return await self._run('list', filters=filters, orders=orders, offset=offset, limit=limit, hooks=hooks,
+                               fields=fields)
+
+    async def list_with_count(self, filters=None, orders=None, offset=None, limit=None, hooks=None, fields=None):
+        """同ResourceBase.list_with_count"""
+        return await self._run('list_with_count', filters=filters, orders=orders, offset=offset, limit=limit,
+                               hooks=hooks, fields=fields)
+
+    async def list_by_cursor(self, filters=None, orders=None, limit=None, cursor=None, hooks=None, fields=None):
+        """同ResourceBase.list_by_cursor"""
+        return await self._run('list_by_cursor', filters=filters, orders=orders, limit=limit, cursor=cursor,
+                               hooks=hooks, fields=fields)
+
+    async def iter_list(self,
+                        filters=None,
+                        orders=None,
+                        offset=None,
+                        limit=None,
+                        hooks=None,
+                        batch_size=None,
+                        fields=None):
+        """
+        获取符合条件的记录，以异步生成器逐条返回，内部使用list_by_cursor按batch_size分批读取，
+        每批使用独立的会话，迭代期间不会一直占用数据库连接
+
+        async for ref in resource.iter_list(filters={'department_id': '1'}):
+            ...
+
+        注意：与list_by_cursor相同，排序列应为非空列；offset通过跳过记录实现
+
+        :param filters: 过滤条件
+        :type filters: dict
+        :param orders: 排序
+        :type orders: list
+        :param offset: 起始偏移量
+        :type offset: int
+        :param limit: 数量限制
+        :type limit: int
+        :param hooks: 钩子函数列表，函数形式为func(query, filters)
+        :type hooks: list
+        :param batch_size: 每批读取的记录数量，默认为CONF.dbcrud.stream_batch_size
+        :type batch_size: int
+        :param fields: 仅查询以及返回指定的属性，None则为全部，详见_apply_fields
+        :type fields: list
+        :returns: 记录异步生成器
+        :rtype: async_generator
+        """
+        offset = offset or 0
+        batch_size = batch_size or CONF.dbcrud.stream_batch_size
+        cursor = None
+        count = 0
+        while True:
+            refs, cursor = await self.list_by_cursor(filters=filters,
+                                                     orders=orders,
+                                                     limit=batch_size,
+                                                     cursor=cursor,
+                                                     hooks=hooks,
+                                                     fields=fields)
+            for ref in refs:
+                if offset > 0:
+                    offset -= 1
+                    continue
+                if limit is not None and count >= limit:
+                    return
+                count += 1
+                yield ref
+            if cursor is None:
+                return
+
+    async def get(self, rid, fields=None):
+        """同ResourceBase.get"""
+        return await self._run('get', rid, fields=fields)
+
+    async def create(self, resource, validate=True, detail=True):
+        """同ResourceBase.create"""
+        return await self._run('create', resource, validate=validate, detail=detail)
+
+    async def create_many(self, resources, validate=True, chunk_size=None):
+        """同ResourceBase.create_many"""
+        return await self._run('create_many', resources, validate=validate, chunk_size=chunk_size)
+
+    async def update(self, rid, resource, filters=None, validate=True, detail=True):
+        """同ResourceBase.update"""
+        return await self._run('update', rid, resource, filters=filters, validate=validate, detail=detail)
+
+    async def update_many(self, resources, filters=None, validate=True, chunk_size=None):
+        """同ResourceBase.update_many"""
+        return await self._run('update_many', resources, filters=filters, validate=validate, chunk_size=chunk_size)
+
+    async def delete(self, rid, filters=None, detail=True):
+        """同ResourceBase.delete"""
+        return await self._run('delete', rid, filters=filters, detail=detail)
+
+    async def delete_many(self, rids, filters=None, chunk_size=None):
+        """同ResourceBase.delete_many"""
+        return await self._run('delete_many', rids, filters=filters, chunk_size=chunk_size)
+
+    async def delete_all(self, filters=None, returning=None, batch_size=None):
+        """同ResourceBase.delete_all"""
+        return await self._run('delete_all', filters=filters, returning=returning, batch_size=batch_size)
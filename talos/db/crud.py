@@ -9,20 +9,30 @@ from __future__ import absolute_import
 import collections
 import contextlib
 import copy
+import json
 import logging
+import threading
+import time
+import uuid
 import warnings
 
 import six
 from sqlalchemy import text, and_, or_
+import sqlalchemy
+import sqlalchemy.event
 import sqlalchemy.exc
 import sqlalchemy.orm
+import sqlalchemy.orm.strategies
 
+from talos.common import cache
 from talos.core import config
 from talos.core import exceptions
 from talos.core import utils
 from talos.core.i18n import _
 from talos.db import filter_wrapper
+from talos.db import pagination
 from talos.db import pool
+from talos.db import query_plan
 from talos.db import validator
 
 if six.PY3:
@@ -31,6 +41,461 @@ CONF = config.CONF
 LOG = logging.getLogger(__name__)
 VALIDATE_ON_ALL = '*:M'
 SITUATION_ALL = '*'
+# 数量统计策略
+COUNT_EXACT = 'exact'
+COUNT_ESTIMATED = 'estimated'
+COUNT_CAPPED = 'capped'
+COUNT_CACHED = 'cached'
+# delete_all返回内容
+DELETE_RETURNING_RECORDS = 'records'
+DELETE_RETURNING_KEYS = 'keys'
+DELETE_RETURNING_NONE = 'none'
+# 动态加载方式：多对一使用joinedload，集合使用selectinload(IN分批)
+LOAD_ADAPTIVE = 'adaptive'
+# 资源类 -> 查询计划缓存
+_QUERY_PLAN_CACHES = {}
+_QUERY_PLAN_CACHES_LOCK = threading.Lock()
+_LOAD_METHODS = {
+    'joinedload': sqlalchemy.orm.joinedload,
+    'subqueryload': sqlalchemy.orm.subqueryload,
+    'selectinload': sqlalchemy.orm.selectinload,
+    'immediateload': sqlalchemy.orm.immediateload
+}
+_LEVEL_COLUMNS = {3: 'get_columns', 2: 'list_columns', 1: 'sum_columns'}
+# (model, level, load_method, detail_relationship_as_summary, fallback_raise) -> 动态加载选项
+_RELATIONSHIP_LOAD_OPTIONS = {}
+# (model, level) -> 该层级的属性名称
+_LEVEL_ATTRIBUTES = {}
+# (model, level) -> 该层级属性中的relationship名称
+_LEVEL_RELATIONSHIPS = {}
+# model -> 进程内数据版本
+_MODEL_VERSIONS = {}
+_MODEL_VERSIONS_LOCK = threading.Lock()
+# session.info中记录本事务写入过的model
+_CHANGED_MODELS = 'talos.changed_models'
+# session.info中记录本事务写入过的实体，{model: set(主键标识)}，None表示无法确定写入了哪些实体
+_CHANGED_ENTITIES = 'talos.changed_entities'
+# session.info中标记提交后推迟缓存失效，以及推迟的失效列表
+_DEFER_INVALIDATION = 'talos.defer_invalidation'
+_DEFERRED_INVALIDATIONS = 'talos.deferred_invalidations'
+# model -> 缓存数据中可能包含该model数据的model(通过relationship关联)
+_MODEL_DEPENDENTS = collections.defaultdict(set)
+_MODEL_DEPENDENCIES = set()
+# model -> 通过relationship(多级)关联的其他model
+_MODEL_RELATED = {}
+# 共享版本key -> (获取时间, 版本)，model_version_ttl内无需访问cache后端
+_SHARED_VERSIONS = {}
+# 进程内实体缓存，首次使用时创建
+_ENTITY_CACHES = []
+# model -> 启用了实体缓存的资源类
+_ENTITY_RESOURCE_CLASSES = {}
+# 写入后是否需要失效基于版本的缓存，首次写入时判断
+_VERSION_INVALIDATION = []
+
+
+def setup_selectin_batch_size(batch_size=None):
+    '''
+    设置selectinload每条IN语句包含的主键数量，由initialize_db在加载配置后调用一次
+
+    注意：SQLAlchemy未提供公开的设置接口，此处修改的是SelectInLoader的类属性，
+    对进程内所有selectinload(包括非talos发起的查询)生效；SQLAlchemy版本不支持时保持其默认值
+
+    :param batch_size: 数量，None则使用CONF.dbcrud.selectin_batch_size
+    :type batch_size: int
+    :returns: 是否设置成功
+    :rtype: bool
+    '''
+    if batch_size is None:
+        batch_size = CONF.dbcrud.selectin_batch_size
+    loader = sqlalchemy.orm.strategies.SelectInLoader
+    if not batch_size:
+        return False
+    if not isinstance(loader.__dict__.get('_chunksize'), six.integer_types):
+        LOG.warning('selectin_batch_size is not supported by SQLAlchemy %s, ignored', sqlalchemy.__version__)
+        return False
+    loader._chunksize = batch_size
+    return True
+
+
+def _clear_relationship_load_options():
+    _RELATIONSHIP_LOAD_OPTIONS.clear()
+    _LEVEL_ATTRIBUTES.clear()
+    _LEVEL_RELATIONSHIPS.clear()
+    _MODEL_DEPENDENCIES.clear()
+    _ENTITY_RESOURCE_CLASSES.clear()
+
+
+def _subclasses(cls):
+    pending = [cls]
+    while pending:
+        current = pending.pop()
+        pending.extend(current.__subclasses__())
+        yield current
+
+
+def _detect_version_caches():
+    # 避免循环导入
+    from talos.common import controller
+    if CONF.controller.response_cache or CONF.dbcrud.entity_cache or CONF.dbcrud.count_strategy == COUNT_CACHED:
+        return True
+    for cls in _subclasses(ResourceBase):
+        if cls._entity_cache or cls._count_strategy == COUNT_CACHED:
+            return True
+    for cls in _subclasses(controller.Controller):
+        if cls.response_cache:
+            return True
+    return False
+
+
+def _version_invalidation_enabled():
+    '''
+    写入提交后是否需要变更数据版本以及失效实体缓存，每次写入均会访问cache后端，因此仅在需要时进行
+
+    CONF.dbcrud.cache_invalidation为None时自动判断：启用了响应缓存、实体缓存或cached统计策略
+    (全局配置或任一控制器/资源类)，或者本进程使用过model_version/entity_version；
+    仅写入而不读取缓存的进程(如独立的worker)与读取缓存的进程配置不同时，需设置为True
+
+    :rtype: bool
+    '''
+    setting = CONF.dbcrud.cache_invalidation
+    if setting is not None:
+        return bool(setting)
+    if not _VERSION_INVALIDATION:
+        _VERSION_INVALIDATION.append(_detect_version_caches())
+    return _VERSION_INVALIDATION[0]
+
+
+def _use_version_invalidation():
+    if _VERSION_INVALIDATION != [True]:
+        _VERSION_INVALIDATION[:] = [True]
+
+
+def _level_attributes(orm_meta, level):
+    '''
+    获取model指定层级的属性名称
+
+    :param orm_meta: model类
+    :type orm_meta: model
+    :param level: 属性层级，3：detail级，2：list级，1：summary级
+    :type level: int
+    :rtype: tuple
+    '''
+    key = (orm_meta, level)
+    names = _LEVEL_ATTRIBUTES.get(key)
+    if names is None:
+        names = tuple(getattr(orm_meta(), _LEVEL_COLUMNS[level])())
+        _LEVEL_ATTRIBUTES[key] = names
+    return names
+
+
+def _level_relationships(orm_meta, level):
+    '''
+    获取model指定层级属性中包含的relationship名称
+
+    :param orm_meta: model类
+    :type orm_meta: model
+    :param level: 属性层级，3：detail级，2：list级，1：summary级
+    :type level: int
+    :rtype: frozenset
+    '''
+    key = (orm_meta, level)
+    names = _LEVEL_RELATIONSHIPS.get(key)
+    if names is None:
+        mapper = sqlalchemy.inspect(orm_meta)
+        names = frozenset(_level_attributes(orm_meta, level)) & frozenset(mapper.relationships.keys())
+        _LEVEL_RELATIONSHIPS[key] = names
+    return names
+
+
+def _window_function_supported(dialect):
+    '''
+    数据库是否支持窗口函数(COUNT(*) OVER ())
+
+    :param dialect: 数据库方言
+    :type dialect: `sqlalchemy.engine.interfaces.Dialect`
+    :rtype: bool
+    '''
+    if dialect.name in ('postgresql', 'oracle', 'mssql'):
+        return True
+    if dialect.name == 'sqlite':
+        version = getattr(dialect.dbapi, 'sqlite_version_info', None) or (0, )
+        return version >= (3, 25, 0)
+    if dialect.name == 'mysql':
+        version = dialect.server_version_info or (0, )
+        if getattr(dialect, '_is_mariadb', False):
+            return version >= (10, 2)
+        return version >= (8, 0)
+    return False
+
+
+def _estimate_count_postgresql(connection, compiled, params):
+    row = connection.execute('EXPLAIN (FORMAT JSON) %s' % compiled, params).fetchone()
+    plan = json.loads(row[0]) if utils.is_string_type(row[0]) else row[0]
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def _estimate_count_mysql(connection, compiled, params):
+    row = connection.execute('EXPLAIN %s' % compiled, params).fetchone()
+    # EXPLAIN的输出列因版本而异(如MariaDB/低版本MySQL无filtered列)
+    row = dict(row.items()) if row is not None else {}
+    if row.get('rows') is None:
+        return None
+    filtered = row.get('filtered')
+    return int(row['rows'] * float(filtered if filtered is not None else 100) / 100)
+
+
+# 数据库方言 -> 估算函数func(connection, compiled, params)，返回None表示无法估算
+_COUNT_ESTIMATORS = {
+    'postgresql': _estimate_count_postgresql,
+    'mysql': _estimate_count_mysql,
+}
+
+
+def _estimate_count(session, query):
+    '''
+    根据数据库执行计划估算查询结果数量
+
+    :param session: session对象
+    :type session: session/scoped_session
+    :param query: 查询对象
+    :type query: query
+    :returns: 估算数量，数据库不支持或估算失败时返回None
+    :rtype: int
+    '''
+    dialect = session.get_bind().dialect
+    estimator = _COUNT_ESTIMATORS.get(dialect.name)
+    if estimator is None:
+        return None
+    compiled = query.statement.compile(dialect=dialect)
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+    try:
+        return estimator(session.connection(), compiled, params)
+    except (sqlalchemy.exc.SQLAlchemyError, LookupError, TypeError, ValueError) as e:
+        LOG.warning('failed to estimate count, fallback to exact count, reason: %s', e)
+        return None
+
+
+def _delete_returning_supported(dialect):
+    '''
+    数据库是否支持DELETE ... RETURNING
+
+    :param dialect: 数据库方言
+    :type dialect: `sqlalchemy.engine.interfaces.Dialect`
+    :rtype: bool
+    '''
+    return dialect.name == 'postgresql' and dialect.implicit_returning
+
+
+def _model_version_key(orm_meta):
+    return 'talos.version:%s.%s' % (orm_meta.__module__, orm_meta.__name__)
+
+
+def _data_version_key(orm_meta):
+    # 仅随model自身的写入变更，不包含关联model
+    return 'talos.data_version:%s.%s' % (orm_meta.__module__, orm_meta.__name__)
+
+
+def _entity_generation_key(orm_meta):
+    return 'talos.entity_generation:%s.%s' % (orm_meta.__module__, orm_meta.__name__)
+
+
+def _shared_version(key):
+    '''
+    获取共享缓存中的版本，进程内缓存CONF.dbcrud.model_version_ttl秒，
+    因此其他进程的变更最多延迟model_version_ttl秒可见，本进程的变更立即可见
+    '''
+    now = time.time()
+    entry = _SHARED_VERSIONS.get(key)
+    if entry is not None and now - entry[0] <= CONF.dbcrud.model_version_ttl:
+        return entry[1]
+    # 版本不可过期，否则可能回退为旧版本
+    version = cache.get(key, ignore_expiration=True)
+    if not cache.validate(version):
+        version = uuid.uuid4().hex
+        cache.set(key, version)
+    _SHARED_VERSIONS[key] = (now, version)
+    return version
+
+
+def _bump_shared_version(key):
+    version = uuid.uuid4().hex
+    _SHARED_VERSIONS[key] = (time.time(), version)
+    cache.set(key, version)
+
+
+def model_version(orm_meta):
+    '''
+    获取model的数据版本，由进程内版本以及共享缓存中的版本组成，
+    通过ResourceBase写入(create/update/delete等)并提交后版本会发生变化，可用于构造缓存key
+
+    :param orm_meta: model类
+    :type orm_meta: model
+    :returns: 版本
+    :rtype: str
+    '''
+    _use_version_invalidation()
+    _register_model_dependencies(orm_meta)
+    shared = _shared_version(_model_version_key(orm_meta))
+    return '%s.%s' % (_MODEL_VERSIONS.get(orm_meta, 0), shared)
+
+
+def entity_version(orm_meta):
+    '''
+    获取model实体缓存的版本，由实体代数以及relationship关联model的数据版本组成，
+    model自身的写入按主键失效对应的实体缓存，不会变更此版本
+
+    :param orm_meta: model类
+    :type orm_meta: model
+    :returns: 版本
+    :rtype: str
+    '''
+    _use_version_invalidation()
+    _register_model_dependencies(orm_meta)
+    versions = [_shared_version(_entity_generation_key(orm_meta))]
+    versions.extend([_shared_version(_data_version_key(model)) for model in _MODEL_RELATED[orm_meta]])
+    return '.'.join(versions)
+
+
+def _register_model_dependencies(orm_meta):
+    '''
+    记录orm_meta通过relationship(多级)关联的model，这些model变更时，orm_meta的数据版本也随之变更
+    '''
+    if orm_meta in _MODEL_DEPENDENCIES:
+        return
+    with _MODEL_VERSIONS_LOCK:
+        pending = [orm_meta]
+        visited = set()
+        while pending:
+            current = pending.pop()
+            if current in visited:
+                continue
+            visited.add(current)
+            for prop in sqlalchemy.inspect(current).relationships:
+                target = prop.mapper.class_
+                if target is not orm_meta:
+                    _MODEL_DEPENDENTS[target].add(orm_meta)
+                pending.append(target)
+        visited.discard(orm_meta)
+        _MODEL_RELATED[orm_meta] = sorted(visited, key=lambda model: (model.__module__, model.__name__))
+        _MODEL_DEPENDENCIES.add(orm_meta)
+
+
+def invalidate_model(orm_meta):
+    '''
+    变更model(以及关联了此model的model)的数据版本，使基于版本的缓存失效(本进程以及使用同一缓存后端的其他进程)
+
+    :param orm_meta: model类
+    :type orm_meta: model
+    '''
+    models = [orm_meta]
+    models.extend(_MODEL_DEPENDENTS.get(orm_meta, ()))
+    with _MODEL_VERSIONS_LOCK:
+        for model in models:
+            _MODEL_VERSIONS[model] = _MODEL_VERSIONS.get(model, 0) + 1
+    try:
+        _bump_shared_version(_data_version_key(orm_meta))
+        for model in models:
+            _bump_shared_version(_model_version_key(model))
+    except Exception as e:
+        LOG.warning('failed to update shared version of %s, reason: %s', orm_meta.__name__, e)
+
+
+def _entity_resource_classes(orm_meta):
+    '''
+    获取启用了实体缓存且orm_meta为指定model的资源类，每个model仅查找一次，mapper重新configure时重新查找
+    '''
+    classes = _ENTITY_RESOURCE_CLASSES.get(orm_meta)
+    if classes is None:
+        classes = []
+        for current in _subclasses(ResourceBase):
+            enabled = current._entity_cache if current._entity_cache is not None else CONF.dbcrud.entity_cache
+            if current.orm_meta is orm_meta and enabled:
+                classes.append(current)
+        _ENTITY_RESOURCE_CLASSES[orm_meta] = classes
+    return classes
+
+
+def invalidate_entities(orm_meta, idents=None):
+    '''
+    失效model的实体缓存(本进程以及使用同一cache后端的其他进程)
+
+    :param orm_meta: model类
+    :type orm_meta: model
+    :param idents: 主键标识列表(详见ResourceBase._primary_key_ident)，None则失效该model的全部实体缓存
+    :type idents: list
+    '''
+    try:
+        if idents is None:
+            _bump_shared_version(_entity_generation_key(orm_meta))
+            return
+        keys = [cls._entity_cache_ident_key(ident) for cls in _entity_resource_classes(orm_meta) for ident in idents]
+        if keys:
+            local = _entity_cache()
+            for key in keys:
+                local.delete(key)
+            cache.delete_multi(keys)
+    except Exception as e:
+        LOG.warning('failed to invalidate entity cache of %s, reason: %s', orm_meta.__name__, e)
+
+
+def _entity_cache():
+    if not _ENTITY_CACHES:
+        with _MODEL_VERSIONS_LOCK:
+            if not _ENTITY_CACHES:
+                _ENTITY_CACHES.append(utils.LRUCache(maxsize=CONF.dbcrud.entity_cache_size))
+    return _ENTITY_CACHES[0]
+
+
+def _invalidate_changes(models, entities):
+    for orm_meta in models:
+        invalidate_model(orm_meta)
+    for orm_meta, idents in entities.items():
+        invalidate_entities(orm_meta, idents)
+
+
+def _invalidate_changed_models(session):
+    models = session.info.pop(_CHANGED_MODELS, ())
+    entities = session.info.pop(_CHANGED_ENTITIES, {})
+    if session.info.get(_DEFER_INVALIDATION):
+        session.info.setdefault(_DEFERRED_INVALIDATIONS, []).append((models, entities))
+        return
+    _invalidate_changes(models, entities)
+
+
+def _discard_changed_models(session):
+    session.info.pop(_CHANGED_MODELS, None)
+    session.info.pop(_CHANGED_ENTITIES, None)
+
+
+def defer_invalidation(session):
+    '''
+    标记session提交后不立即失效缓存(model_version、实体缓存)，由调用者在合适的时机调用flush_deferred_invalidation，
+    如异步会话中在线程池执行，避免在事件循环中访问cache后端
+
+    :param session: 会话对象
+    :type session: session
+    '''
+    session.info[_DEFER_INVALIDATION] = True
+
+
+def flush_deferred_invalidation(session):
+    '''
+    执行session已提交事务中推迟的缓存失效
+
+    :param session: 会话对象
+    :type session: session
+    '''
+    for models, entities in session.info.pop(_DEFERRED_INVALIDATIONS, ()):
+        _invalidate_changes(models, entities)
+
+
+# mapper重新configure时(如新增model)，relationship可能已发生变化
+sqlalchemy.event.listen(sqlalchemy.orm.Mapper, 'after_configured', _clear_relationship_load_options)
+# 事务提交后才变更数据版本，避免其他请求在提交前缓存旧数据
+sqlalchemy.event.listen(sqlalchemy.orm.Session, 'after_commit', _invalidate_changed_models)
+sqlalchemy.event.listen(sqlalchemy.orm.Session, 'after_rollback', _discard_changed_models)
 
 
 class ColumnValidator(object):
@@ -287,10 +752,29 @@ class ResourceBase(object):
     # 启用动态外键加载策略时，动态加载外键的方式，默认joinedload（取决于全局配置）
     # joinedload 简便，在常用小型查询中响应优于subqueryload
     # subqueryload 在大型复杂(多层外键)查询中响应优于joinedload
+    # adaptive 多对一使用joinedload，集合使用selectinload(按CONF.dbcrud.selectin_batch_size分批IN查询)，
+    #          避免多层集合join导致的笛卡尔积结果集，以及subqueryload每层重复执行父查询
     _dynamic_load_method = None
     # get获取信息时，默认根据detail->list->summary层级依次进行取值(取决于全局配置)
     # 如果希望本资源get获取到的第一层级外键是summary级，则设置为True
     _detail_relationship_as_summary = None
+    # 是否启用查询计划缓存(取决于全局配置)，启用后形态相同(过滤字段/操作符/值类型、排序、加载层级)的查询
+    # 会复用已构建的query对象，仅重新绑定过滤值，注意：启用后_apply_filters对每种形态只会调用一次
+    _query_plan_cache = None
+    # 数量统计策略(取决于全局配置)，exact/estimated/capped/cached，详见count_with_strategy
+    _count_strategy = None
+    # capped策略的统计上限，estimated策略估算值低于此值时改为精确统计(取决于全局配置)
+    _count_cap = None
+    # cached策略的缓存时间(秒)(取决于全局配置)
+    _count_cache_expires = None
+    # delete_all的返回内容(取决于全局配置)，records：删除的记录；keys：仅主键；none：不返回记录
+    # 重写了_addtional_delete_all时始终为records
+    _delete_all_returning = None
+    # 是否启用get的实体缓存(取决于全局配置)，缓存detail字典于进程内LRU以及cache配置的后端，
+    # 缓存key包含model的数据版本，通过ResourceBase写入该model(或其关联model)并提交后自动失效
+    _entity_cache = None
+    # 实体缓存时间(秒)(取决于全局配置)
+    _entity_cache_expires = None
     # 当发生数据库异常时，是否抛出带有数据库细节的异常信息，默认False
     # False仅返回数据冲突错误，True可能会暴露数据库表名，字段，约束等细节内容
     _db_exception_detail = False
@@ -327,6 +811,13 @@ class ResourceBase(object):
         load_methods = [dynamic_load_method, self._dynamic_load_method, CONF.dbcrud.dynamic_load_method]
         self._dynamic_load_method = _first_not_none(load_methods)
         self._detail_relationship_as_summary = CONF.dbcrud.detail_relationship_as_summary if self._detail_relationship_as_summary is None else self._detail_relationship_as_summary
+        self._query_plan_cache = _first_not_none([self._query_plan_cache, CONF.dbcrud.query_plan_cache])
+        self._count_strategy = _first_not_none([self._count_strategy, CONF.dbcrud.count_strategy])
+        self._count_cap = _first_not_none([self._count_cap, CONF.dbcrud.count_cap])
+        self._count_cache_expires = _first_not_none([self._count_cache_expires, CONF.dbcrud.count_cache_expires])
+        self._delete_all_returning = _first_not_none([self._delete_all_returning, CONF.dbcrud.delete_all_returning])
+        self._entity_cache = _first_not_none([self._entity_cache, CONF.dbcrud.entity_cache])
+        self._entity_cache_expires = _first_not_none([self._entity_cache_expires, CONF.dbcrud.entity_cache_expires])
         self._session = session
         self._transaction = transaction
 
@@ -340,17 +831,10 @@ class ResourceBase(object):
     def _get_filter_handler(self, name):
         return filter_wrapper.get_filter(name.lower())
 
-    def _apply_filters(self, query, orm_meta, filters=None, orders=None):
-        def _extract_column_visit_name(column):
-            '''
-            获取列名称
-            :param column: 列对象
-            :type column: `ColumnAttribute`
-            '''
-            col_type = getattr(column, 'type', None)
-            if col_type:
-                return getattr(col_type, '__visit_name__', None)
-            return None
+    def _apply_filters(self, query, orm_meta, filters=None, orders=None, binder=None):
+        # 过滤器解析结果已缓存，仅当子类重写了_get_filter_handler时才需要重新获取
+        custom_handler = six.get_unbound_function(type(self)._get_filter_handler) is not \
+            six.get_unbound_function(ResourceBase._get_filter_handler)
 
         def _handle_filter(expr_wrapper, handler, op, column, value):
             '''
@@ -391,7 +875,7 @@ class ResourceBase(object):
                 if name in reserved_keys:
                     _unsupported, expr = _get_key_expression(table, name, value)
                 else:
-                    expr_wrapper, column = filter_wrapper.relationship_from_expression(table, name)
+                    expr_wrapper, column = filter_wrapper.resolve_relationship(table, name)
                     if column:
                         _unsupported, expr = _get_expression(column.property.mapper.class_, value)
                         if expr is not None:
@@ -439,13 +923,16 @@ class ResourceBase(object):
             :param value:
             :type value:
             '''
-            expr_wrapper, column = filter_wrapper.column_from_expression(table, name)
+            expr_wrapper, column, handler = filter_wrapper.resolve_column(table, name)
             unsupported = []
             expressions = []
             if column is not None:
-                handler = self._get_filter_handler(_extract_column_visit_name(column))
+                if custom_handler:
+                    handler = self._get_filter_handler(filter_wrapper.column_visit_name(column))
                 if isinstance(value, collections.Mapping):
                     for operator, value in value.items():
+                        if binder is not None:
+                            value = binder.bind(handler, operator, column, value)
                         expr = _handle_filter(expr_wrapper, handler, operator, column, value)
                         if expr is not None:
                             expressions.append(expr)
@@ -453,6 +940,8 @@ class ResourceBase(object):
                             unsupported.append((name, operator, value))
                 else:
                     # op is None
+                    if binder is not None:
+                        value = binder.bind(handler, None, column, value)
                     expr = _handle_filter(expr_wrapper, handler, None, column, value)
                     if expr is not None:
                         expressions.append(expr)
@@ -471,6 +960,9 @@ class ResourceBase(object):
         filters = filters or {}
         if filters:
             unsupported, expression = _get_expression(orm_meta, filters)
+            # _unsupported_filter可能依赖于过滤值，无法参数化
+            if unsupported and binder is not None:
+                raise query_plan.Unbindable()
             if expression is not None:
                 query = query.filter(expression)
             for idx, error_filter in enumerate(unsupported):
@@ -486,7 +978,7 @@ class ResourceBase(object):
                 elif field.startswith('-'):
                     order = '-'
                     field = field[1:]
-                expr_wrapper, column = filter_wrapper.column_from_expression(orm_meta, field)
+                expr_wrapper, column, handler = filter_wrapper.resolve_column(orm_meta, field)
                 # 不支持relationship排序
                 if column is not None and expr_wrapper is None:
                     if order == '+':
@@ -531,67 +1023,94 @@ class ResourceBase(object):
         :param fallback_raise: 没有在attributes中指定时，默认使用raiseload，False则使用lazyload
         :type fallback_raise: bool
         '''
-        level = max(level, 1)
         orm_meta = orm_meta or self.orm_meta
-        relationship_cols = orm_meta().list_relationship_columns()
-        load_method_map = {
-            'joinedload': sqlalchemy.orm.joinedload,
-            'subqueryload': sqlalchemy.orm.subqueryload,
-            'selectinload': sqlalchemy.orm.selectinload,
-            'immediateload': sqlalchemy.orm.immediateload
-        }
-        level_map = {3: 'get_columns', 2: 'list_columns', 1: 'sum_columns'}
-        attributes = getattr(orm_meta(), level_map[level], None)()
-        if relationship_cols:
-            for rel_col_name in relationship_cols:
-                col = getattr(orm_meta, rel_col_name)
-                if rel_col_name in attributes:
-                    # FIXME: (wujj)remove this, debug msg
-                    load_msg = 'dynamic relationship eager load: '
-                    load_msg += '%s->' % self.__class__.__name__
-                    if parent:
-                        for p in parent.path:
-                            load_msg += '%s->' % p.property.key
-                    load_msg += '%s' % col.property.key
-                    LOG.debug(load_msg)
-                    parent_next = None
-                    if parent:
-                        load_method_obj = getattr(parent, self._dynamic_load_method)
-                        parent_next = load_method_obj(col)
-                        query = query.options(parent_next)
-                    else:
-                        parent_next = load_method_map[self._dynamic_load_method](col)
-                        query = query.options(parent_next)
-                    # 当要按照detail级取信息时，需要根据用户指定的detail_relationship_as_summary信息进行动态判定
-                    if level == 3 and parent is None and self._detail_relationship_as_summary:
-                        next_level = 1
+        if parent is None:
+            options = self._relationship_load_options(orm_meta, level=level, fallback_raise=fallback_raise)
+        else:
+            options = self._make_relationship_load_options(orm_meta, level, parent, fallback_raise)
+        if options:
+            query = query.options(*options)
+        return query
+
+    def _relationship_load_options(self, orm_meta, level=2, fallback_raise=True):
+        '''
+        获取orm_meta的动态加载选项，选项仅取决于model、层级、加载方式以及detail_relationship_as_summary，
+        因此每种组合只构建一次，当mapper重新configure时缓存失效
+
+        :returns: 可直接应用于query.options的加载选项
+        :rtype: tuple
+        '''
+        key = (orm_meta, max(level, 1), self._dynamic_load_method, bool(self._detail_relationship_as_summary),
+               fallback_raise)
+        options = _RELATIONSHIP_LOAD_OPTIONS.get(key)
+        if options is None:
+            options = tuple(self._make_relationship_load_options(orm_meta, level, None, fallback_raise))
+            _RELATIONSHIP_LOAD_OPTIONS[key] = options
+        return options
+
+    def _relationship_load_method(self, col):
+        '''
+        获取relationship的动态加载方式，adaptive模式下根据relationship类型选择
+
+        :param col: relationship属性
+        :type col: InstrumentedAttribute
+        :returns: 加载方式名称
+        :rtype: str
+        '''
+        if self._dynamic_load_method == LOAD_ADAPTIVE:
+            return 'selectinload' if col.property.uselist else 'joinedload'
+        return self._dynamic_load_method
+
+    def _make_relationship_load_options(self, orm_meta, level, parent, fallback_raise):
+        level = max(level, 1)
+        meta = orm_meta()
+        relationship_cols = meta.list_relationship_columns()
+        options = []
+        if not relationship_cols:
+            return options
+        attributes = getattr(meta, _LEVEL_COLUMNS[level])()
+        debug = LOG.isEnabledFor(logging.DEBUG)
+        for rel_col_name in relationship_cols:
+            col = getattr(orm_meta, rel_col_name)
+            if rel_col_name in attributes:
+                if debug:
+                    LOG.debug(self._relationship_load_msg('dynamic relationship eager load: ', parent, col))
+                load_method = self._relationship_load_method(col)
+                if parent:
+                    parent_next = getattr(parent, load_method)(col)
+                else:
+                    parent_next = _LOAD_METHODS[load_method](col)
+                options.append(parent_next)
+                # 当要按照detail级取信息时，需要根据用户指定的detail_relationship_as_summary信息进行动态判定
+                if level == 3 and parent is None and self._detail_relationship_as_summary:
+                    next_level = 1
+                else:
+                    next_level = level - 1
+                options.extend(
+                    self._make_relationship_load_options(col.property.entity.entity, next_level, parent_next,
+                                                         fallback_raise))
+            else:
+                if debug:
+                    LOG.debug(self._relationship_load_msg('dynamic relationship raise load: ', parent, col))
+                if parent:
+                    if fallback_raise:
+                        options.append(parent.raiseload(col))
                     else:
-                        next_level = level - 1
-                    query = self._dynamic_relationship_load(query,
-                                                            orm_meta=col.property.entity.entity,
-                                                            level=next_level,
-                                                            parent=parent_next,
-                                                            fallback_raise=fallback_raise)
+                        options.append(parent.lazyload(col))
                 else:
-                    # FIXME: (wujj)remove this, debug msg
-                    load_msg = 'dynamic relationship raise load: '
-                    load_msg += '%s->' % self.__class__.__name__
-                    if parent:
-                        for p in parent.path:
-                            load_msg += '%s->' % p.property.key
-                    load_msg += '%s' % col.property.key
-                    LOG.debug(load_msg)
-                    if parent:
-                        if fallback_raise:
-                            query = query.options(parent.raiseload(col))
-                        else:
-                            query = query.options(parent.lazyload(col))
+                    if fallback_raise:
+                        options.append(sqlalchemy.orm.raiseload(col))
                     else:
-                        if fallback_raise:
-                            query = query.options(sqlalchemy.orm.raiseload(col))
-                        else:
-                            query = query.options(sqlalchemy.orm.lazyload(col))
-        return query
+                        options.append(sqlalchemy.orm.lazyload(col))
+        return options
+
+    def _relationship_load_msg(self, msg, parent, col):
+        msg += '%s->' % self.__class__.__name__
+        if parent:
+            for p in parent.path:
+                msg += '%s->' % p.property.key
+        msg += '%s' % col.property.key
+        return msg
 
     def _get_query(self,
                    session,
@@ -643,6 +1162,15 @@ class ResourceBase(object):
         if orm_meta is None:
             raise exceptions.CriticalError(
                 msg=utils.format_kwstring(_('%(name)s.orm_meta can not be None'), name=self.__class__.__name__))
+        do_dynamic_relationship = self._dynamic_relationship if dynamic_relationship is None else dynamic_relationship
+        # 动态join条件无法确定形态，不使用查询计划；
+        # 重写了_apply_filters的资源类(可能不接受binder参数，或过滤逻辑无法参数化)同样不使用查询计划
+        if self._query_plan_cache and len(ex_tables) == 0 and six.get_unbound_function(
+                type(self)._apply_filters) is six.get_unbound_function(ResourceBase._apply_filters):
+            query = self._get_planned_query(session, orm_meta, filters, orders, ignore_default,
+                                            do_dynamic_relationship, level_of_relationship)
+            if query is not None:
+                return query
         query = session.query(*tables)
         if len(ex_tables) > 0:
             for item in joins:
@@ -652,15 +1180,91 @@ class ResourceBase(object):
                 else:
                     spec_args.extend(item['conditions'])
                 query = query.join(*spec_args, isouter=item.get('isouter', True))
-        query = self._apply_filters(query, orm_meta, filters, orders)
+        return self._build_query(query, orm_meta, filters, orders, ignore_default, do_dynamic_relationship,
+                                 level_of_relationship)
+
+    def _build_query(self,
+                     query,
+                     orm_meta,
+                     filters,
+                     orders,
+                     ignore_default,
+                     dynamic_relationship,
+                     level_of_relationship,
+                     binder=None,
+                     default_filter=None):
+        """在query对象上应用过滤、排序、默认过滤以及动态外键加载"""
+        if binder is None:
+            query = self._apply_filters(query, orm_meta, filters, orders)
+        else:
+            query = self._apply_filters(query, orm_meta, filters, orders, binder=binder)
         # 如果不是忽略default模式，default_filter必须进行过滤
         if not ignore_default:
-            query = self._apply_filters(query, orm_meta, self.default_filter)
-        do_dynamic_relationship = self._dynamic_relationship if dynamic_relationship is None else dynamic_relationship
-        if do_dynamic_relationship:
+            if binder is None:
+                query = self._apply_filters(query, orm_meta, self.default_filter)
+            else:
+                # 查询计划中default_filter同样参数化，避免按请求变化的default_filter(如租户隔离)复用其他请求的值
+                query = self._apply_filters(query, orm_meta, default_filter, binder=binder)
+        if dynamic_relationship:
             query = self._dynamic_relationship_load(query, orm_meta=orm_meta, level=level_of_relationship)
         return query
 
+    @classmethod
+    def query_plan_cache(cls):
+        """
+        获取本资源类的查询计划缓存
+
+        :returns: 查询计划缓存，可通过stats()获取命中/未命中统计
+        :rtype: `talos.core.utils.LRUCache`
+        """
+        cache = _QUERY_PLAN_CACHES.get(cls)
+        if cache is None:
+            with _QUERY_PLAN_CACHES_LOCK:
+                cache = _QUERY_PLAN_CACHES.get(cls)
+                if cache is None:
+                    cache = utils.LRUCache(CONF.dbcrud.query_plan_cache_size)
+                    _QUERY_PLAN_CACHES[cls] = cache
+        return cache
+
+    def _get_planned_query(self, session, orm_meta, filters, orders, ignore_default, dynamic_relationship,
+                           level_of_relationship):
+        """
+        从查询计划缓存获取query对象，未命中时构建并缓存查询计划
+
+        :returns: 已绑定过滤值的query对象，当此形态的过滤条件无法参数化时返回None
+        :rtype: query/None
+        """
+        shape, marked_filters, values = query_plan.extract(filters)
+        default_shape, marked_default, default_values = None, None, []
+        if not ignore_default:
+            default_shape, marked_default, default_values = query_plan.extract(self.default_filter,
+                                                                               offset=len(values))
+        values = values + default_values
+        key = query_plan.make_key(orm_meta, shape, default_shape, orders, ignore_default, dynamic_relationship,
+                                  level_of_relationship, self._dynamic_load_method,
+                                  self._detail_relationship_as_summary)
+        cache = self.query_plan_cache()
+        plan = cache.get(key)
+        if plan is None:
+            binder = query_plan.Binder()
+            try:
+                query = self._build_query(sqlalchemy.orm.Query([orm_meta]),
+                                          orm_meta,
+                                          marked_filters,
+                                          orders,
+                                          ignore_default,
+                                          dynamic_relationship,
+                                          level_of_relationship,
+                                          binder=binder,
+                                          default_filter=marked_default)
+                plan = query_plan.QueryPlan(query, binder.slots)
+            except query_plan.Unbindable:
+                plan = query_plan.UNCACHEABLE
+            cache.set(key, plan)
+        if plan is query_plan.UNCACHEABLE:
+            return None
+        return plan.bind(session, values)
+
     def _apply_primary_key_filter(self, query, rid):
         keys = self.primary_keys
         if utils.is_list_type(keys) and utils.is_list_type(rid):
@@ -809,15 +1413,37 @@ class ResourceBase(object):
                 new_data[field_name] = field_value
         return new_data
 
+    def _mark_changed(self, session, rids=None):
+        """
+        标记本事务写入了orm_meta，事务提交后变更其数据版本(详见model_version)，并失效写入实体的缓存
+
+        :param session: 会话对象
+        :type session: session
+        :param rids: 写入的资源主键列表，None表示无法确定，此时失效orm_meta的全部实体缓存
+        :type rids: list
+        """
+        if not _version_invalidation_enabled():
+            return
+        session.info.setdefault(_CHANGED_MODELS, set()).add(self.orm_meta)
+        changed = session.info.setdefault(_CHANGED_ENTITIES, {})
+        if rids is None:
+            changed[self.orm_meta] = None
+        elif changed.get(self.orm_meta, ()) is not None:
+            changed.setdefault(self.orm_meta, set()).update(
+                [self._primary_key_ident(self._primary_key_value(rid)) for rid in rids])
+
     @contextlib.contextmanager
-    def get_session(self):
+    def get_session(self, readonly=False):
         """
         会话管理上下文, 如果资源初始化时指定使用外部会话，则返回的也是外部会话对象
+
+        :param readonly: 是否只读，连接池配置了从库(replicas)时，只读会话由连接池路由到从库
+        :type readonly: bool
         """
         if self._session is None and self._transaction is None:
             try:
                 old_session = self._session
-                session = self._pool.get_session()
+                session = self._pool.get_session(readonly=True) if readonly else self._pool.get_session()
                 self._session = session
                 yield session
             finally:
@@ -848,26 +1474,74 @@ class ResourceBase(object):
         :rtype: int
         """
         offset = offset or 0
-        with self.get_session() as session:
-            query = self._get_query(session,
-                                    filters=filters,
-                                    orders=[],
-                                    ignore_default_orders=True,
-                                    dynamic_relationship=False)
-            if hooks:
-                for h in hooks:
-                    query = h(query, filters)
-            query = self._addtional_count(query, filters=filters)
+        with self.get_session(readonly=True) as session:
+            query = self._get_count_query(session, filters=filters, hooks=hooks)
             if offset:
                 query = query.offset(offset)
             if limit is not None:
                 query = query.limit(limit)
             return query.count()
 
+    def _get_count_query(self, session, filters=None, hooks=None):
+        query = self._get_query(session,
+                                filters=filters,
+                                orders=[],
+                                ignore_default_orders=True,
+                                dynamic_relationship=False)
+        if hooks:
+            for h in hooks:
+                query = h(query, filters)
+        return self._addtional_count(query, filters=filters)
+
+    def _count_cache_key(self, filters):
+        # default_filter可能按实例变化(如租户隔离)，model_version使写入后缓存失效
+        data = [filters or {}, self.default_filter]
+        return 'talos.count:%s.%s:%s:%s' % (type(self).__module__, type(self).__name__,
+                                             model_version(self.orm_meta),
+                                             json.dumps(data, sort_keys=True, cls=utils.ComplexEncoder))
+
+    def count_with_strategy(self, filters=None, hooks=None):
+        """
+        根据资源的统计策略(_count_strategy)获取符合条件的记录数量
+
+        * exact: 精确统计，同count
+        * estimated: 根据数据库执行计划估算(PostgreSQL/MySQL)，数据库不支持或估算值低于_count_cap时精确统计
+        * capped: 最多统计_count_cap条记录，超出时返回_count_cap
+        * cached: 精确统计，并以过滤条件、default_filter以及model数据版本为键缓存_count_cache_expires秒
+          (使用talos.common.cache)，写入后自动失效；由于缓存键不包含hooks，指定hooks时不使用缓存
+
+        :param filters: 过滤条件
+        :type filters: dict
+        :param hooks: 钩子函数列表，函数形式为func(query, filters)
+        :type hooks: list
+        :returns: (数量, 实际使用的策略)，如capped策略未达上限时实际为exact
+        :rtype: tuple
+        """
+        strategy = self._count_strategy
+        if strategy == COUNT_CACHED and not hooks:
+            value = cache.get_or_create(self._count_cache_key(filters),
+                                        lambda: self.count(filters),
+                                        expires=self._count_cache_expires)
+            return value, COUNT_CACHED
+        if strategy == COUNT_CAPPED:
+            with self.get_session(readonly=True) as session:
+                query = self._get_count_query(session, filters=filters, hooks=hooks)
+                count = query.limit(self._count_cap + 1).count()
+            if count > self._count_cap:
+                return self._count_cap, COUNT_CAPPED
+            return count, COUNT_EXACT
+        if strategy == COUNT_ESTIMATED:
+            with self.get_session(readonly=True) as session:
+                query = self._get_count_query(session, filters=filters, hooks=hooks)
+                count = _estimate_count(session, query)
+            if count is not None and count >= self._count_cap:
+                return count, COUNT_ESTIMATED
+        return self.count(filters, hooks=hooks), COUNT_EXACT
+
     def _addtional_list(self, query, filters):
         return query
 
-    def list(self, filters=None, orders=None, offset=None, limit=None, hooks=None):
+    def list(self, filters=None, orders=None, offset=None, limit=None, hooks=None, fields=None):
         """
         获取符合条件的记录
 
@@ -881,12 +1555,15 @@ class ResourceBase(object):
         :type limit: int
         :param hooks: 钩子函数列表，函数形式为func(query, filters)
         :type hooks: list
+        :param fields: 仅查询以及返回指定的属性，None则为全部，详见_apply_fields
+        :type fields: list
         :returns: 记录列表
         :rtype: list
         """
         offset = offset or 0
-        with self.get_session() as session:
+        with self.get_session(readonly=True) as session:
             query = self._get_query(session, filters=filters, orders=orders)
+            query, fields = self._apply_fields(query, fields)
             if hooks:
                 for h in hooks:
                     query = h(query, filters)
@@ -895,28 +1572,368 @@ class ResourceBase(object):
                 query = query.offset(offset)
             if limit is not None:
                 query = query.limit(limit)
-            results = [rec.to_dict() for rec in query]
+            results = [rec.to_dict(fields=fields) for rec in query]
             return results
 
-    def get(self, rid):
+    def iter_list(self, filters=None, orders=None, offset=None, limit=None, hooks=None, batch_size=None, fields=None):
+        """
+        获取符合条件的记录，以生成器逐条返回，使用yield_per(服务端游标stream_results)分批读取，
+        内存占用仅取决于batch_size而不是结果集大小，适用于大量数据导出
+
+        注意：
+
+        * 生成器迭代完毕(或被关闭)前会一直占用数据库连接
+        * joinedload/subqueryload的集合无法与yield_per共用，因此动态加载外键时改用selectinload，
+          未启用动态加载时，model中relationship的加载方式需兼容yield_per
+
+        :param filters: 过滤条件
+        :type filters: dict
+        :param orders: 排序
+        :type orders: list
+        :param offset: 起始偏移量
+        :type offset: int
+        :param limit: 数量限制
+        :type limit: int
+        :param hooks: 钩子函数列表，函数形式为func(query, filters)
+        :type hooks: list
+        :param batch_size: 每批读取的记录数量，默认为CONF.dbcrud.stream_batch_size
+        :type batch_size: int
+        :param fields: 仅查询以及返回指定的属性，None则为全部，详见_apply_fields
+        :type fields: list
+        :returns: 记录生成器
+        :rtype: generator
+        """
+        offset = offset or 0
+        batch_size = batch_size or CONF.dbcrud.stream_batch_size
+        with self.get_session(readonly=True) as session:
+            load_method = self._dynamic_load_method
+            # yield_per无法与集合的joinedload一同使用，adaptive模式下集合已使用selectinload
+            if load_method != LOAD_ADAPTIVE:
+                self._dynamic_load_method = 'selectinload'
+            try:
+                query = self._get_query(session, filters=filters, orders=orders)
+            finally:
+                self._dynamic_load_method = load_method
+            query, fields = self._apply_fields(query, fields)
+            if hooks:
+                for h in hooks:
+                    query = h(query, filters)
+            query = self._addtional_list(query, filters)
+            if offset:
+                query = query.offset(offset)
+            if limit is not None:
+                query = query.limit(limit)
+            for rec in query.yield_per(batch_size):
+                yield rec.to_dict(fields=fields)
+
+    def list_with_count(self, filters=None, orders=None, offset=None, limit=None, hooks=None, fields=None):
+        """
+        获取符合条件的记录以及记录总数，尽可能在一次查询中完成
+
+        * 结果不足一页(或未指定limit)时，总数根据偏移量以及结果集数量推算
+        * 数据库支持窗口函数时，使用COUNT(*) OVER ()随结果集一同返回总数
+        * 否则(或重写了_addtional_count时)回退为list + count两次查询
+
+        注意：单次查询时总数基于list查询统计(包括_addtional_list)
+
+        :param filters: 过滤条件
+        :type filters: dict
+        :param orders: 排序
+        :type orders: list
+        :param offset: 起始偏移量
+        :type offset: int
+        :param limit: 数量限制
+        :type limit: int
+        :param hooks: 钩子函数列表，函数形式为func(query, filters)
+        :type hooks: list
+        :param fields: 仅查询以及返回指定的属性，None则为全部，详见_apply_fields
+        :type fields: list
+        :returns: (数量, 记录列表)
+        :rtype: tuple
+        """
+        offset = offset or 0
+        with self.get_session(readonly=True) as session:
+            if six.get_unbound_function(type(self)._addtional_count) is not six.get_unbound_function(
+                    ResourceBase._addtional_count):
+                results = self.list(filters=filters, orders=orders, offset=offset, limit=limit, hooks=hooks,
+                                    fields=fields)
+                return self.count(filters, hooks=hooks), results
+            query = self._get_query(session, filters=filters, orders=orders)
+            query, fields = self._apply_fields(query, fields)
+            if hooks:
+                for h in hooks:
+                    query = h(query, filters)
+            query = self._addtional_list(query, filters)
+            count = None
+            if limit is not None and _window_function_supported(session.get_bind().dialect):
+                query = query.add_columns(sqlalchemy.func.count().over().label('talos_total_count'))
+                if offset:
+                    query = query.offset(offset)
+                rows = query.limit(limit).all()
+                results = [row[0].to_dict(fields=fields) for row in rows]
+                if rows:
+                    count = rows[0][-1]
+            else:
+                if offset:
+                    query = query.offset(offset)
+                if limit is not None:
+                    query = query.limit(limit)
+                results = [rec.to_dict(fields=fields) for rec in query]
+            # 结果不足一页时即为最后一页，总数可直接推算
+            if count is None and (limit is None or len(results) < limit) and (results or not offset):
+                count = offset + len(results)
+            if count is None:
+                count = self.count(filters, hooks=hooks)
+            return count, results
+
+    def _apply_fields(self, query, fields, level=2, columns=None):
+        """
+        将字段选择下推至查询：仅SELECT请求的列(load_only)，未请求的relationship不再join/加载
+
+        * 请求的relationship会额外加载其外键列
+        * 请求了非列属性(如property)时，无法确定其依赖的列，因此加载全部列
+
+        :param query: 查询对象
+        :type query: query
+        :param fields: 请求的属性
+        :type fields: list
+        :param level: 属性层级，3：detail级，2：list级
+        :type level: int
+        :param columns: 需要额外加载的列对象，如排序列
+        :type columns: list
+        :returns: (应用后的查询对象, 属性集合)，fields为None时原样返回
+        :rtype: tuple
+        """
+        if fields is None:
+            return query, None
+        fields = frozenset(fields)
+        orm_meta = self.orm_meta
+        mapper = sqlalchemy.inspect(orm_meta)
+        load_columns = list(columns or [])
+        options = []
+        partial = True
+        for attr in _level_attributes(orm_meta, level):
+            if attr not in fields:
+                continue
+            prop = mapper.attrs[attr] if attr in mapper.attrs else None
+            if isinstance(prop, sqlalchemy.orm.ColumnProperty):
+                load_columns.append(getattr(orm_meta, attr))
+            elif isinstance(prop, sqlalchemy.orm.RelationshipProperty):
+                for column in prop.local_columns:
+                    try:
+                        load_columns.append(getattr(orm_meta, mapper.get_property_by_column(column).key))
+                    except sqlalchemy.orm.exc.UnmappedColumnError:
+                        continue
+            else:
+                partial = False
+        for name in _level_relationships(orm_meta, level) - fields:
+            options.append(sqlalchemy.orm.lazyload(getattr(orm_meta, name)))
+        if partial:
+            options.append(sqlalchemy.orm.load_only(*load_columns))
+        if options:
+            query = query.options(*options)
+        return query, fields
+
+    def _cursor_columns(self, orders=None):
+        """
+        获取游标分页的排序列：orders + _default_order + 主键，忽略重复列以及无法直接排序的列
+
+        :param orders: 排序
+        :type orders: list
+        :returns: [(排序规则, 列对象, 是否降序)]
+        :rtype: list
+        """
+        keys = self.primary_keys
+        keys = list(keys) if utils.is_list_type(keys) else [keys]
+        columns = []
+        names = set()
+        for field in list(orders or []) + self.default_order + keys:
+            desc = False
+            if field.startswith('+'):
+                field = field[1:]
+            elif field.startswith('-'):
+                desc = True
+                field = field[1:]
+            if field in names:
+                continue
+            expr_wrapper, column, handler = filter_wrapper.resolve_column(self.orm_meta, field)
+            # 不支持relationship以及json等表达式列
+            if column is None or expr_wrapper is not None or not isinstance(
+                    column, sqlalchemy.orm.attributes.InstrumentedAttribute):
+                continue
+            names.add(field)
+            columns.append((('-%s' if desc else '+%s') % field, column, desc))
+        return columns
+
+    def list_by_cursor(self, filters=None, orders=None, limit=None, cursor=None, hooks=None, fields=None):
+        """
+        基于游标(keyset)获取符合条件的记录，翻页性能与页数深度无关
+
+        游标记录了上一页最后一条记录的排序列(orders + _default_order + 主键)值，
+        翻页时转换为(c1, c2, ..., pk) > (v1, v2, ..., vpk)形式的过滤条件
+
+        注意：排序列应为非空列，且游标只能用于生成该游标时相同的排序
+
+        :param filters: 过滤条件
+        :type filters: dict
+        :param orders: 排序
+        :type orders: list
+        :param limit: 数量限制
+        :type limit: int
+        :param cursor: 上一页返回的游标，为空则获取第一页
+        :type cursor: str
+        :param hooks: 钩子函数列表，函数形式为func(query, filters)
+        :type hooks: list
+        :param fields: 仅查询以及返回指定的属性，None则为全部，详见_apply_fields
+        :type fields: list
+        :returns: (记录列表, 下一页游标)，无下一页时游标为None
+        :rtype: tuple
+        """
+        columns = self._cursor_columns(orders)
+        final_orders = [order for order, column, desc in columns]
+        values = pagination.decode_cursor(cursor, final_orders) if cursor else None
+        with self.get_session(readonly=True) as session:
+            query = self._get_query(session, filters=filters, orders=final_orders, ignore_default_orders=True)
+            query, fields = self._apply_fields(query, fields, columns=[column for order, column, desc in columns])
+            if values is not None:
+                query = query.filter(
+                    pagination.seek_expression([(column, desc) for order, column, desc in columns], values))
+            if hooks:
+                for h in hooks:
+                    query = h(query, filters)
+            query = self._addtional_list(query, filters)
+            if limit is not None:
+                # 多获取一条记录以判断是否存在下一页
+                query = query.limit(limit + 1)
+            records = query.all()
+            next_cursor = None
+            if limit is not None and len(records) > limit:
+                records = records[:limit]
+                next_cursor = pagination.encode_cursor(
+                    final_orders, [getattr(records[-1], column.key) for order, column, desc in columns])
+            return [rec.to_dict(fields=fields) for rec in records], next_cursor
+
+    def get(self, rid, fields=None):
         """
         获取指定id的资源
 
         :param rid: 根据不同的资源主键定义，内容也有所不同，单个值或者多个值的元组, 与主键(primary_keys)数量、顺序相匹配
         :type rid: any
+        :param fields: 仅查询以及返回指定的属性，None则为全部，详见_apply_fields
+        :type fields: list
         :returns: 资源详细属性
         :rtype: dict
         """
-        with self.get_session() as session:
+        # 事务中需要读取到未提交的数据，不使用缓存
+        if self._entity_cache and self._transaction is None and self._entity_cache_scoped():
+            result = self._get_cached_entity(rid)
+            if result is not None and fields is not None:
+                fields = frozenset(fields)
+                result = dict([(k, v) for k, v in result.items() if k in fields])
+            return result
+        return self._get_entity(rid, fields=fields)
+
+    def _entity_cache_scoped(self):
+        """
+        实体缓存的key仅包含资源类以及主键，default_filter按实例变化(如make_resource中按租户设置)时，
+        缓存的记录可能不满足当前实例的default_filter，此时不使用实体缓存
+
+        :returns: default_filter是否与资源类定义的一致
+        :rtype: bool
+        """
+        return self.default_filter == (type(self)._default_filter or {})
+
+    @classmethod
+    def _entity_cache_ident_key(cls, ident):
+        return 'talos.entity:%s.%s:%s' % (cls.__module__, cls.__name__, json.dumps(ident))
+
+    def _entity_cache_key(self, rid):
+        return self._entity_cache_ident_key(self._primary_key_ident(self._primary_key_value(rid)))
+
+    def _get_cached_entity(self, rid):
+        """
+        从实体缓存获取资源详细属性，依次查找进程内LRU、cache后端，均未命中时加锁从数据库加载，
+        同一key并发未命中时仅有一个进程/线程访问数据库
+
+        缓存值中记录了entity_version，版本变化(关联model写入或批量删除)时视为未命中；
+        进程内LRU命中时不访问cache后端，其他进程写入后最多延迟entity_cache_local_ttl秒可见；
+        未命中时从主库加载，避免从库延迟期间的旧数据写入缓存
+
+        :param rid: 主键值
+        :type rid: any
+        :returns: 资源详细属性(副本)
+        :rtype: dict
+        """
+        key = self._entity_cache_key(rid)
+        version = entity_version(self.orm_meta)
+        expires = self._entity_cache_expires
+        local = _entity_cache()
+        cached = local.get(key)
+        if cached is not None and cached[1] == version and time.time() - cached[0] <= min(
+                expires, CONF.dbcrud.entity_cache_local_ttl):
+            return copy.deepcopy(cached[2])
+        cached = cache.get(key, exipres=expires)
+        if not cache.validate(cached) or cached[0] != version:
+            with cache.distributed_lock(key + ':lock'):
+                # 等待锁期间可能已由其他进程加载
+                cached = cache.get(key, exipres=expires)
+                if not cache.validate(cached) or cached[0] != version:
+                    # 失效在主库提交后立即发生，从库延迟期间读取会将旧数据重新写入缓存，因此从主库加载
+                    result = self._get_entity(rid, readonly=False)
+                    if result is None:
+                        return None
+                    cached = (version, result)
+                    cache.set(key, cached)
+        local.set(key, (time.time(), version, cached[1]))
+        return copy.deepcopy(cached[1])
+
+    def _get_entity(self, rid, fields=None, readonly=True):
+        with self.get_session(readonly=readonly) as session:
             query = self._get_query(session, level_of_relationship=3)
+            query, fields = self._apply_fields(query, fields, level=3)
             query = self._apply_primary_key_filter(query, rid)
             query = query.one_or_none()
             if query:
-                result = query.to_detail_dict(child_as_summary=self._detail_relationship_as_summary)
+                result = query.to_detail_dict(child_as_summary=self._detail_relationship_as_summary, fields=fields)
                 return result
             else:
                 return None
 
+    def _refresh_required(self, item, detail, fields=None):
+        """
+        写入(flush)后是否需要refresh记录，以下情况才需要refresh，否则直接使用内存中的记录，避免额外的SELECT
+
+        * 存在过期的属性，如未通过RETURNING(model可设置__mapper_args__ = {'eager_defaults': True})获取的服务端默认值
+        * 输出的属性中包含未加载的relationship，或relationship的外键列已被更改
+
+        :param item: 记录对象
+        :type item: model
+        :param detail: 是否输出detail级属性
+        :type detail: bool
+        :param fields: 已更改的字段
+        :type fields: dict
+        :returns: 是否需要refresh
+        :rtype: bool
+        """
+        state = sqlalchemy.inspect(item)
+        if state.expired_attributes:
+            return True
+        names = _level_relationships(type(item), 2)
+        if detail:
+            names = names | _level_relationships(type(item), 3)
+        if names & state.unloaded:
+            return True
+        if fields:
+            mapper = state.mapper
+            for name in names:
+                for column in mapper.relationships[name].local_columns:
+                    try:
+                        if mapper.get_property_by_column(column).key in fields:
+                            return True
+                    except sqlalchemy.orm.exc.UnmappedColumnError:
+                        continue
+        return False
+
     def _before_create(self, resource, validate):
         pass
 
@@ -945,13 +1962,18 @@ class ResourceBase(object):
             all_fields = self.validate(resource, utils.get_function_name(), orm_required=False, validate=True)
             orm_fields = self.validate(resource, utils.get_function_name(), orm_required=True, validate=False)
         with self.transaction() as session:
+            # 新建的资源不存在实体缓存
+            self._mark_changed(session, rids=[])
             try:
                 # pylint:disable=not-callable
                 item = self.orm_meta(**orm_fields)
                 session.add(item)
                 session.flush()
                 self._addtional_create(session, all_fields, item.to_dict())
-                session.refresh(item)
+                # _addtional_create可能写入关联的记录，重写时始终refresh以返回最新的relationship
+                if six.get_unbound_function(type(self)._addtional_create) is not six.get_unbound_function(
+                        ResourceBase._addtional_create) or self._refresh_required(item, detail):
+                    session.refresh(item)
                 if detail:
                     return item.to_detail_dict(child_as_summary=self._detail_relationship_as_summary)
                 return item.to_dict()
@@ -999,6 +2021,7 @@ class ResourceBase(object):
             all_fields = self.validate(resource, utils.get_function_name(), orm_required=False, validate=True)
             orm_fields = self.validate(resource, utils.get_function_name(), orm_required=True, validate=False)
         with self.transaction() as session:
+            self._mark_changed(session, rids=[rid])
             try:
                 if detail:
                     query = self._get_query(session, ignore_default_orders=True, level_of_relationship=3)
@@ -1018,7 +2041,8 @@ class ResourceBase(object):
                     if orm_fields:
                         record.update(orm_fields)
                     session.flush()
-                    session.refresh(record)
+                    if self._refresh_required(record, detail, fields=orm_fields):
+                        session.refresh(record)
                     if detail:
                         after_update = record.to_detail_dict(child_as_summary=self._detail_relationship_as_summary)
                     else:
@@ -1054,6 +2078,7 @@ class ResourceBase(object):
         """
         self._before_delete(rid)
         with self.transaction() as session:
+            self._mark_changed(session, rids=[rid])
             try:
                 if detail:
                     query = self._get_query(session, orders=[], ignore_default_orders=True, level_of_relationship=3)
@@ -1086,35 +2111,235 @@ class ResourceBase(object):
                     raise exceptions.DBError(message=str(e))
                 raise exceptions.DBError(msg=_('unknown db error'))
 
-    def _before_delete_all(self, filters):
-        pass
+    def _primary_key_names(self):
+        keys = self.primary_keys
+        return list(keys) if utils.is_list_type(keys) else [keys]
+
+    def _primary_key_value(self, rid):
+        """将rid转换为与主键列顺序一致的tuple"""
+        keys = self._primary_key_names()
+        values = tuple(rid) if utils.is_list_type(rid) else (rid, )
+        if len(values) != len(keys):
+            raise exceptions.CriticalError(msg=utils.format_kwstring(_(
+                'primary key length not match! require: %(length_require)d, input: %(length_input)d'),
+                                                                     length_require=len(keys),
+                                                                     length_input=len(values)))
+        return values
+
+    def _primary_key_ident(self, values):
+        # 输入值类型可能与列类型不一致(如字符串形式的整数主键)，统一为字符串用于匹配
+        return tuple(six.text_type(v) for v in values)
+
+    def _apply_primary_keys_filter(self, query, rids):
+        keys = self._primary_key_names()
+        if len(keys) == 1:
+            return query.filter(getattr(self.orm_meta, keys[0]).in_([rid[0] for rid in rids]))
+        return query.filter(
+            or_(*[and_(*[getattr(self.orm_meta, key) == val for key, val in zip(keys, rid)]) for rid in rids]))
+
+    def _query_by_primary_keys(self, session, rids, filters=None, ignore_default=False, refresh=False):
+        """
+        根据主键批量查询记录
 
-    def _addtional_delete_all(self, session, resources):
-        pass
+        :returns: 主键标识 -> 记录对象
+        :rtype: dict
+        """
+        keys = self._primary_key_names()
+        query = self._get_query(session, orders=[], ignore_default=ignore_default, ignore_default_orders=True)
+        query = self._apply_primary_keys_filter(query, rids)
+        if refresh:
+            query = query.populate_existing()
+        if filters:
+            query = self._apply_filters(query, self.orm_meta, filters)
+        records = {}
+        for record in query:
+            records[self._primary_key_ident([getattr(record, key) for key in keys])] = record
+        return records
+
+    def _chunks(self, items, chunk_size):
+        chunk_size = chunk_size or CONF.dbcrud.bulk_chunk_size
+        for idx in range(0, len(items), chunk_size):
+            yield items[idx:idx + chunk_size]
+
+    def _before_create_many(self, resources, validate):
+        for resource in resources:
+            self._before_create(resource, validate)
+
+    def _addtional_create_many(self, session, resources, created):
+        for resource, item in zip(resources, created):
+            self._addtional_create(session, resource, item)
+
+    def create_many(self, resources, validate=True, chunk_size=None):
+        """
+        批量创建新资源，在同一事务中按chunk_size分批使用executemany插入，
+        每批仅需一次查询获取创建后的资源，而不是逐条flush & refresh
+
+        注意：未提供主键值(如自增主键)时，需逐条插入以获取主键
 
-    def delete_all(self, filters=None):
+        :param resources: 资源的属性值列表
+        :type resources: list
+        :param validate: 是否验证
+        :type validate: bool
+        :param chunk_size: 每批数量，默认为CONF.dbcrud.bulk_chunk_size
+        :type chunk_size: int
+        :returns: 创建的资源属性值列表
+        :rtype: list
         """
-        根据条件删除资源
+        validate = False if not self._validate else validate
+        self._before_create_many(resources, validate)
+        all_fields_list = resources
+        orm_fields_list = resources
+        if validate:
+            all_fields_list = [self.validate(resource, 'create', orm_required=False, validate=True)
+                               for resource in resources]
+            orm_fields_list = [self.validate(resource, 'create', orm_required=True, validate=False)
+                               for resource in resources]
+        keys = self._primary_key_names()
+        with self.transaction() as session:
+            self._mark_changed(session, rids=[])
+            try:
+                created = []
+                for chunk in self._chunks(orm_fields_list, chunk_size):
+                    mappings = [dict(orm_fields) for orm_fields in chunk]
+                    return_defaults = not all(key in mapping for mapping in mappings for key in keys)
+                    session.bulk_insert_mappings(self.orm_meta, mappings, return_defaults=return_defaults)
+                    rids = [tuple(mapping[key] for key in keys) for mapping in mappings]
+                    records = self._query_by_primary_keys(session, rids, ignore_default=True)
+                    created.extend([records[self._primary_key_ident(rid)].to_dict() for rid in rids])
+                self._addtional_create_many(session, all_fields_list, created)
+                return created
+            except sqlalchemy.exc.IntegrityError as e:
+                # e.message.split('DETAIL:  ')[1]
+                LOG.exception(e)
+                if self._db_exception_detail:
+                    raise exceptions.ConflictError(message=str(e))
+                raise exceptions.ConflictError(msg=_('can not meet the constraints'))
+            except sqlalchemy.exc.SQLAlchemyError as e:
+                LOG.exception(e)
+                if self._db_exception_detail:
+                    raise exceptions.DBError(message=str(e))
+                raise exceptions.DBError(msg=_('unknown db error'))
 
-        :param rid: 根据不同的资源主键定义，内容也有所不同，单个值或者多个值的元组, 与主键(primary_keys)数量、顺序相匹配
-        :type rid: any
-        :returns: 返回影响条目数量
-        :rtype: int
+    def _before_update_many(self, rids, resources, validate):
+        for rid, resource in zip(rids, resources):
+            self._before_update(rid, resource, validate)
+
+    def _addtional_update_many(self, session, rids, resources, before_updated, after_updated):
+        for rid, resource, before_update, after_update in zip(rids, resources, before_updated, after_updated):
+            if after_update is not None:
+                self._addtional_update(session, rid, resource, before_update, after_update)
+
+    def update_many(self, resources, filters=None, validate=True, chunk_size=None):
         """
-        filters = filters or []
-        self._before_delete_all(filters)
+        批量更新资源，在同一事务中按chunk_size分批，每批一次查询获取更新前资源，
+        使用executemany更新，再一次查询获取更新后资源
+
+        :param resources: 更新的属性以及值列表，每项需包含主键列的值
+        :type resources: list
+        :param filters: 额外的过滤条件，不符合条件的资源不会被更新
+        :type filters: dict
+        :param validate: 是否验证
+        :type validate: bool
+        :param chunk_size: 每批数量，默认为CONF.dbcrud.bulk_chunk_size
+        :type chunk_size: int
+        :returns: 与resources一一对应的(更新前资源, 更新后资源)列表，资源不存在时为(None, None)
+        :rtype: list
+        """
+        validate = False if not self._validate else validate
+        keys = self._primary_key_names()
+        rids = []
+        datas = []
+        for resource in resources:
+            for key in keys:
+                if key not in resource:
+                    raise exceptions.ValidationError(attribute=key, msg=_('primary key required'))
+            rids.append(tuple(resource[key] for key in keys))
+            datas.append(dict((k, v) for k, v in resource.items() if k not in keys))
+        # 钩子函数的rid与update保持一致
+        hook_rids = [rid[0] for rid in rids] if len(keys) == 1 else rids
+        self._before_update_many(hook_rids, datas, validate)
+        all_fields_list = datas
+        orm_fields_list = datas
+        if validate:
+            all_fields_list = [self.validate(data, 'update', orm_required=False, validate=True) for data in datas]
+            orm_fields_list = [self.validate(data, 'update', orm_required=True, validate=False) for data in datas]
         with self.transaction() as session:
+            self._mark_changed(session, rids=rids)
+            try:
+                results = []
+                for chunk in self._chunks(list(zip(rids, orm_fields_list)), chunk_size):
+                    chunk_rids = [rid for rid, orm_fields in chunk]
+                    records = self._query_by_primary_keys(session, chunk_rids, filters=filters)
+                    befores = dict((ident, record.to_dict()) for ident, record in records.items())
+                    mappings = []
+                    for rid, orm_fields in chunk:
+                        ident = self._primary_key_ident(rid)
+                        if ident in records and orm_fields:
+                            mapping = dict(orm_fields)
+                            mapping.update(zip(keys, [getattr(records[ident], key) for key in keys]))
+                            mappings.append(mapping)
+                    if mappings:
+                        session.bulk_update_mappings(self.orm_meta, mappings)
+                    records = self._query_by_primary_keys(session, chunk_rids, ignore_default=True, refresh=True)
+                    for rid in chunk_rids:
+                        ident = self._primary_key_ident(rid)
+                        if ident in befores:
+                            results.append((befores[ident], records[ident].to_dict()))
+                        else:
+                            results.append((None, None))
+                self._addtional_update_many(session, hook_rids, all_fields_list, [before for before, after in results],
+                                            [after for before, after in results])
+                return results
+            except sqlalchemy.exc.IntegrityError as e:
+                # e.message.split('DETAIL:  ')[1]
+                LOG.exception(e)
+                if self._db_exception_detail:
+                    raise exceptions.ConflictError(message=str(e))
+                raise exceptions.ConflictError(msg=_('can not meet the constraints'))
+            except sqlalchemy.exc.SQLAlchemyError as e:
+                LOG.exception(e)
+                if self._db_exception_detail:
+                    raise exceptions.DBError(message=str(e))
+                raise exceptions.DBError(msg=_('unknown db error'))
+
+    def _before_delete_many(self, rids):
+        for rid in rids:
+            self._before_delete(rid)
+
+    def _addtional_delete_many(self, session, resources):
+        for resource in resources:
+            self._addtional_delete(session, resource)
+
+    def delete_many(self, rids, filters=None, chunk_size=None):
+        """
+        批量删除资源，在同一事务中按chunk_size分批，每批一次查询获取资源，一次DELETE删除
+
+        :param rids: 资源主键列表，每项与delete的rid一致
+        :type rids: list
+        :param filters: 额外的过滤条件，不符合条件的资源不会被删除
+        :type filters: dict
+        :param chunk_size: 每批数量，默认为CONF.dbcrud.bulk_chunk_size
+        :type chunk_size: int
+        :returns: (删除的数量, 删除的资源列表)
+        :rtype: tuple
+        """
+        self._before_delete_many(rids)
+        rids = [self._primary_key_value(rid) for rid in rids]
+        with self.transaction() as session:
+            self._mark_changed(session, rids=rids)
             try:
-                query = self._get_query(session, orders=[], ignore_default_orders=True, filters=filters)
-                records = query.all()
                 count = 0
-                records = [rec.to_dict() for rec in records]
-                # FIXED, 数据已经通过.all()返回，此时不能使用synchronize_session的默认值'evaluate'，可以为fetch或False
-                # 因数据已被取回，所以此处直接False性能最高
-                count = query.delete(synchronize_session=False)
+                resources = []
+                for chunk in self._chunks(rids, chunk_size):
+                    query = self._get_query(session, orders=[], ignore_default_orders=True)
+                    query = self._apply_primary_keys_filter(query, chunk)
+                    if filters:
+                        query = self._apply_filters(query, self.orm_meta, filters)
+                    resources.extend([record.to_dict() for record in query])
+                    count += query.delete(synchronize_session=False)
                 session.flush()
-                self._addtional_delete_all(session, records)
-                return count, records
+                self._addtional_delete_many(session, resources)
+                return count, resources
             except sqlalchemy.exc.IntegrityError as e:
                 # e.message.split('DETAIL:  ')[1]
                 LOG.exception(e)
@@ -1126,3 +2351,130 @@ class ResourceBase(object):
                 if self._db_exception_detail:
                     raise exceptions.DBError(message=str(e))
                 raise exceptions.DBError(msg=_('unknown db error'))
+
+    def _before_delete_all(self, filters):
+        pass
+
+    def _addtional_delete_all(self, session, resources):
+        pass
+
+    def delete_all(self, filters=None, returning=None, batch_size=None):
+        """
+        根据条件删除资源
+
+        :param filters: 过滤条件
+        :type filters: dict
+        :param returning: 返回内容，records：删除的记录；keys：仅主键(PostgreSQL使用DELETE ... RETURNING)；
+                          none：不返回记录，内存占用与删除数量无关；默认为_delete_all_returning，
+                          重写了_addtional_delete_all时始终为records
+        :type returning: str
+        :param batch_size: 分批删除，每批在独立的事务中删除以缩短锁的持有时间(使用外部会话/事务时除外)，
+                           注意此时删除不再是原子性的；每批仅加载本批记录，但records/keys模式的返回值
+                           仍会累积全部批次的删除记录，内存占用与删除数量成正比，大批量删除请使用none
+        :type batch_size: int
+        :returns: (删除的数量, 删除的记录列表)，keys模式下记录仅包含主键列，none模式下为空列表
+        :rtype: tuple
+        """
+        filters = filters or {}
+        returning = returning or self._delete_all_returning
+        if six.get_unbound_function(type(self)._addtional_delete_all) is not six.get_unbound_function(
+                ResourceBase._addtional_delete_all):
+            returning = DELETE_RETURNING_RECORDS
+        self._before_delete_all(filters)
+        if not batch_size:
+            with self.transaction() as session:
+                count, records, selected = self._delete_all_batch(session, filters, returning)
+                return count, records
+        count = 0
+        records = []
+        while True:
+            with self.transaction() as session:
+                batch_count, batch_records, selected = self._delete_all_batch(session,
+                                                                               filters,
+                                                                               returning,
+                                                                               limit=batch_size)
+            count += batch_count
+            records.extend(batch_records)
+            if selected < batch_size:
+                break
+        return count, records
+
+    def _delete_all_batch(self, session, filters, returning, limit=None):
+        """
+        删除符合条件的资源(最多limit条)
+
+        :returns: (删除的数量, 删除的记录列表, 本批选中的数量)
+        :rtype: tuple
+        """
+        # 删除的资源主键已知时仅失效对应的实体缓存
+        self._mark_changed(session, rids=[])
+        try:
+            keys = self._primary_key_names()
+            if returning == DELETE_RETURNING_RECORDS:
+                query = self._get_query(session, orders=[], ignore_default_orders=True, filters=filters)
+                if limit is None:
+                    rows = query.all()
+                else:
+                    rows = query.limit(limit).all()
+                records = [rec.to_dict() for rec in rows]
+                rids = [tuple(getattr(rec, key) for key in keys) for rec in rows]
+                self._mark_changed(session, rids=rids)
+                if limit is None:
+                    # FIXED, 数据已经通过.all()返回，此时不能使用synchronize_session的默认值'evaluate'，可以为fetch或False
+                    # 因数据已被取回，所以此处直接False性能最高
+                    count = query.delete(synchronize_session=False)
+                else:
+                    count = self._delete_by_primary_keys(session, rids)
+                session.flush()
+                self._addtional_delete_all(session, records)
+                return count, records, len(records)
+            query = self._get_query(session,
+                                    orders=[],
+                                    ignore_default_orders=True,
+                                    filters=filters,
+                                    dynamic_relationship=False)
+            key_query = query.with_entities(*[getattr(self.orm_meta, key) for key in keys])
+            if limit is not None:
+                key_query = key_query.limit(limit)
+            if returning == DELETE_RETURNING_KEYS and _delete_returning_supported(session.get_bind().dialect):
+                # DELETE FROM table WHERE pk IN (SELECT pk FROM table WHERE ...) RETURNING pk
+                mapper = sqlalchemy.inspect(self.orm_meta)
+                columns = [mapper.get_property(key).columns[0] for key in keys]
+                if len(columns) == 1:
+                    condition = columns[0].in_(key_query.subquery())
+                else:
+                    condition = sqlalchemy.tuple_(*columns).in_(key_query.subquery())
+                rows = session.execute(mapper.local_table.delete().where(condition).returning(*columns),
+                                       mapper=self.orm_meta).fetchall()
+                self._mark_changed(session, rids=[tuple(row) for row in rows])
+                return len(rows), [dict(zip(keys, row)) for row in rows], len(rows)
+            if limit is None and returning != DELETE_RETURNING_KEYS:
+                # 未获取删除的主键，失效全部实体缓存
+                self._mark_changed(session)
+                return query.delete(synchronize_session=False), [], 0
+            rids = [tuple(row) for row in key_query]
+            self._mark_changed(session, rids=rids)
+            if limit is None:
+                count = query.delete(synchronize_session=False)
+            else:
+                count = self._delete_by_primary_keys(session, rids)
+            if returning == DELETE_RETURNING_KEYS:
+                return count, [dict(zip(keys, rid)) for rid in rids], len(rids)
+            return count, [], len(rids)
+        except sqlalchemy.exc.IntegrityError as e:
+            # e.message.split('DETAIL:  ')[1]
+            LOG.exception(e)
+            if self._db_exception_detail:
+                raise exceptions.ConflictError(message=str(e))
+            raise exceptions.ConflictError(msg=_('can not meet the constraints'))
+        except sqlalchemy.exc.SQLAlchemyError as e:
+            LOG.exception(e)
+            if self._db_exception_detail:
+                raise exceptions.DBError(message=str(e))
+            raise exceptions.DBError(msg=_('unknown db error'))
+
+    def _delete_by_primary_keys(self, session, rids):
+        if not rids:
+            return 0
+        query = self._apply_primary_keys_filter(session.query(self.orm_meta), rids)
+        return query.delete(synchronize_session=False)
@@ -7,9 +7,122 @@
 from __future__ import absolute_import
 
 import six
+import sqlalchemy.event
+from sqlalchemy import types as sqltypes
+from sqlalchemy.orm import ColumnProperty
+from sqlalchemy.orm import Mapper
 from sqlalchemy.orm import object_mapper
 from sqlalchemy.orm import RelationshipProperty
 
+# 字段序列化方式
+# 普通列，值无需处理
+_SCALAR = 0
+# 单个对象的relationship
+_RELATIONSHIP = 1
+# 列表的relationship
+_COLLECTION = 2
+# 其他(如property，自定义类型列)，逐行判断值类型
+_UNKNOWN = 3
+_SCALAR_TYPES = (sqltypes.String, sqltypes.Integer, sqltypes.Numeric, sqltypes.DateTime, sqltypes.Date,
+                 sqltypes.Time, sqltypes.Boolean, sqltypes.Interval, sqltypes.LargeBinary)
+# (model, 层级, flat_dict, child_as_summary) -> 序列化函数
+_SERIALIZERS = {}
+
+
+def _clear_serializers():
+    _SERIALIZERS.clear()
+
+
+# mapper重新configure时(如backref新增relationship)，字段可能已发生变化
+sqlalchemy.event.listen(Mapper, 'after_configured', _clear_serializers)
+
+
+def _field_kind(mapper, attr):
+    prop = mapper.attrs[attr] if attr in mapper.attrs else None
+    if isinstance(prop, ColumnProperty):
+        if len(prop.columns) == 1 and isinstance(prop.columns[0].type, _SCALAR_TYPES):
+            return _SCALAR
+    elif isinstance(prop, RelationshipProperty) and issubclass(prop.mapper.class_, DictBase):
+        if not prop.uselist:
+            return _RELATIONSHIP
+        if prop.collection_class is None:
+            return _COLLECTION
+    return _UNKNOWN
+
+
+def _compile_fields(obj, columns_method):
+    mapper = object_mapper(obj)
+    return tuple((attr, _field_kind(mapper, attr)) for attr in getattr(obj, columns_method)())
+
+
+def _make_serializer(fields, child_method, flat_dict):
+    """
+    生成序列化函数，字段的序列化方式已预先确定，每行仅需取值
+
+    :param fields: [(属性名称, 序列化方式)]，为None时每次根据实例重新获取
+    :type fields: tuple
+    :param child_method: 下级relationship对象的序列化方法名称
+    :type child_method: str
+    :param flat_dict: 是否转换为扁平结构字典
+    :type flat_dict: bool
+    :rtype: callable
+    """
+
+    def serialize(obj, prefix, columns_method, only=None):
+        prefix = prefix.strip() if prefix else None
+        d = {}
+        items = fields if fields is not None else _compile_fields(obj, columns_method)
+        if only is not None:
+            items = [item for item in items if item[0] in only]
+        for attr, kind in items:
+            value = getattr(obj, attr)
+            if kind == _SCALAR:
+                pass
+            elif kind == _COLLECTION:
+                value = [getattr(v, child_method)(flat_dict=flat_dict) for v in value]
+            elif kind == _RELATIONSHIP or isinstance(value, DictBase):
+                if value is not None:
+                    value = getattr(value, child_method)(flat_dict=flat_dict)
+                    if flat_dict:
+                        d.update(obj._convert_flat_dict(value, prefix=prefix or None))
+                        continue
+            elif isinstance(value, (tuple, list, set)):
+                if value:
+                    if isinstance(value[0], DictBase):
+                        value = [getattr(v, child_method)(flat_dict=flat_dict) for v in value]
+                else:
+                    value = []
+            if prefix:
+                d[prefix + attr] = value
+            else:
+                d[attr] = value
+        return d
+
+    return serialize
+
+
+def _serializer(obj, columns_method, flat_dict, child_as_summary):
+    """
+    获取(model, 层级, flat_dict, child_as_summary)对应的序列化函数，首次调用时生成
+
+    若model重写了层级对应的属性列表方法(list_columns/get_columns/sum_columns)，则每次根据实例获取属性列表
+    """
+    cls = type(obj)
+    key = (cls, columns_method, flat_dict, child_as_summary)
+    serializer = _SERIALIZERS.get(key)
+    if serializer is None:
+        fields = None
+        if six.get_unbound_function(getattr(cls, columns_method)) is six.get_unbound_function(
+                getattr(DictBase, columns_method)):
+            fields = _compile_fields(obj, columns_method)
+        if columns_method == 'get_columns' and not child_as_summary:
+            child_method = 'to_dict'
+        else:
+            child_method = 'to_summary_dict'
+        serializer = _make_serializer(fields, child_method, flat_dict)
+        _SERIALIZERS[key] = serializer
+    return serializer
+
 
 class DictBase(object):
     """扩展SQLAlchemy，使行对象可以转换为字典类型"""
@@ -74,7 +187,7 @@ class DictBase(object):
                     flat_data[key] = value
         return flat_data
 
-    def to_dict(self, prefix=None, flat_dict=False):
+    def to_dict(self, prefix=None, flat_dict=False, fields=None):
         """
         将自身Model的list级别的列:值转换为dict类型返回
 
@@ -82,38 +195,14 @@ class DictBase(object):
         :type prefix: string/None
         :param flat_dict: 是否转换为扁平结构字典，以'.'作为连接符
         :type flat_dict: bool
+        :param fields: 仅转换指定的属性，None则为全部
+        :type fields: set/list
         :returns: 字典，对应Model的列以及值
         :rtype: dict
         """
-        d = {}
-        for attr in self.list_columns():
-            value = getattr(self, attr)
-            if isinstance(value, DictBase):
-                value = value.to_summary_dict(flat_dict=flat_dict)
-                if flat_dict:
-                    if prefix and prefix.strip():
-                        d.update(
-                            self._convert_flat_dict(
-                                value, prefix=prefix.strip()))
-                    else:
-                        d.update(self._convert_flat_dict(value))
-                    continue
-            if isinstance(value, (tuple, list, set)):
-                if value:
-                    if isinstance(value[0], DictBase):
-                        values = []
-                        for v in value:
-                            values.append(v.to_summary_dict(flat_dict=flat_dict))
-                        value = values
-                else:
-                    value = []
-            if prefix and prefix.strip():
-                d[prefix.strip() + attr] = value
-            else:
-                d[attr] = value
-        return d
+        return _serializer(self, 'list_columns', flat_dict, False)(self, prefix, 'list_columns', fields)
 
-    def to_detail_dict(self, prefix=None, flat_dict=False, child_as_summary=False):
+    def to_detail_dict(self, prefix=None, flat_dict=False, child_as_summary=False, fields=None):
         """
         将自身Model的get级别的列:值转换为dict类型返回
 
@@ -121,44 +210,14 @@ class DictBase(object):
         :type prefix: string/None
         :param flat_dict: 是否转换为扁平结构字典，以'.'作为连接符
         :type flat_dict: bool
+        :param fields: 仅转换指定的属性，None则为全部
+        :type fields: set/list
         :returns: 字典，对应Model的列以及值
         :rtype: dict
         """
-        d = {}
-        for attr in self.get_columns():
-            value = getattr(self, attr)
-            if isinstance(value, DictBase):  # sqlalchemy.orm.collections.InstrumentedList
-                if child_as_summary:
-                    value = value.to_summary_dict(flat_dict=flat_dict)
-                else:
-                    value = value.to_dict(flat_dict=flat_dict)
-                if flat_dict:
-                    if prefix and prefix.strip():
-                        d.update(
-                            self._convert_flat_dict(
-                                value, prefix=prefix.strip()))
-                    else:
-                        d.update(self._convert_flat_dict(value))
-                    continue
-            if isinstance(value, (tuple, list, set)):
-                if value:
-                    if isinstance(value[0], DictBase):
-                        values = []
-                        for v in value:
-                            if child_as_summary:
-                                values.append(v.to_summary_dict(flat_dict=flat_dict))
-                            else:
-                                values.append(v.to_dict(flat_dict=flat_dict))
-                        value = values
-                else:
-                    value = []
-            if prefix and prefix.strip():
-                d[prefix.strip() + attr] = value
-            else:
-                d[attr] = value
-        return d
+        return _serializer(self, 'get_columns', flat_dict, child_as_summary)(self, prefix, 'get_columns', fields)
 
-    def to_summary_dict(self, prefix=None, flat_dict=False):
+    def to_summary_dict(self, prefix=None, flat_dict=False, fields=None):
         """
         将自身Model的summary级别的列:值转换为dict类型返回
 
@@ -166,33 +225,9 @@ class DictBase(object):
         :type prefix: string/None
         :param flat_dict: 是否转换为扁平结构字典，以'.'作为连接符
         :type flat_dict: bool
+        :param fields: 仅转换指定的属性，None则为全部
+        :type fields: set/list
         :returns: 字典，对应Model的列以及值
         :rtype: dict
         """
-        d = {}
-        for attr in self.sum_columns():
-            value = getattr(self, attr)
-            if isinstance(value, DictBase):
-                value = value.to_summary_dict(flat_dict=flat_dict)
-                if flat_dict:
-                    if prefix and prefix.strip():
-                        d.update(
-                            self._convert_flat_dict(
-                                value, prefix=prefix.strip()))
-                    else:
-                        d.update(self._convert_flat_dict(value))
-                    continue
-            if isinstance(value, (tuple, list, set)):
-                if value:
-                    if isinstance(value[0], DictBase):
-                        values = []
-                        for v in value:
-                            values.append(v.to_summary_dict(flat_dict=flat_dict))
-                        value = values
-                else:
-                    value = []
-            if prefix and prefix.strip():
-                d[prefix.strip() + attr] = value
-            else:
-                d[attr] = value
-        return d
+        return _serializer(self, 'sum_columns', flat_dict, False)(self, prefix, 'sum_columns', fields)
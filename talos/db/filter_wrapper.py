@@ -12,12 +12,15 @@ from __future__ import absolute_import
 import re
 from collections import Mapping
 
+import sqlalchemy.event
 from sqlalchemy import Text
 from sqlalchemy import cast as sqlcast
 from sqlalchemy.orm import attributes
+from sqlalchemy.orm import Mapper
 from sqlalchemy.orm import properties
 from sqlalchemy.orm import relationships
 from sqlalchemy.sql.expression import BinaryExpression
+from sqlalchemy.sql.expression import BindParameter
 from sqlalchemy.sql.sqltypes import _type_map
 from sqlalchemy.dialects.postgresql import array, ARRAY, JSONB
 
@@ -27,6 +30,29 @@ RE_CIDR = re.compile(r'^(\d{1,3}\.){0,3}\d{1,3}/\d{1,2}$')
 RE_IP = re.compile(r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$')
 RE_CIDR_LIKE = re.compile(r'^(\d{1,3}|\d{1,3}\.\d{1,3}|\d{1,3}\.\d{1,3}\.\d{1,3})(\.)?(/\d{1,2})?$')
 _FILTER_REGISTER = {}
+# 表达式解析缓存容量
+EXPRESSION_CACHE_SIZE = 2048
+# (类型, model, 表达式) -> 解析结果
+_EXPRESSION_CACHE = utils.LRUCache(maxsize=EXPRESSION_CACHE_SIZE)
+_MISSING = object()
+
+
+def expression_cache():
+    """
+    获取表达式解析缓存，可通过hits/misses查看命中统计
+
+    :returns: 缓存对象
+    :rtype: `talos.core.utils.LRUCache`
+    """
+    return _EXPRESSION_CACHE
+
+
+def clear_expression_cache():
+    _EXPRESSION_CACHE.clear()
+
+
+# mapper重新configure时(如backref新增relationship)，解析结果可能已发生变化
+sqlalchemy.event.listen(Mapper, 'after_configured', clear_expression_cache)
 
 
 def register_filter(type_name, filterobj, override=True):
@@ -34,6 +60,8 @@ def register_filter(type_name, filterobj, override=True):
         _FILTER_REGISTER[type_name] = filterobj
     else:
         _FILTER_REGISTER.setdefault(type_name, filterobj)
+    # 已缓存的解析结果中包含了过滤器对象
+    clear_expression_cache()
 
 
 def get_filter_map():
@@ -100,6 +128,63 @@ def column_from_expression(table, expression):
     return expr_wrapper, column
 
 
+def column_visit_name(column):
+    """
+    获取列类型名称，用于查找过滤器
+
+    :param column: 列对象
+    :type column: `ColumnAttribute`
+    :returns: 类型名称
+    :rtype: str
+    """
+    col_type = getattr(column, 'type', None)
+    if col_type:
+        return getattr(col_type, '__visit_name__', None)
+    return None
+
+
+def resolve_relationship(table, expression):
+    """
+    带缓存的relationship_from_expression
+
+    :param table: model类
+    :type table: model
+    :param expression: 表达式，eg. 'addresses'
+    :type expression: str
+    :returns: (expr_wrapper, relationship列)
+    :rtype: tuple
+    """
+    key = ('relationship', table, expression)
+    result = _EXPRESSION_CACHE.get(key, _MISSING)
+    if result is _MISSING:
+        result = relationship_from_expression(table, expression)
+        _EXPRESSION_CACHE.set(key, result)
+    return result
+
+
+def resolve_column(table, expression):
+    """
+    带缓存的column_from_expression，同时解析列对应的过滤器
+
+    :param table: model类
+    :type table: model
+    :param expression: 表达式，eg. 'name', 'department.name', 'data.key'
+    :type expression: str
+    :returns: (expr_wrapper, 列, 过滤器)，无法解析时列为None
+    :rtype: tuple
+    """
+    key = ('column', table, expression)
+    result = _EXPRESSION_CACHE.get(key, _MISSING)
+    if result is _MISSING:
+        expr_wrapper, column = column_from_expression(table, expression)
+        handler = None
+        if column is not None:
+            handler = get_filter(column_visit_name(column).lower())
+        result = (expr_wrapper, column, handler)
+        _EXPRESSION_CACHE.set(key, result)
+    return result
+
+
 def cast(column, value):
     """
     将python类型值转换为SQLAlchemy类型值
@@ -117,7 +202,49 @@ def cast(column, value):
     return column
 
 
+def pattern(templ, value):
+    """
+    使用模板生成like匹配值，参数化查询时value为BindParameter，其绑定值已应用过模板
+
+    :param templ: 模板，eg. '%%%s%%'
+    :type templ: str
+    :param value: 过滤值
+    :type value: any
+    """
+    if isinstance(value, BindParameter):
+        return value
+    return templ % value
+
+
+# 内置Filter支持参数化(bindparam)的操作符，{op: 值模板}，模板为None表示值原样绑定
+_BINDABLE_OPS = {
+    None: None,
+    'in': None,
+    'nin': None,
+    'eq': None,
+    'ne': None,
+    'lt': None,
+    'lte': None,
+    'gt': None,
+    'gte': None,
+    'like': '%%%s%%',
+    'starts': '%s%%',
+    'ends': '%%%s',
+    'nlike': '%%%s%%',
+    'ilike': '%%%s%%',
+    'istarts': '%s%%',
+    'iends': '%%%s',
+    'nilike': '%%%s%%',
+    'null': None,
+    'nnull': None,
+}
+
+
 class NullFilter(object):
+    # 支持参数化(bindparam)的操作符，仅在类自身声明时生效(不继承)，
+    # 自定义Filter子类默认接收原始过滤值，需要参数化时显式声明
+    bindable_ops = {}
+
     def make_empty_query(self, column):
         return column.is_(None) & column.isnot(None)
 
@@ -180,6 +307,8 @@ class NullFilter(object):
 
 
 class Filter(NullFilter):
+    bindable_ops = _BINDABLE_OPS
+
     def make_empty_query(self, column):
         return column == None & column != None
 
@@ -255,49 +384,49 @@ class Filter(NullFilter):
     def op_like(self, column, value):
         if isinstance(column, BinaryExpression):
             column = cast(column, value)
-        expr = column.like('%%%s%%' % value)
+        expr = column.like(pattern('%%%s%%', value))
         return expr
 
     def op_starts(self, column, value):
         if isinstance(column, BinaryExpression):
             column = cast(column, value)
-        expr = column.like('%s%%' % value)
+        expr = column.like(pattern('%s%%', value))
         return expr
 
     def op_ends(self, column, value):
         if isinstance(column, BinaryExpression):
             column = cast(column, value)
-        expr = column.like('%%%s' % value)
+        expr = column.like(pattern('%%%s', value))
         return expr
 
     def op_nlike(self, column, value):
         if isinstance(column, BinaryExpression):
             column = cast(column, value)
-        expr = column.notlike('%%%s%%' % value)
+        expr = column.notlike(pattern('%%%s%%', value))
         return expr
 
     def op_ilike(self, column, value):
         if isinstance(column, BinaryExpression):
             column = cast(column, value)
-        expr = column.ilike('%%%s%%' % value)
+        expr = column.ilike(pattern('%%%s%%', value))
         return expr
 
     def op_istarts(self, column, value):
         if isinstance(column, BinaryExpression):
             column = cast(column, value)
-        expr = column.ilike('%s%%' % value)
+        expr = column.ilike(pattern('%s%%', value))
         return expr
 
     def op_iends(self, column, value):
         if isinstance(column, BinaryExpression):
             column = cast(column, value)
-        expr = column.ilike('%%%s' % value)
+        expr = column.ilike(pattern('%%%s', value))
         return expr
 
     def op_nilike(self, column, value):
         if isinstance(column, BinaryExpression):
             column = cast(column, value)
-        expr = column.notilike('%%%s%%' % value)
+        expr = column.notilike(pattern('%%%s%%', value))
         return expr
 
     def op_nnull(self, column, value):
@@ -461,6 +590,8 @@ class FilterNumber(Filter):
     '''
     数字类型不支持like操作
     '''
+    bindable_ops = _BINDABLE_OPS
+
     def op_like(self, column, value):
         pass
 
@@ -516,6 +647,8 @@ class FilterJSON(Filter):
     '''
     JSON/JSONB类型
     '''
+    bindable_ops = _BINDABLE_OPS
+
     def op_hasall(self, column, value):
         if utils.is_list_type(value):
             expr = column.op('?&')(sqlcast(array(value), ARRAY(Text)))
@@ -0,0 +1,109 @@
+# coding=utf-8
+"""
+本模块提供基于游标(keyset/seek)的分页支持
+
+游标记录了上一页最后一条记录的排序列值，翻页时转换为seek查询条件，
+数据库可以直接通过索引定位，而无需像offset一样扫描并丢弃前面所有记录
+
+"""
+
+from __future__ import absolute_import
+
+import base64
+import binascii
+import datetime
+import decimal
+import json
+
+from sqlalchemy import and_, or_
+
+from talos.core import exceptions
+from talos.core import utils
+from talos.core.i18n import _
+
+
+def _encode_value(value):
+    if isinstance(value, datetime.datetime):
+        return {'$dt': [value.year, value.month, value.day, value.hour, value.minute, value.second,
+                        value.microsecond]}
+    if isinstance(value, datetime.date):
+        return {'$d': [value.year, value.month, value.day]}
+    if isinstance(value, datetime.time):
+        return {'$t': [value.hour, value.minute, value.second, value.microsecond]}
+    if isinstance(value, decimal.Decimal):
+        return {'$dec': str(value)}
+    raise TypeError('%r is not JSON serializable' % value)
+
+
+def _decode_value(value):
+    if '$dt' in value:
+        return datetime.datetime(*value['$dt'])
+    if '$d' in value:
+        return datetime.date(*value['$d'])
+    if '$t' in value:
+        return datetime.time(*value['$t'])
+    if '$dec' in value:
+        return decimal.Decimal(value['$dec'])
+    return value
+
+
+def encode_cursor(orders, values):
+    """
+    生成游标
+
+    :param orders: 排序规则，eg. ['+name', '-id']
+    :type orders: list
+    :param values: 记录对应排序列的值
+    :type values: list
+    :returns: 不透明的游标字符串
+    :rtype: str
+    """
+    data = json.dumps({'o': orders, 'v': values}, default=_encode_value, separators=(',', ':'))
+    cursor = base64.urlsafe_b64encode(utils.ensure_bytes(data)).rstrip(b'=')
+    return utils.ensure_unicode(cursor)
+
+
+def decode_cursor(cursor, orders):
+    """
+    解析游标
+
+    :param cursor: 游标字符串
+    :type cursor: str
+    :param orders: 当前的排序规则，必须与生成游标时的排序规则一致
+    :type orders: list
+    :returns: 记录对应排序列的值
+    :rtype: list
+    :raises: ValidationError
+    """
+    try:
+        data = utils.ensure_bytes(cursor)
+        data = base64.urlsafe_b64decode(data + b'=' * (-len(data) % 4))
+        data = json.loads(utils.ensure_unicode(data), object_hook=_decode_value)
+        cursor_orders, values = data['o'], data['v']
+    except (TypeError, ValueError, KeyError, binascii.Error):
+        raise exceptions.ValidationError(attribute='cursor', msg=_('malformed cursor'))
+    if cursor_orders != list(orders) or len(values) != len(orders):
+        raise exceptions.ValidationError(attribute='cursor', msg=_('cursor does not match orders'))
+    return values
+
+
+def seek_expression(columns, values):
+    """
+    生成seek查询条件，即(c1, c2, ..., cn) > (v1, v2, ..., vn)的展开形式，
+    降序列使用<比较，并附加首列的范围条件以便数据库使用索引
+
+    :param columns: [(列对象, 是否降序)]
+    :type columns: list
+    :param values: 上一页最后一条记录对应列的值
+    :type values: list
+    :returns: 查询条件表达式
+    :rtype: `sqlalchemy.sql.expression.ClauseElement`
+    """
+    clauses = []
+    for idx, (column, desc) in enumerate(columns):
+        conditions = [columns[i][0] == values[i] for i in range(idx)]
+        conditions.append(column < values[idx] if desc else column > values[idx])
+        clauses.append(and_(*conditions))
+    first_column, first_desc = columns[0]
+    bound = first_column <= values[0] if first_desc else first_column >= values[0]
+    return and_(bound, or_(*clauses))
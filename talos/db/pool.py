@@ -6,44 +6,562 @@
 
 from __future__ import absolute_import
 
+import bisect
+import collections
+import itertools
+import logging
+import random
+import re
+import threading
+import time
+
+import six
 import sqlalchemy
+import sqlalchemy.event
 from sqlalchemy.orm import scoped_session
 from sqlalchemy.orm import sessionmaker
 
 from talos.core import config
 from talos.core import decorators as deco
+from talos.utils import scoped_globals
 
+LOG = logging.getLogger(__name__)
 CONF = config.CONF
+# 线程级的当前语句计数器栈
+_COUNTERS = threading.local()
+# 请求外(无scoped_globals.GLOBALS.request)的主库绑定信息
+_PINNED = threading.local()
+_PINNED_CONTEXT_KEY = 'talos.db.pinned'
+# 请求级连接，{(id(pool), 目标): (connection, session_factory)}
+_SESSIONS_CONTEXT_KEY = 'talos.db.sessions'
+_RE_WRITE_STATEMENT = re.compile(r'^\s*(INSERT|UPDATE|DELETE|REPLACE|MERGE|UPSERT)\b', re.IGNORECASE)
+
+# 只读会话的从库选择策略
+ROUTING_ROUND_ROBIN = 'round_robin'
+ROUTING_LEAST_OUTSTANDING = 'least_outstanding'
+ROUTING_LATENCY = 'latency'
+# 延迟的指数加权平均系数
+_LATENCY_DECAY = 0.2
+# 连接获取等待时间、语句执行时间直方图的默认分桶上限(秒)
+HISTOGRAM_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+# 连接池指标输出
+_SINKS = []
+# 具名连接池，{name: DBPool}
+_NAMED_POOLS = {}
+
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    for counter in getattr(_COUNTERS, 'stack', ()):
+        counter.count += 1
+        if counter.statements is not None:
+            counter.statements.append(statement)
+
+
+class StatementCounter(object):
+    """
+    统计代码块内(当前线程)通过连接池执行的SQL语句数量，可用于检查N+1查询
+
+    with StatementCounter() as counter:
+        resource.get('1')
+    counter.count
+    """
+
+    def __init__(self, record=False):
+        """
+        :param record: 是否记录执行的SQL语句
+        :type record: bool
+        """
+        self.count = 0
+        self.statements = [] if record else None
+
+    def start(self):
+        stack = getattr(_COUNTERS, 'stack', None)
+        if stack is None:
+            stack = _COUNTERS.stack = []
+        stack.append(self)
+        return self
+
+    def stop(self):
+        stack = getattr(_COUNTERS, 'stack', [])
+        if self in stack:
+            stack.remove(self)
+        return self.count
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def _is_write_statement(statement, context):
+    if context is not None and (context.isinsert or context.isupdate or context.isdelete):
+        return True
+    return _RE_WRITE_STATEMENT.match(statement) is not None
+
+
+def _current_request():
+    return getattr(scoped_globals.GLOBALS, 'request', None)
+
+
+def begin_request_scope(context):
+    """
+    开启请求级会话，之后本请求中的DBPool.get_session在首次使用时从连接池获取连接，并在请求内复用
+
+    :param context: 请求上下文，req.context
+    :type context: dict
+    """
+    context[_SESSIONS_CONTEXT_KEY] = {}
+
+
+def end_request_scope(context):
+    """
+    结束请求级会话，将请求中使用的连接归还连接池
+
+    :param context: 请求上下文，req.context
+    :type context: dict
+    """
+    connections = context.pop(_SESSIONS_CONTEXT_KEY, None) or {}
+    for connection, session_factory in connections.values():
+        try:
+            connection.close()
+        except Exception as e:
+            LOG.warning('failed to release request scoped connection, reason: %s', e)
+
+
+class _RequestScopedSession(scoped_session):
+    """
+    绑定在请求级连接上的会话，remove时仅关闭会话并结束连接上的隐式事务(避免整个请求使用同一快照)，
+    连接在end_request_scope时归还连接池
+    """
+
+    def __init__(self, connection, session_factory):
+        super(_RequestScopedSession, self).__init__(session_factory)
+        self.bound_connection = connection
+
+    def remove(self):
+        super(_RequestScopedSession, self).remove()
+        connection = self.bound_connection
+        try:
+            if not connection.closed and not connection.invalidated and not connection.in_transaction():
+                connection.connection.rollback()
+        except Exception as e:
+            LOG.warning('failed to reset request scoped connection, reason: %s', e)
+
+
+class Histogram(object):
+    """
+    固定分桶的直方图，buckets为各分桶上限(秒)
+    为保证开销足够低，计数未加锁，高并发下可能有极少量误差
+    """
+
+    def __init__(self, buckets=None):
+        self.buckets = tuple(buckets or HISTOGRAM_BUCKETS)
+        self.clear()
+
+    def clear(self):
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self):
+        """
+        :returns: {'buckets': [[上限, 累计数量], ...], 'sum': 总和, 'count': 数量}，最后一个分桶上限为'+Inf'
+        :rtype: dict
+        """
+        buckets = []
+        total = 0
+        for bound, count in zip(list(self.buckets) + ['+Inf'], self.counts):
+            total += count
+            buckets.append([bound, total])
+        return {'buckets': buckets, 'sum': self.sum, 'count': self.count}
+
+
+class MetricsSink(object):
+    """
+    连接池指标输出接口，可继承实现以推送到statsd等监控系统，通过add_metrics_sink注册
+    回调在数据库操作的线程中同步执行，实现需足够轻量
+    """
+
+    def increment(self, pool_name, name, value=1):
+        """
+        计数类指标
+
+        :param pool_name: 连接池名称
+        :type pool_name: str
+        :param name: 指标名称，connects/invalidations/disconnects/slow_queries
+        :type name: str
+        """
+        pass
+
+    def timing(self, pool_name, name, seconds):
+        """
+        耗时类指标
+
+        :param pool_name: 连接池名称
+        :type pool_name: str
+        :param name: 指标名称，checkout_wait/query
+        :type name: str
+        """
+        pass
+
+
+def add_metrics_sink(sink):
+    """
+    注册连接池指标输出
+
+    :param sink: 指标输出
+    :type sink: MetricsSink
+    """
+    _SINKS.append(sink)
+
+
+def remove_metrics_sink(sink):
+    if sink in _SINKS:
+        _SINKS.remove(sink)
+
+
+class PoolMetrics(object):
+    """
+    连接池指标：连接获取等待时间、语句执行时间直方图，当前借出连接数，建立连接/失效/断开次数，慢语句数量
+    """
+
+    def __init__(self, name, engine, slow_query_threshold=None):
+        """
+        :param name: 连接池名称
+        :type name: str
+        :param engine: 数据库引擎
+        :type engine: `sqlalchemy.engine.Engine`
+        :param slow_query_threshold: 执行时间超过此值(秒)的语句记录为慢语句并输出warning日志，None则不统计
+        :type slow_query_threshold: float
+        """
+        self.name = name
+        self.engine = engine
+        self.slow_query_threshold = slow_query_threshold
+        self.checkout_wait = Histogram()
+        self.query = Histogram()
+        self.checked_out = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.disconnects = 0
+        self.slow_queries = 0
+        # 语句执行时间的指数加权平均，用于从库的latency选择策略
+        self.latency = None
+        self._instrument(engine)
+
+    def _wrap_connect(self, pool):
+        pool_connect = pool.connect
+
+        def _timed_connect():
+            started = time.time()
+            try:
+                return pool_connect()
+            finally:
+                self._timing('checkout_wait', self.checkout_wait, time.time() - started)
+
+        pool.connect = _timed_connect
+
+    def _instrument(self, engine):
+        self._wrap_connect(engine.pool)
+        # engine.dispose()会重建pool
+        sqlalchemy.event.listen(engine, 'engine_disposed', lambda disposed: self._wrap_connect(disposed.pool))
+        sqlalchemy.event.listen(engine, 'checkout', self._on_checkout)
+        sqlalchemy.event.listen(engine, 'checkin', self._on_checkin)
+        sqlalchemy.event.listen(engine, 'connect', self._on_connect)
+        sqlalchemy.event.listen(engine, 'invalidate', self._on_invalidate)
+        sqlalchemy.event.listen(engine, 'before_cursor_execute', self._before_execute)
+        sqlalchemy.event.listen(engine, 'after_cursor_execute', self._after_execute)
+        sqlalchemy.event.listen(engine, 'handle_error', self._on_error)
+
+    def _increment(self, name, value=1):
+        setattr(self, name, getattr(self, name) + value)
+        for sink in _SINKS:
+            sink.increment(self.name, name, value)
+
+    def _timing(self, name, histogram, seconds):
+        histogram.observe(seconds)
+        for sink in _SINKS:
+            sink.timing(self.name, name, seconds)
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self.checked_out += 1
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        self.checked_out = max(self.checked_out - 1, 0)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        self._increment('connects')
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        self._increment('invalidations')
+
+    def _on_error(self, context):
+        if context.is_disconnect:
+            self._increment('disconnects')
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('talos.metrics.started', []).append(time.time())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('talos.metrics.started')
+        if not started:
+            return
+        elapsed = time.time() - started.pop()
+        self._timing('query', self.query, elapsed)
+        if self.latency is None:
+            self.latency = elapsed
+        else:
+            self.latency = (1 - _LATENCY_DECAY) * self.latency + _LATENCY_DECAY * elapsed
+        if self.slow_query_threshold is not None and elapsed > self.slow_query_threshold:
+            self._increment('slow_queries')
+            LOG.warning('slow query on %s took %.3f seconds: %s', self.name, elapsed, statement)
+
+    def to_dict(self):
+        """
+        :returns: 指标字典
+        :rtype: dict
+        """
+        pool = self.engine.pool
+        size = pool.size() if hasattr(pool, 'size') else None
+        overflow = pool.overflow() if hasattr(pool, 'overflow') else None
+        return {
+            'pool_size': size,
+            # QueuePool的overflow()在未用满pool_size时为负数
+            'overflow': max(overflow, 0) if overflow is not None else None,
+            'checked_out': self.checked_out,
+            'connects': self.connects,
+            'invalidations': self.invalidations,
+            'disconnects': self.disconnects,
+            'slow_queries': self.slow_queries,
+            'checkout_wait': self.checkout_wait.to_dict(),
+            'query': self.query.to_dict(),
+        }
+
+
+class Replica(object):
+    """从库，根据其连接池指标记录连接数、延迟以及健康状态"""
+
+    def __init__(self, name, engine, metrics, max_failures=1, eject_time=30):
+        """
+        :param name: 名称
+        :type name: str
+        :param engine: 数据库引擎
+        :type engine: `sqlalchemy.engine.Engine`
+        :param metrics: 从库连接池指标
+        :type metrics: PoolMetrics
+        :param max_failures: 连续连接失败次数达到此值时摘除
+        :type max_failures: int
+        :param eject_time: 摘除时间(秒)，到期后重新参与选择
+        :type eject_time: float
+        """
+        self.name = name
+        self.engine = engine
+        self.metrics = metrics
+        self.session_factory = sessionmaker(bind=engine, autocommit=True)
+        self.max_failures = max_failures
+        self.eject_time = eject_time
+        self.failures = 0
+        self.ejected_until = 0
+        self._lock = threading.Lock()
+        sqlalchemy.event.listen(engine, 'connect', self._on_connect)
+        sqlalchemy.event.listen(engine, 'handle_error', self._on_error)
+
+    @property
+    def healthy(self):
+        return time.time() >= self.ejected_until
+
+    @property
+    def outstanding(self):
+        return self.metrics.checked_out
+
+    @property
+    def latency(self):
+        return self.metrics.latency
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        self.failures = 0
+
+    def _on_error(self, context):
+        # connection为None代表建立连接失败
+        if context.connection is not None and not context.is_disconnect:
+            return
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.max_failures:
+                self.ejected_until = time.time() + self.eject_time
+                self.failures = 0
+                LOG.warning('replica %s ejected for %s seconds, reason: %s',
+                            self.name, self.eject_time, context.original_exception)
+
+
+def _default_pool_size(engine):
+    pool = engine.pool
+    return pool.size() if hasattr(pool, 'size') else 1
+
+
+def _warm_engine(engine, size):
+    # 同时借出size个连接再全部归还，使连接池中保留size个空闲连接
+    connections = []
+    try:
+        for _ in range(size):
+            connections.append(engine.connect())
+    finally:
+        for connection in connections:
+            connection.close()
+
+
+def _dispose_when_idle(engine, metrics, timeout):
+    def _dispose():
+        deadline = time.time() + timeout
+        while metrics.checked_out > 0 and time.time() < deadline:
+            time.sleep(0.1)
+        if metrics.checked_out > 0:
+            LOG.warning('dispose pool %s with %d connections still checked out', metrics.name, metrics.checked_out)
+        engine.dispose()
+
+    if metrics is None or metrics.checked_out <= 0:
+        engine.dispose()
+        return
+    worker = threading.Thread(target=_dispose, name='talos-pool-dispose')
+    worker.daemon = True
+    worker.start()
 
 
 class DBPool(object):
     """数据库连接池，单例模式"""
+    # 连接池名称，具名连接池的指标可通过metrics()获取
+    name = None
 
-    def __init__(self, param=None):
+    def __init__(self, param=None, name=None):
         """初始化连接池
 
         :param params: 连接信息列表
-        {connection: xxx, [pool_size: xxx], [pool_recycle: xxx], [pool_timeout: xxx], [max_overflow: xxx]}
+        {connection: xxx, [pool_size: xxx], [pool_recycle: xxx], [pool_timeout: xxx], [max_overflow: xxx],
+         [replicas: [xxx]], [replica_policy: xxx], [replica_max_failures: xxx], [replica_eject_time: xxx],
+         [replica_pin_time: xxx], [slow_query_threshold: xxx], [pool_prewarm: xxx], [dispose_timeout: xxx]}
         :type params: list
+        :param name: 连接池名称
+        :type name: str
         :param connecter: 连接器，可选pymysql,psycopg2
         :type connecter: str
         :raises: None
         """
+        if name:
+            self.name = name
+        self._pool = None
+        self.engine = None
+        self.metrics = None
+        self.replicas = []
+        self.replica_policy = ROUTING_ROUND_ROBIN
+        self.replica_pin_time = 5
+        self.prewarm_size = 0
+        self._round_robin = itertools.count()
+        self._reflesh_lock = threading.Lock()
         if param:
             self.reflesh(param=param)
 
-    def get_session(self):
+    def get_session(self, readonly=False):
         """从连接池中获取一个会话对象
 
+        :param readonly: 是否只读会话，只读会话会根据replica_policy路由到从库，
+                         当前请求写入过主库(或调用了pin_primary)后仍然使用主库，以读取到自己的写入
+        :type readonly: bool
         :returns: 会话对象
         :rtype: scoped_session
         :raises: ValueError
         """
         if self._pool:
+            request = _current_request()
+            scope = request.context.get(_SESSIONS_CONTEXT_KEY) if request is not None else None
+            if readonly and self.replicas and not self.pinned:
+                # 请求级会话中，同一请求的只读会话固定使用首次选择的从库
+                if scope is not None and (id(self), 'replica') in scope:
+                    return self._request_session(scope, 'replica', None)
+                replica = self.choose_replica()
+                if replica is not None:
+                    if scope is not None:
+                        return self._request_session(scope, 'replica', replica.engine)
+                    return scoped_session(replica.session_factory)
+            if scope is not None:
+                return self._request_session(scope, 'primary', self.engine)
             session = scoped_session(self._pool)
             return session
         raise ValueError('failed to get session')
 
+    def _request_session(self, scope, target, engine):
+        key = (id(self), target)
+        if key not in scope:
+            connection = engine.connect()
+            scope[key] = (connection, sessionmaker(bind=connection, autocommit=True))
+        connection, session_factory = scope[key]
+        return _RequestScopedSession(connection, session_factory)
+
+    def choose_replica(self):
+        """
+        根据replica_policy选择一个健康的从库
+
+        :returns: 从库，无可用从库时返回None
+        :rtype: Replica
+        """
+        candidates = [replica for replica in self.replicas if replica.healthy]
+        if not candidates:
+            return None
+        if self.replica_policy == ROUTING_LEAST_OUTSTANDING:
+            lowest = min(replica.outstanding for replica in candidates)
+            candidates = [replica for replica in candidates if replica.outstanding == lowest]
+        elif self.replica_policy == ROUTING_LATENCY:
+            # 按延迟倒数加权随机选择，未有统计的从库优先参与统计
+            unmeasured = [replica for replica in candidates if replica.latency is None]
+            if unmeasured:
+                candidates = unmeasured
+            else:
+                weights = [1.0 / max(replica.latency, 1e-6) for replica in candidates]
+                point = random.uniform(0, sum(weights))
+                for replica, weight in zip(candidates, weights):
+                    point -= weight
+                    if point <= 0:
+                        return replica
+                return candidates[-1]
+        return candidates[six.next(self._round_robin) % len(candidates)]
+
+    @property
+    def pinned(self):
+        """只读会话当前是否绑定到主库"""
+        request = _current_request()
+        if request is not None:
+            return id(self) in request.context.get(_PINNED_CONTEXT_KEY, ())
+        return getattr(_PINNED, 'pools', {}).get(id(self), 0) > time.time()
+
+    def pin_primary(self):
+        """
+        将只读会话绑定到主库，请求中绑定至请求结束，请求外绑定replica_pin_time秒
+        写入主库后会自动调用
+        """
+        request = _current_request()
+        if request is not None:
+            request.context.setdefault(_PINNED_CONTEXT_KEY, set()).add(id(self))
+            return
+        pools = getattr(_PINNED, 'pools', None)
+        if pools is None:
+            pools = _PINNED.pools = {}
+        pools[id(self)] = time.time() + self.replica_pin_time
+
+    def unpin_primary(self):
+        """取消只读会话到主库的绑定"""
+        request = _current_request()
+        if request is not None:
+            request.context.get(_PINNED_CONTEXT_KEY, set()).discard(id(self))
+        getattr(_PINNED, 'pools', {}).pop(id(self), None)
+
+    def _pin_on_write(self, conn, cursor, statement, parameters, context, executemany):
+        if _is_write_statement(statement, context):
+            self.pin_primary()
+
     def transaction(self):
         """从连接池中获取一个事务对象
 
@@ -59,28 +577,204 @@ class DBPool(object):
 
     def reflesh(self, param):
         """
-        重建连接池
+        重建连接池：创建新的引擎并预热连接，然后切换，旧引擎在借出的连接全部归还后(最多dispose_timeout秒)释放，
+        正在执行的请求不受影响
 
         :param params: 连接信息列表
-        {connection: xxx, [pool_size: xxx], [pool_recycle: xxx], [pool_timeout: xxx], [max_overflow: xxx]}
+        {connection: xxx, [pool_size: xxx], [pool_recycle: xxx], [pool_timeout: xxx], [max_overflow: xxx],
+         [pool_prewarm: xxx], [dispose_timeout: xxx]}
         :type params: list
         :param connector: 连接器，可选pymysql,psycopg2
         :type connector: str
         :returns: 是否重建成功
         :rtype: bool
+        :raises: ValueError, 已有连接池时，新连接池预热失败则保留原连接池并抛出异常
         """
+        param = dict(param)
+        replicas = param.pop('replicas', None) or []
+        replica_policy = param.pop('replica_policy', None) or ROUTING_ROUND_ROBIN
+        if replica_policy not in (ROUTING_ROUND_ROBIN, ROUTING_LEAST_OUTSTANDING, ROUTING_LATENCY):
+            raise ValueError('unsupported replica_policy: %s' % replica_policy)
+        replica_pin_time = param.pop('replica_pin_time', 5)
+        max_failures = param.pop('replica_max_failures', 1)
+        eject_time = param.pop('replica_eject_time', 30)
+        slow_query_threshold = param.pop('slow_query_threshold', None)
+        prewarm = param.pop('pool_prewarm', 0)
+        dispose_timeout = param.pop('dispose_timeout', 60)
         param.setdefault('echo', CONF.log.level.upper() == 'DEBUG')
-        connection = param.pop('connection')
-        self._pool = sessionmaker(bind=sqlalchemy.create_engine(connection, **param), autocommit=True)
+        engine = self._create_engine(dict(param))
+        pool_name = self.name or repr(engine.url)
+        engine_metrics = PoolMetrics(pool_name, engine, slow_query_threshold=slow_query_threshold)
+        new_replicas = []
+        for idx, replica_param in enumerate(replicas):
+            # 从库未指定的连接参数继承主库
+            if isinstance(replica_param, six.string_types):
+                replica_param = {'connection': replica_param}
+            merged_param = dict(param)
+            merged_param.update(replica_param)
+            replica_engine = self._create_engine(merged_param)
+            replica_metrics = PoolMetrics('%s.replicas.%d' % (pool_name, idx), replica_engine,
+                                          slow_query_threshold=slow_query_threshold)
+            # url的字符串形式中密码被隐藏
+            new_replicas.append(Replica(repr(replica_engine.url), replica_engine, replica_metrics,
+                                        max_failures=max_failures, eject_time=eject_time))
+        if new_replicas:
+            sqlalchemy.event.listen(engine, 'after_cursor_execute', self._pin_on_write)
+        if prewarm:
+            try:
+                for new_engine in [engine] + [replica.engine for replica in new_replicas]:
+                    _warm_engine(new_engine, prewarm)
+            except Exception as e:
+                if self.engine is not None:
+                    for new_engine in [engine] + [replica.engine for replica in new_replicas]:
+                        new_engine.dispose()
+                    raise ValueError('failed to prewarm pool %s, keep the current pool, reason: %s' % (pool_name, e))
+                LOG.warning('failed to prewarm pool %s, reason: %s', pool_name, e)
+        with self._reflesh_lock:
+            old_engines = []
+            if self.engine is not None:
+                old_engines.append((self.engine, self.metrics))
+                old_engines.extend((replica.engine, replica.metrics) for replica in self.replicas)
+            self.replica_policy = replica_policy
+            self.replica_pin_time = replica_pin_time
+            self.prewarm_size = prewarm
+            self.replicas = new_replicas
+            self.engine = engine
+            self.metrics = engine_metrics
+            self._pool = sessionmaker(bind=engine, autocommit=True)
+        for old_engine, old_metrics in old_engines:
+            _dispose_when_idle(old_engine, old_metrics, dispose_timeout)
+        if self.name:
+            _NAMED_POOLS[self.name] = self
         return True
 
+    def prewarm(self, size=None):
+        """
+        预先建立连接，避免启动后的首批请求承担建立连接的延迟
+
+        :param size: 每个引擎(主库、从库)预先建立的连接数量，默认为pool_prewarm配置，未配置时为pool_size
+        :type size: int
+        """
+        engines = [self.engine] + [replica.engine for replica in self.replicas]
+        for engine in engines:
+            _warm_engine(engine, size or self.prewarm_size or _default_pool_size(engine))
+
+    def get_metrics(self):
+        """
+        获取连接池指标
+
+        :returns: {'primary': 主库指标, 'replicas': {从库名称: 从库指标}}，指标详见PoolMetrics.to_dict
+        :rtype: dict
+        """
+        if self.metrics is None:
+            return None
+        replicas = {}
+        for replica in self.replicas:
+            replica_metrics = replica.metrics.to_dict()
+            replica_metrics['healthy'] = replica.healthy
+            replicas[replica.metrics.name] = replica_metrics
+        return {'primary': self.metrics.to_dict(), 'replicas': replicas}
+
+    def _create_engine(self, param):
+        connection = param.pop('connection')
+        engine = sqlalchemy.create_engine(connection, **param)
+        sqlalchemy.event.listen(engine, 'before_cursor_execute', _count_statement)
+        return engine
+
 
 @deco.singleton
 class DefaultDBPool(DBPool):
     '''
     默认db配置用的单例数据库连接池
     '''
-    pass
+    name = 'default'
+
+
+def get_pool(name):
+    """
+    获取具名连接池
+
+    :param name: 连接池名称，default代表defaultPool
+    :type name: str
+    :returns: 连接池，不存在时返回None
+    :rtype: DBPool
+    """
+    return _NAMED_POOLS.get(name)
+
+
+def prewarm(size=None):
+    """
+    预热所有具名连接池(defaultPool以及POOLS.*)，通常在initialize_db之后调用
+
+    :param size: 每个引擎预先建立的连接数量，默认为各连接池的pool_prewarm配置，未配置时为pool_size
+    :type size: int
+    """
+    for dbpool in list(_NAMED_POOLS.values()):
+        try:
+            dbpool.prewarm(size)
+        except Exception as e:
+            LOG.warning('failed to prewarm pool %s, reason: %s', dbpool.name, e)
+
+
+def metrics():
+    """
+    获取所有具名连接池(defaultPool以及POOLS.*)的指标
+
+    :returns: {连接池名称: DBPool.get_metrics()}
+    :rtype: dict
+    """
+    return dict((name, dbpool.get_metrics()) for name, dbpool in _NAMED_POOLS.items()
+                if dbpool.metrics is not None)
+
+
+_GAUGE_METRICS = ('pool_size', 'overflow', 'checked_out')
+_COUNTER_METRICS = ('connects', 'invalidations', 'disconnects', 'slow_queries')
+_HISTOGRAM_METRICS = (('checkout_wait', 'talos_db_pool_checkout_wait_seconds'), ('query', 'talos_db_query_seconds'))
+
+
+def _prometheus_samples(families, labels, data):
+    label_str = ','.join('%s="%s"' % (key, value) for key, value in labels)
+    for key in _GAUGE_METRICS:
+        if data[key] is not None:
+            families['talos_db_pool_%s' % key][1].append('talos_db_pool_%s{%s} %s' % (key, label_str, data[key]))
+    for key in _COUNTER_METRICS:
+        families['talos_db_pool_%s_total' % key][1].append(
+            'talos_db_pool_%s_total{%s} %s' % (key, label_str, data[key]))
+    for key, metric in _HISTOGRAM_METRICS:
+        histogram = data[key]
+        samples = families[metric][1]
+        for bound, count in histogram['buckets']:
+            samples.append('%s_bucket{%s,le="%s"} %s' % (metric, label_str, bound, count))
+        samples.append('%s_sum{%s} %s' % (metric, label_str, histogram['sum']))
+        samples.append('%s_count{%s} %s' % (metric, label_str, histogram['count']))
+
+
+def format_metrics():
+    """
+    以Prometheus文本格式输出所有具名连接池的指标
+
+    :returns: 指标文本
+    :rtype: str
+    """
+    # 同一指标的所有样本需要连续输出
+    families = collections.OrderedDict()
+    for key in _GAUGE_METRICS:
+        families['talos_db_pool_%s' % key] = ('gauge', [])
+    for key in _COUNTER_METRICS:
+        families['talos_db_pool_%s_total' % key] = ('counter', [])
+    for key, metric in _HISTOGRAM_METRICS:
+        families[metric] = ('histogram', [])
+    for name, data in sorted(metrics().items()):
+        _prometheus_samples(families, [('pool', name), ('role', 'primary')], data['primary'])
+        for replica_name, replica_data in sorted(data['replicas'].items()):
+            _prometheus_samples(families, [('pool', name), ('role', 'replica'), ('replica', replica_name)],
+                                replica_data)
+    lines = []
+    for metric, (metric_type, samples) in families.items():
+        if samples:
+            lines.append('# TYPE %s %s' % (metric, metric_type))
+            lines.extend(samples)
+    return '\n'.join(lines) + '\n'
 
 
 defaultPool = DefaultDBPool()
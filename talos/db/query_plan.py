@@ -0,0 +1,174 @@
+# coding=utf-8
+"""
+本模块提供ResourceBase的查询计划缓存
+
+查询计划以请求的"形态"作为键：过滤条件的字段/操作符/值类型、排序、relationship加载层级等，
+过滤值使用bindparam参数化，因此形态相同的请求可以复用预先构建好的query对象，仅需重新绑定参数值
+
+"""
+
+from __future__ import absolute_import
+
+import collections
+
+import sqlalchemy
+from sqlalchemy.orm import scoped_session
+from sqlalchemy.sql.expression import BinaryExpression
+
+from talos.core import utils
+
+
+class Unbindable(Exception):
+    """过滤条件无法参数化，对应形态的请求不能使用查询计划"""
+    pass
+
+
+class PlanValue(object):
+    """过滤值占位对象，index为值在提取列表中的位置"""
+    __slots__ = ('index', )
+
+    def __init__(self, index):
+        self.index = index
+
+
+# 无法参数化的形态，缓存此标记以避免重复尝试构建
+UNCACHEABLE = object()
+
+
+def _is_mapping_list(value):
+    return utils.is_list_type(value) and len(value) > 0 and all(
+        isinstance(v, collections.Mapping) for v in value)
+
+
+def extract(filters, offset=0):
+    """
+    提取过滤条件的形态，并将过滤值替换为PlanValue占位对象
+
+    * dict: 递归提取，key排序后作为形态
+    * 元素均为dict的列表(如$or, $and): 递归提取每个元素
+    * 列表: 每个元素为一个占位，列表长度作为形态
+    * None/空列表: 原样保留，其值本身即为形态
+    * 其他: 一个占位，值类型作为形态
+
+    :param filters: 过滤条件
+    :type filters: dict
+    :param offset: 占位对象位置的起始值，多组过滤条件共用一个过滤值列表时使用
+    :type offset: int
+    :returns: (形态, 占位后的过滤条件, 过滤值列表)
+    :rtype: tuple
+    """
+    values = []
+
+    def _extract(value):
+        if isinstance(value, collections.Mapping):
+            shapes = []
+            marked = {}
+            for key in sorted(value):
+                shape, marked[key] = _extract(value[key])
+                shapes.append((key, shape))
+            return ('m', tuple(shapes)), marked
+        if _is_mapping_list(value):
+            shapes = []
+            marked = []
+            for item in value:
+                shape, marked_item = _extract(item)
+                shapes.append(shape)
+                marked.append(marked_item)
+            return ('lm', tuple(shapes)), marked
+        if utils.is_list_type(value):
+            if len(value) == 0:
+                return ('l', 0), value
+            marked = []
+            for item in value:
+                marked.append(PlanValue(offset + len(values)))
+                values.append(item)
+            return ('l', len(marked)), marked
+        if value is None:
+            return ('n', ), None
+        values.append(value)
+        return ('s', type(value).__name__), PlanValue(offset + len(values) - 1)
+
+    shape, marked = _extract(filters or {})
+    return shape, marked, values
+
+
+class Binder(object):
+    """构建查询计划时，将占位对象转换为bindparam，并记录参数与过滤值的对应关系"""
+
+    def __init__(self):
+        # [(值位置, 参数名, 值模板)]
+        self.slots = []
+
+    def _param(self, value, templ, type_):
+        name = 'talos_plan_%d' % value.index
+        self.slots.append((value.index, name, templ))
+        return sqlalchemy.bindparam(name, type_=type_)
+
+    def bind(self, handler, op, column, value):
+        """
+        将占位值转换为bindparam
+
+        :param handler: 列类型对应的Filter对象
+        :type handler: `talos.db.filter_wrapper.NullFilter`
+        :param op: 过滤条件，如None, eq, ne, gt, gte, lt, lte 等
+        :type op: str
+        :param column: 列对象
+        :type column: `ColumnAttribute`
+        :param value: 过滤值(含占位对象)
+        :type value: any
+        :returns: 可传递给Filter对象的值
+        :rtype: any
+        :raises: Unbindable
+        """
+        # None/空列表的值本身即为形态，原样使用
+        if value is None or (utils.is_list_type(value) and len(value) == 0):
+            return value
+        is_list = utils.is_list_type(value) and all(isinstance(v, PlanValue) for v in value)
+        if not is_list and not isinstance(value, PlanValue):
+            raise Unbindable()
+        # bindable_ops仅在Filter类自身声明时生效，自定义子类未声明时仍接收原始过滤值
+        bindable_ops = type(handler).__dict__.get('bindable_ops', {})
+        if op not in bindable_ops or isinstance(column, BinaryExpression):
+            raise Unbindable()
+        templ = bindable_ops[op]
+        type_ = None if templ else getattr(column, 'type', None)
+        if is_list:
+            return [self._param(v, templ, type_) for v in value]
+        return self._param(value, templ, type_)
+
+
+class QueryPlan(object):
+    """预先构建的query对象以及参数绑定信息"""
+
+    def __init__(self, query, slots):
+        self.query = query
+        self.slots = slots
+
+    def bind(self, session, values):
+        """
+        将过滤值绑定到query，并关联session
+
+        :param session: session对象
+        :type session: session/scoped_session
+        :param values: extract提取的过滤值列表
+        :type values: list
+        :returns: query对象
+        :rtype: query
+        """
+        params = {}
+        for index, name, templ in self.slots:
+            value = values[index]
+            params[name] = value if templ is None else templ % value
+        # scoped_session仅为注册器代理，需要绑定其实际的session
+        if isinstance(session, scoped_session):
+            session = session()
+        query = self.query.with_session(session)
+        if params:
+            query = query.params(params)
+        return query
+
+
+def make_key(*args):
+    """生成查询计划的键，list类型参数转换为tuple"""
+    return tuple(tuple(arg) if isinstance(arg, list) else arg for arg in args)
+
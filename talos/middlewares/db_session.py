@@ -0,0 +1,25 @@
+# coding=utf-8
+"""
+本模块提供请求级数据库会话中间件
+
+"""
+from __future__ import absolute_import
+
+from talos.db import pool
+
+
+class RequestSession(object):
+    """
+    中间件，每个请求对每个连接池最多获取一个连接(首次使用时)，请求内ResourceBase的读取操作均复用此连接，
+    请求结束后归还连接池，减少高并发下的连接获取次数以及连接池竞争
+    事务(ResourceBase.transaction)仍然使用独立的连接，以保证提交/回滚的边界不受请求影响
+
+    依赖GlobalVars中间件(默认加载)，需要放置在其之后
+    流式响应(resp.stream)在中间件之后才读取数据，此时请求级会话已结束，自动使用普通会话
+    """
+
+    def process_request(self, req, resp):
+        pool.begin_request_scope(req.context)
+
+    def process_response(self, req, resp, resource, *args, **kwargs):
+        pool.end_request_scope(req.context)
@@ -0,0 +1,46 @@
+# coding=utf-8
+"""
+本模块提供请求级SQL语句计数中间件
+
+"""
+from __future__ import absolute_import
+
+import logging
+
+from talos.db import pool
+
+LOG = logging.getLogger(__name__)
+
+
+class StatementCounter(object):
+    """
+    中间件，统计每个请求执行的SQL语句数量，写入响应头并记录日志，用于检查N+1查询
+    注意：流式响应(resp.stream)在中间件之后才读取数据，其语句不计入统计
+
+    StatementCounter(header='X-DB-Statement-Count', warning_threshold=20)
+    """
+
+    def __init__(self, header='X-DB-Statement-Count', warning_threshold=None):
+        """
+        :param header: 响应头名称，None则不写入响应头
+        :type header: str
+        :param warning_threshold: 语句数量超过此值时记录warning日志，None则仅记录debug日志
+        :type warning_threshold: int
+        """
+        self.header = header
+        self.warning_threshold = warning_threshold
+
+    def process_request(self, req, resp):
+        req.context['db_statement_counter'] = pool.StatementCounter().start()
+
+    def process_response(self, req, resp, resource, *args, **kwargs):
+        counter = req.context.get('db_statement_counter', None)
+        if counter is None:
+            return
+        count = counter.stop()
+        if self.header:
+            resp.set_header(self.header, str(count))
+        if self.warning_threshold is not None and count > self.warning_threshold:
+            LOG.warning('%s %s executed %d sql statements', req.method, req.path, count)
+        else:
+            LOG.debug('%s %s executed %d sql statements', req.method, req.path, count)
@@ -22,6 +22,8 @@ from talos.core import xmlutils
 from talos.middlewares import lazy_init
 
 LOG = logging.getLogger(__name__)
+# falcon 3.0+的HTTPError序列化接口返回bytes，且to_json会传入handler参数
+FALCON_3 = int(falcon.__version__.split('.', 1)[0]) >= 3
 
 if six.PY2:
     reload(sys)
@@ -46,13 +48,19 @@ class EnhancedHTTPError(falcon.HTTPError):
             obj.update(self._extra_data)
         return obj
 
-    def to_json(self):
+    def to_json(self, handler=None):
         data = self.to_dict(OrderedDict)
-        return json.dumps(data, cls=utils.ComplexEncoder)
+        content = json.dumps(data, cls=utils.ComplexEncoder)
+        if FALCON_3:
+            return content.encode('utf-8')
+        return content
 
     def to_xml(self):
         data = self.to_dict(OrderedDict)
-        return xmlutils.toxml(data, root_tag='error')
+        content = xmlutils.toxml(data, root_tag='error')
+        if FALCON_3 and not isinstance(content, bytes):
+            return content.encode('utf-8')
+        return content
 
 
 def error_http_exception(ex, req, resp, params):
@@ -113,7 +121,10 @@ def error_serializer(req, resp, exception):
         representation = exception.to_json()
     else:
         representation = exception.to_xml()
-    resp.body = representation
+    if isinstance(representation, bytes):
+        resp.data = representation
+    else:
+        resp.body = representation
     resp.content_type = preferred
 
 
@@ -147,10 +158,21 @@ def initialize_db():
             db_confs = CONF.dbs.to_dict()
             conns = {}
             for name, param in db_confs.items():
-                conns[name] = pool.DBPool(param=param)
+                # 重复初始化时(如重新加载配置)平滑切换已有连接池，仅在POOLS中查找，不会误取defaultPool
+                dbpool = pool.POOLS.get(name)
+                if dbpool is None:
+                    # 具名连接池(指标等)中default为defaultPool的名称，避免冲突
+                    pool_name = name if name != pool.defaultPool.name else 'dbs.%s' % name
+                    dbpool = pool.DBPool(param=param, name=pool_name)
+                else:
+                    dbpool.reflesh(param=param)
+                conns[name] = dbpool
             pool.POOLS.set_options(conns)
     except AttributeError:
         LOG.warning("config dbs not set, skip")
+    # selectinload分批数量为进程级设置，仅在此处设置一次
+    from talos.db import crud
+    crud.setup_selectin_batch_size()
 
 
 def initialize_applications(api):
@@ -9,6 +9,12 @@ class CollectionUser(controller.CollectionController):
     resource = api.User
 
 
+class CollectionSinglePassUser(controller.CollectionController):
+    name = 'singlepass.users'
+    resource = api.User
+    single_pass_count = True
+
+
 class ItemUser(controller.ItemController):
     name = 'user'
     resource = api.User
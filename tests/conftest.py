@@ -0,0 +1,10 @@
+# coding=utf-8
+
+from __future__ import absolute_import
+
+import sys
+
+# 异步相关测试使用async/await语法，需要Python 3.7+
+collect_ignore = []
+if sys.version_info < (3, 7):
+    collect_ignore.append('test_async.py')
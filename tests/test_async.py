@@ -0,0 +1,129 @@
+# coding=utf-8
+
+from __future__ import absolute_import
+
+import asyncio
+
+import pytest
+
+pytest.importorskip('sqlalchemy.ext.asyncio')
+pytest.importorskip('aiosqlite')
+
+from talos.db import async_crud
+from talos.db import crud
+from talos.db import async_pool
+from talos.db import pool
+
+from tests import models
+
+
+def _dbpool():
+    return async_pool.AsyncDBPool(param={'connection': 'sqlite+aiosqlite:///tests/unittest.sqlite3'})
+
+
+class _AsyncUser(async_crud.AsyncResourceBase):
+    orm_meta = models.User
+    _primary_keys = 'id'
+    _default_order = ['id']
+
+
+def test_async_resource():
+
+    async def _run():
+        dbpool = _dbpool()
+        resource = _AsyncUser(dbpool=dbpool)
+        users = await resource.list(filters={'department_id': '1'})
+        assert [u['name'] for u in users] == ['Deke', 'Jacob']
+        assert await resource.count(filters={'age': {'gt': 10}}) == 2
+        count, users = await resource.list_with_count(limit=1)
+        assert count == 4 and len(users) == 1
+        user = await resource.get('1')
+        assert user['name'] == 'Deke' and user['department']['name']
+        version = crud.model_version(models.User)
+        created = await resource.create({'id': '100', 'name': 'Async', 'department_id': '1'})
+        assert created['name'] == 'Async'
+        # 提交后的缓存失效在线程池中执行
+        assert crud.model_version(models.User) != version
+        before, after = await resource.update('100', {'age': 30})
+        assert after['age'] == 30
+        async with resource.transaction() as session:
+            await _AsyncUser(transaction=session).update('100', {'age': 31})
+            await resource.update('100', {'name': 'Async2'})
+        assert (await resource.get('100'))['age'] == 31
+        count, deleted = await resource.delete('100')
+        assert count == 1 and (await resource.get('100')) is None
+        # 多个查询可以同时进行
+        results = await asyncio.gather(*[resource.get(str(i)) for i in range(1, 5)])
+        assert [r['id'] for r in results] == ['1', '2', '3', '4']
+        # 分批读取
+        refs = [ref async for ref in resource.iter_list(batch_size=1)]
+        assert [r['id'] for r in refs] == ['1', '2', '3', '4']
+        refs = [ref async for ref in resource.iter_list(offset=1, limit=2, batch_size=3)]
+        assert [r['id'] for r in refs] == ['2', '3']
+        await dbpool.dispose()
+
+    asyncio.run(_run())
+
+
+def test_async_controller():
+    pytest.importorskip('falcon.asgi')
+    import falcon.asgi
+    import falcon.testing
+    from talos.common import async_controller
+
+    # asyncio.run结束后会清除当前事件循环，TestClient需要可用的事件循环
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    dbpool = _dbpool()
+
+    class _Collection(async_controller.AsyncCollectionController):
+        name = 'users'
+        resource = _AsyncUser
+
+        def make_resource(self, req):
+            return self.resource(dbpool=dbpool)
+
+    class _Item(async_controller.AsyncItemController):
+        name = 'user'
+        resource = _AsyncUser
+
+        def make_resource(self, req):
+            return self.resource(dbpool=dbpool)
+
+    app = falcon.asgi.App()
+    # 使用falcon 3默认的错误序列化
+    app.add_error_handler(Exception, async_controller.error_http_exception)
+    app.add_route('/v1/users', _Collection())
+    app.add_route('/v1/users/{rid}', _Item())
+    client = falcon.testing.TestClient(app)
+    resp = client.simulate_get('/v1/users', params={'department_id': '2'})
+    assert resp.json['count'] == 2
+    assert set(u['name'] for u in resp.json['data']) == set(['Rachel', 'Paco'])
+    assert client.simulate_get('/v1/users/1').json['name'] == 'Deke'
+    resp = client.simulate_get('/v1/users/not_exist')
+    assert resp.status_code == 404 and resp.json['code'] == 404
+    _Collection.stream_list = True
+    resp = client.simulate_get('/v1/users', params={'department_id': '1'})
+    assert [u['name'] for u in resp.json['data']] == ['Deke', 'Jacob']
+    _Collection.stream_list = None
+    resp = client.simulate_post('/v1/users', json={'id': '101', 'name': 'Async', 'department_id': '1'})
+    assert resp.status_code == 201
+    assert client.simulate_patch('/v1/users/101', json={'age': 5}).json['age'] == 5
+    assert client.simulate_delete('/v1/users/101').json['count'] == 1
+    asyncio.get_event_loop().run_until_complete(dbpool.dispose())
+
+
+def test_async_pool_metrics():
+
+    async def _run():
+        dbpool = async_pool.AsyncDBPool(param={'connection': 'sqlite+aiosqlite:///tests/unittest.sqlite3'},
+                                        name='unittest_async')
+        try:
+            await _AsyncUser(dbpool=dbpool).count()
+            assert pool.get_pool('unittest_async') is dbpool
+            assert pool.metrics()['unittest_async']['primary']['query']['count'] >= 1
+        finally:
+            pool._NAMED_POOLS.pop('unittest_async', None)
+            await dbpool.dispose()
+
+    asyncio.run(_run())
+    assert async_pool.defaultPool.name == 'async.default'
@@ -2,8 +2,11 @@
 
 from __future__ import absolute_import
 
+import threading
 import time
 
+import pytest
+
 from talos.common import cache
 
 
@@ -30,3 +33,304 @@ def test_cache():
     ret = cache.get(key)
     assert cache.validate(ret) is False
 
+
+def test_near_cache():
+    metrics = cache._Metrics()
+    # 模拟共享同一后端的两个进程
+    near_a = cache.NearCache(cache.CACHE, ttl=60, metrics=metrics)
+    near_b = cache.NearCache(cache.CACHE, ttl=60, metrics=metrics)
+    key = 'talos.unittest.near.1'
+    near_a.set(key, 'v1')
+    assert near_a.get(key, 60) == 'v1'
+    assert metrics.to_dict() == {'local_hits': 1, 'remote_hits': 0, 'misses': 0}
+    assert near_b.get(key, 60) == 'v1'
+    assert near_b.get(key, 60) == 'v1'
+    assert metrics.to_dict() == {'local_hits': 2, 'remote_hits': 1, 'misses': 0}
+    # 未设置进程间失效时，其他进程的写入在ttl后可见
+    near_a.set(key, 'v2')
+    assert near_b.get(key, 60) == 'v1'
+    near_b.ttl = 0
+    time.sleep(0.01)
+    assert near_b.get(key, 60) == 'v2'
+    # 本地缓存同样遵循过期时间
+    time.sleep(0.2)
+    assert near_a.get(key, 0.1) is cache.NO_VALUE
+    near_a.delete(key)
+    assert cache.validate(near_b.get(key)) is False
+
+
+def test_near_cache_version_invalidation():
+    near_a = cache.NearCache(cache.CACHE, ttl=60, invalidation=cache.INVALIDATION_VERSION, check_interval=0)
+    near_b = cache.NearCache(cache.CACHE, ttl=60, invalidation=cache.INVALIDATION_VERSION, check_interval=0)
+    key = 'talos.unittest.near.2'
+    near_a.set(key, 'v1')
+    assert near_b.get(key, 60) == 'v1'
+    near_a.set(key, 'v2')
+    assert near_b.get(key, 60) == 'v2'
+    assert near_b.metrics.remote_hits == 2
+    near_a.delete(key)
+    assert cache.validate(near_b.get(key, 60)) is False
+
+
+class _FakeRedis(object):
+    """模拟redis发布订阅，首个订阅连接在收到消息前断开"""
+
+    def __init__(self):
+        self.published = []
+        self.pubsubs = []
+
+    def publish(self, channel, message):
+        self.published.append((channel, message))
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        pubsub = _FakePubSub(self, disconnect=not self.pubsubs)
+        self.pubsubs.append(pubsub)
+        return pubsub
+
+
+class _FakePubSub(object):
+
+    def __init__(self, client, disconnect=False):
+        self.client = client
+        self.disconnect = disconnect
+
+    def subscribe(self, channel):
+        pass
+
+    def close(self):
+        pass
+
+    def listen(self):
+        if self.disconnect:
+            raise IOError('connection reset')
+        while True:
+            if self.client.published:
+                channel, message = self.client.published.pop(0)
+                yield {'data': message}
+            time.sleep(0.01)
+
+
+class _FakeRegion(object):
+
+    def __init__(self):
+        self.backend = type('Backend', (object, ), {'client': _FakeRedis()})()
+        self.expiration_time = 60
+
+    def set(self, key, value):
+        pass
+
+
+def test_near_cache_pubsub_invalidation():
+    region = _FakeRegion()
+    client = region.backend.client
+    writer = cache.NearCache(region, ttl=60, invalidation=cache.INVALIDATION_PUBSUB, check_interval=0.01)
+    # 仅写入(从未读取/订阅)的进程同样发布失效消息
+    writer.set('talos.unittest.pubsub', 'v1')
+    assert len(client.published) == 1
+    client.published = []
+    reader = cache.NearCache(region, ttl=60, invalidation=cache.INVALIDATION_PUBSUB, check_interval=0.01)
+    reader._sync()
+    # 订阅断开后重新订阅，仍能收到失效消息
+    for i in range(100):
+        if len(client.pubsubs) > 1:
+            break
+        time.sleep(0.01)
+    assert len(client.pubsubs) == 2
+    reader.local.set('talos.unittest.pubsub', (time.time(), time.time(), 'v1'))
+    writer.set('talos.unittest.pubsub', 'v2')
+    for i in range(100):
+        if reader.local.get('talos.unittest.pubsub') is None:
+            break
+        time.sleep(0.01)
+    assert reader.local.get('talos.unittest.pubsub') is None
+
+
+def test_cache_stats():
+    cache.METRICS.clear()
+    key = 'talos.unittest.3'
+    cache.delete(key)
+    cache.get(key, 60)
+    cache.set(key, 'val')
+    cache.get(key, 60)
+    stats = cache.stats()
+    assert stats['misses'] == 1 and stats['local_hits'] + stats['remote_hits'] == 1
+
+
+def test_get_or_create_single_creator():
+    key = 'talos.unittest.4'
+    cache.delete(key)
+    calls = []
+
+    def creator():
+        calls.append(1)
+        time.sleep(0.2)
+        return 'val'
+
+    results = []
+    workers = [threading.Thread(target=lambda: results.append(cache.get_or_create(key, creator, expires=60)))
+               for i in range(5)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert results == ['val'] * 5
+    assert len(calls) == 1
+    cache.delete(key)
+
+
+def test_get_or_create_stale_while_revalidate():
+    key = 'talos.unittest.5'
+    cache.delete(key)
+    values = iter(['v1', 'v2'])
+    cache.get_or_create(key, lambda: next(values), expires=0.1, stale=60)
+    time.sleep(0.2)
+    # 已过期，但仍在stale时间内，返回旧值并由后台刷新
+    assert cache.get_or_create(key, lambda: next(values), expires=0.1, stale=60) == 'v1'
+    for i in range(50):
+        if key not in cache._REFRESHING:
+            break
+        time.sleep(0.02)
+    assert cache.get(key, 60) == 'v2'
+    cache.delete(key)
+
+
+def test_get_or_create_without_metadata(monkeypatch):
+    key = 'talos.unittest.6'
+    cache.delete(key)
+    # 低版本dogpile无法获取创建时间，由后端按expires过期
+    monkeypatch.setattr(cache, '_METADATA_SUPPORTED', False)
+    values = iter(['v1', 'v2'])
+    assert cache.get_or_create(key, lambda: next(values), expires=0.1, stale=60) == 'v1'
+    assert cache.get_or_create(key, lambda: next(values), expires=0.1, stale=60) == 'v1'
+    time.sleep(0.2)
+    assert cache.get_or_create(key, lambda: next(values), expires=0.1, stale=60) == 'v2'
+    cache.delete(key)
+
+
+def test_get_or_create_jitter():
+    created_at = time.time()
+    ttls = [cache._jittered_expires('talos.unittest.jitter.%d' % i, created_at, 100, 0.2) for i in range(20)]
+    assert all(80 <= ttl <= 100 for ttl in ttls)
+    assert len(set(ttls)) > 1
+    # 同一条缓存的抖动是确定的
+    assert cache._jittered_expires('talos.unittest.jitter.0', created_at, 100, 0.2) == ttls[0]
+    assert cache._jittered_expires('talos.unittest.jitter.0', created_at, 100, 0) == 100
+
+
+def test_cache_multi():
+    keys = ['talos.unittest.multi.%d' % i for i in range(3)]
+    cache.delete_multi(keys)
+    assert cache.get_multi(keys, 60) == [cache.NO_VALUE] * 3
+    cache.set_multi({keys[0]: 'v0', keys[2]: 'v2'})
+    assert cache.get_multi(keys, 60) == ['v0', cache.NO_VALUE, 'v2']
+
+    requested = []
+
+    def creator_multi(missing):
+        requested.append(missing)
+        return dict((key, key.upper()) for key in missing if key != keys[1])
+
+    # 仅未命中的key交由creator生成，creator未返回的key不写入缓存
+    values = cache.get_or_create_multi(keys + [keys[1]], creator_multi, expires=60)
+    assert values == ['v0', cache.NO_VALUE, 'v2', cache.NO_VALUE]
+    assert requested == [[keys[1]]]
+    values = cache.get_or_create_multi(keys, lambda missing: [key.upper() for key in missing], expires=60)
+    assert values == ['v0', keys[1].upper(), 'v2']
+    assert cache.get(keys[1], 60) == keys[1].upper()
+    cache.delete_multi(keys)
+    assert cache.get_multi(keys, 60) == [cache.NO_VALUE] * 3
+
+
+def test_get_or_create_multi_single_creator():
+    keys = ['talos.unittest.multi.lock.%d' % i for i in range(3)]
+    cache.delete_multi(keys)
+    requested = []
+
+    def creator_multi(missing):
+        requested.extend(missing)
+        time.sleep(0.2)
+        return [key.upper() for key in missing]
+
+    results = []
+    # 各线程请求的key部分重叠，且顺序不同
+    workers = [threading.Thread(target=lambda ks=ks: results.append(cache.get_or_create_multi(ks, creator_multi,
+                                                                                         expires=60)))
+               for ks in (keys, list(reversed(keys)), keys[1:], keys[:1])]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert len(results) == 4
+    assert sorted(requested) == keys
+    assert cache.get_multi(keys, 60) == [key.upper() for key in keys]
+    cache.delete_multi(keys)
+
+
+def test_near_cache_multi():
+    near = cache.NearCache(cache.CACHE, ttl=60)
+    keys = ['talos.unittest.near.multi.%d' % i for i in range(2)]
+    cache.CACHE.set(keys[0], 'v0')
+    assert near.get_multi(keys, 60) == ['v0', cache.NO_VALUE]
+    assert near.metrics.to_dict() == {'local_hits': 0, 'remote_hits': 1, 'misses': 1}
+    near.set_multi({keys[1]: 'v1'})
+    assert near.get_multi(keys, 60) == ['v0', 'v1']
+    if cache._METADATA_SUPPORTED:
+        # 进程内缓存保留后端的创建时间，而非读取时间
+        assert near.local.get(keys[0])[1] == cache.CACHE.get_value_metadata(keys[0]).cached_time
+    assert near.metrics.local_hits == 2
+    near.delete_multi(keys)
+    assert near.get_multi(keys, 60) == [cache.NO_VALUE] * 2
+
+
+def test_cached_decorator():
+    calls = []
+
+    @cache.cached(expires=60, namespace='talos.unittest.cached')
+    def stats(dep_id, filters=None):
+        calls.append((dep_id, filters))
+        return {'dep_id': dep_id, 'count': len(calls)}
+
+    stats.invalidate_all()
+    ret = stats(1, filters={'age': {'gt': 18}, 'name': {'ilike': 'a'}})
+    # 字典参数按key排序生成key
+    assert stats(1, filters={'name': {'ilike': 'a'}, 'age': {'gt': 18}}) == ret
+    assert stats(2) != ret
+    assert len(calls) == 2
+    stats.invalidate(1, filters={'age': {'gt': 18}, 'name': {'ilike': 'a'}})
+    assert stats(1, filters={'age': {'gt': 18}, 'name': {'ilike': 'a'}})['count'] == 3
+    assert stats(2)['count'] == 2
+    cache.invalidate_namespace('talos.unittest.cached')
+    assert stats(2)['count'] == 4
+
+
+def test_namespace_generation_local_ttl():
+    namespace = 'talos.unittest.namespace'
+    generation = cache.namespace_generation(namespace)
+    # 其他进程使命名空间失效，namespace_ttl内仍使用进程内的代数
+    cache.set(cache._NAMESPACE_KEY % namespace, 'remote')
+    assert cache.namespace_generation(namespace) == generation
+    cache._NAMESPACE_GENERATIONS[namespace] = (0, generation)
+    assert cache.namespace_generation(namespace) == 'remote'
+    # 本进程的失效立即生效
+    cache.invalidate_namespace(namespace)
+    assert cache.namespace_generation(namespace) not in (generation, 'remote')
+
+
+def test_cached_method():
+    calls = []
+
+    class Resource(object):
+
+        @cache.cached(expires=60, cache_none=False, method=True)
+        def count(self, name):
+            calls.append(name)
+            return None if name == 'none' else len(calls)
+
+    Resource.count.invalidate_all()
+    # 不同实例共享缓存
+    assert Resource().count('a') == Resource().count('a') == 1
+    assert Resource().count('none') is None
+    assert Resource().count('none') is None
+    assert calls == ['a', 'none', 'none']
+    with pytest.raises(TypeError):
+        Resource().count(object())
@@ -4,10 +4,13 @@ import logging
 import requests
 import threading as concurrent
 import collections
+import json
+import re
 from wsgiref.simple_server import make_server
 
 from talos.core import config
 from talos.common import controller
+from talos.db import pool
 
 from tests import API, MockRequest
 
@@ -62,6 +65,179 @@ def test_list_user_params():
     p.join(WAIT_TIMEOUT)
 
 
+def test_list_user_single_pass():
+    from tests.apps.cats import controller as cats_controller
+
+    class _Response(object):
+        pass
+
+    req = MockRequest()
+    req.params = {'__limit': '1', '__orders': 'id', '__fields': 'id'}
+    resp = _Response()
+    cats_controller.CollectionSinglePassUser().on_get(req, resp)
+    assert resp.json['count'] == cats_controller.api.User().count()
+    assert resp.json['data'] == [{'id': '1'}]
+    # 精确统计时不返回count_strategy
+    assert 'count_strategy' not in resp.json
+
+
+def test_list_user_count_strategy():
+    from tests.apps.cats import controller as cats_controller
+
+    class _Response(object):
+        pass
+
+    class _CappedResource(cats_controller.api.User):
+        _count_strategy = 'capped'
+        _count_cap = 1
+
+    class _CountOnlyResource(object):
+        def count(self, filters=None):
+            return 42
+
+    class _CappedUser(cats_controller.CollectionUser):
+        resource = _CappedResource
+
+    class _CountOnlyUser(cats_controller.CollectionUser):
+        def make_resource(self, req):
+            return _CountOnlyResource()
+
+        def list(self, req, criteria, **kwargs):
+            return []
+
+    req = MockRequest()
+    req.params = {'__fields': 'id'}
+    resp = _Response()
+    _CappedUser().on_get(req, resp)
+    assert resp.json['count'] == 1
+    assert resp.json['count_strategy'] == 'capped'
+    # 资源未实现count_with_strategy时回退为count
+    _CountOnlyUser().on_get(req, resp)
+    assert resp.json == {'count': 42, 'data': []}
+
+
+def test_list_user_by_cursor():
+    from tests.apps.cats import controller as cats_controller
+
+    class _Response(object):
+        pass
+
+    req = MockRequest()
+    req.params = {'__limit': '2', '__orders': 'id', '__fields': 'id', '__cursor': ''}
+    resp = _Response()
+    cats_controller.CollectionUser().on_get(req, resp)
+    assert [u['id'] for u in resp.json['data']] == ['1', '2']
+    assert resp.json['next_cursor']
+    req.params = {'__limit': '2', '__orders': 'id', '__fields': 'id', '__offset': '1',
+                  '__cursor': resp.json['next_cursor']}
+    cats_controller.CollectionUser().on_get(req, resp)
+    assert resp.json['data'][0] == {'id': '3'}
+    req.params = {'__limit': '1', '__orders': 'id'}
+    cats_controller.CollectionUser().on_get(req, resp)
+    assert 'next_cursor' not in resp.json
+
+
+def test_list_user_fields_pushdown():
+    from tests.apps.cats import controller as cats_controller
+
+    class _Response(object):
+        pass
+
+    class _PushdownUser(cats_controller.CollectionUser):
+        fields_pushdown = True
+
+    req = MockRequest()
+    req.params = {'__orders': 'id', '__fields': ['id', 'unknown']}
+    resp = _Response()
+    _PushdownUser().on_get(req, resp)
+    users = cats_controller.api.User().list(orders=['id'])
+    assert resp.json['data'] == [{'id': u['id'], 'unknown': None} for u in users]
+
+
+def test_list_user_stream():
+    import json
+    from tests.apps.cats import controller as cats_controller
+
+    class _Response(object):
+        pass
+
+    class _StreamUser(cats_controller.CollectionUser):
+        stream_list = True
+        stream_chunk_size = 2
+
+    req = MockRequest()
+    req.params = {'__orders': 'id', '__fields': 'id'}
+    resp = _Response()
+    _StreamUser().on_get(req, resp)
+    assert not hasattr(resp, 'json')
+    chunks = list(resp.stream)
+    result = json.loads(b''.join(chunks).decode('utf-8'))
+    users = cats_controller.api.User().list(orders=['id'])
+    assert result['count'] == len(users)
+    assert 'count_strategy' not in result
+    assert result['data'] == [{'id': u['id']} for u in users]
+    # head + ceil(n/2) + tail
+    assert len(chunks) == 2 + (len(users) + 1) // 2
+
+
+def test_response_cache():
+    from tests.apps.cats import controller as cats_controller
+
+    class _Request(MockRequest):
+
+        def __init__(self, params, headers=None):
+            self.params = params
+            self.headers = headers or {}
+
+        def get_header(self, name):
+            return self.headers.get(name)
+
+    class _Response(object):
+        status = '200 OK'
+
+        def __init__(self):
+            self.headers = {}
+
+        def set_header(self, name, value):
+            self.headers[name] = value
+
+    class _CachedUsers(cats_controller.CollectionUser):
+        response_cache = True
+
+    class _CachedUser(cats_controller.ItemUser):
+        response_cache = True
+
+    resp = _Response()
+    _CachedUsers().on_get(_Request({'__orders': 'id'}), resp)
+    assert not hasattr(resp, 'json')
+    etag = resp.headers['ETag']
+    result = json.loads(resp.body)
+    assert result['count'] == cats_controller.api.User().count()
+    # 命中缓存，无需查询数据库
+    with pool.StatementCounter() as counter:
+        resp = _Response()
+        _CachedUsers().on_get(_Request({'__orders': 'id'}), resp)
+        assert json.loads(resp.body) == result and resp.headers['ETag'] == etag
+        resp = _Response()
+        _CachedUsers().on_get(_Request({'__orders': 'id'}, {'If-None-Match': etag}), resp)
+        assert resp.status == '304 Not Modified' and not hasattr(resp, 'body')
+    assert counter.count == 0
+    resp = _Response()
+    _CachedUser().on_get(_Request({}), resp, rid='1')
+    assert json.loads(resp.body)['name'] == 'Deke'
+    # 写入后缓存失效
+    cats_controller.api.User().update('1', {'name': 'Deke2'})
+    try:
+        resp = _Response()
+        _CachedUser().on_get(_Request({}), resp, rid='1')
+        assert json.loads(resp.body)['name'] == 'Deke2'
+        resp = _Response()
+        _CachedUsers().on_get(_Request({'__orders': 'id'}, {'If-None-Match': etag}), resp)
+        assert resp.status == '200 OK' and resp.headers['ETag'] != etag
+    finally:
+        cats_controller.api.User().update('1', {'name': 'Deke'})
+
+
 def test_get_user():
     l = concurrent.Lock()
     p = start_server(l)
@@ -88,6 +264,36 @@ def test_create_user():
     assert result[0] == 1 and result[1][0]['id'] == '9999'
 
 
+def test_bulk_user():
+    from tests.apps.cats import controller as cats_controller
+
+    class _Response(object):
+        pass
+
+    class _BulkUser(cats_controller.CollectionUser):
+        allow_methods = ('GET', 'POST', 'PATCH', 'DELETE')
+
+    req = MockRequest()
+    req.method = 'POST'
+    req.json = [{'id': '9998', 'name': 'talos1', 'age': 1, 'department_id': '1'},
+                {'id': '9999', 'name': 'talos2', 'department_id': '2'}]
+    resp = _Response()
+    _BulkUser().on_post(req, resp)
+    assert resp.json['count'] == 2
+    assert [u['id'] for u in resp.json['data']] == ['9998', '9999']
+
+    req.method = 'PATCH'
+    req.json = [{'id': '9998', 'age': 2}, {'id': '9999', 'age': 3}]
+    _BulkUser().on_patch(req, resp)
+    assert [u['age'] for u in resp.json['data']] == [2, 3]
+
+    req.method = 'DELETE'
+    req.json = ['9998', '9999']
+    _BulkUser().on_delete(req, resp)
+    assert resp.json['count'] == 2
+    assert cats_controller.api.User().count({'id': ['9998', '9999']}) == 0
+
+
 def test_method_not_allow():
     l = concurrent.Lock()
     p = start_server(l)
@@ -212,6 +418,31 @@ def test_criteria_supported():
     assert criteria['filters'] == {}
 
 
+def test_criteria_supported_matcher():
+    supported_filters = ['name(__(ilike|lte))?$', 'age__gt', r'(?P<col>id)__(?P=col)$']
+    keys = ['name', 'name__ilike', 'name__ne', 'age', 'age__gt', 'age__gte', 'id__id', 'id__ne', 'nickname']
+    matcher = controller._filter_matcher(supported_filters)
+    assert matcher is controller._filter_matcher(supported_filters)
+    patterns = [re.compile(f) for f in supported_filters]
+    for key in keys:
+        expected = key in supported_filters or any(p.match(key) for p in patterns)
+        assert matcher.match(key) == expected
+    # 同名命名分组无法合并，逐个匹配
+    matcher = controller._filter_matcher(['(?P<f>name)$', '(?P<f>age)$'])
+    assert matcher.match('age') and not matcher.match('nickname')
+
+    class _Controller(controller.Controller):
+        supported_filters = ['name__ilike']
+
+    req = MockRequest()
+    req.params = collections.OrderedDict()
+    req.params['name__ilike'] = 'a'
+    req.params['name__ne'] = 'a'
+    req.params['name[0]'] = 'b'
+    assert _Controller()._build_criteria(req)['filters'] == {'name': {'ilike': 'a'}}
+    assert _Controller()._build_criteria(req, [])['filters'] == {'name': ['b']}
+
+
 def test_criteria_unsupported_as_empty():
     try:
         origin_conf_val = CONF.dbcrud.unsupported_filter_as_empty
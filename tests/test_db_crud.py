@@ -1,8 +1,14 @@
 # coding=utf-8
 
 import logging
+import threading
+import time
+
+import sqlalchemy
+import sqlalchemy.event
 
 from talos.db import crud
+from talos.db import pool
 from talos.core import config
 
 from tests import models
@@ -107,4 +113,279 @@ def test_crud_inner_hooks():
     assert ref._unittest_checks['_before_delete']['rid'] == '9999'
     assert ref._unittest_checks['_addtional_delete']['resource']['name'] == 'test_crud_inner_hooks2'
     assert ref._unittest_checks['_addtional_delete']['resource']['owner_dep']
-    assert ref._unittest_checks['_addtional_delete']['resource']['create_user']
\ No newline at end of file
+    assert ref._unittest_checks['_addtional_delete']['resource']['create_user']
+
+def test_crud_many():
+    ref = _Business()
+    try:
+        with ref.transaction():
+            created = ref.create_many([
+                {'id': '9998', 'name': 'test_crud_many_1', 'owner_dep_id': '1', 'create_user_id': '1'},
+                {'id': '9999', 'name': 'test_crud_many_2', 'owner_dep_id': '2', 'create_user_id': '1'},
+            ], chunk_size=1)
+            assert [c['name'] for c in created] == ['test_crud_many_1', 'test_crud_many_2']
+            assert created[1]['owner_dep'] == {'id': '2', 'name': u'业务部'}
+            assert ref._unittest_checks['_addtional_create']['created']['id'] == '9999'
+            results = ref.update_many([
+                {'id': '9999', 'name': 'test_crud_many_3'},
+                {'id': '9997', 'name': 'not_exists'},
+                {'id': '9998', 'name': 'test_crud_many_4'},
+            ])
+            assert results[0][0]['name'] == 'test_crud_many_2'
+            assert results[0][1]['name'] == 'test_crud_many_3'
+            assert results[1] == (None, None)
+            assert results[2][1]['name'] == 'test_crud_many_4'
+            assert ref._unittest_checks['_addtional_update']['rid'] == '9998'
+            assert ref.count({'id': ['9998', '9999'], 'name': {'starts': 'test_crud_many_'}}) == 2
+            count, deleted = ref.delete_many(['9998', '9999', '9997'], filters={'name': 'test_crud_many_3'})
+            assert count == 1
+            assert deleted[0]['id'] == '9999'
+            assert ref._unittest_checks['_addtional_delete']['resource']['id'] == '9999'
+            assert ref.count({'id': ['9998', '9999']}) == 1
+            raise ValueError('force rollback')
+    except ValueError as e:
+        LOG.exception(e)
+    assert ref.count({'id': ['9998', '9999']}) == 0
+
+
+class _Department(crud.ResourceBase):
+    orm_meta = models.Department
+
+
+def _count_statements(ref, func):
+    statements = []
+
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with ref.get_session() as session:
+        engine = session.get_bind()
+    sqlalchemy.event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    try:
+        result = func()
+    finally:
+        sqlalchemy.event.remove(engine, 'before_cursor_execute', _before_cursor_execute)
+    return result, [s for s in statements if not s.startswith(('BEGIN', 'COMMIT', 'ROLLBACK'))]
+
+
+def test_write_without_refresh():
+    dep = _Department()
+    bus = _Business()
+    try:
+        with dep.transaction() as session:
+            dep = _Department(transaction=session)
+            bus = _Business(transaction=session)
+            created, statements = _count_statements(dep, lambda: dep.create({'id': '9999', 'name': 'dep'}, detail=False))
+            assert created == {'id': '9999', 'name': 'dep'}
+            assert len(statements) == 1
+            result, statements = _count_statements(dep, lambda: dep.update('9999', {'name': 'dep2'}, detail=False))
+            assert result[1] == {'id': '9999', 'name': 'dep2'}
+            assert len(statements) == 2
+            # relationship已加载且外键未更改，无需refresh
+            result, statements = _count_statements(bus, lambda: bus.update('1', {'name': 'bus2'}))
+            assert result[1]['name'] == 'bus2'
+            assert len(statements) == 2
+            # 外键更改，relationship需要重新加载
+            result, statements = _count_statements(bus, lambda: bus.update('1', {'owner_dep_id': '9999'}))
+            assert result[1]['owner_dep'] == {'id': '9999', 'name': 'dep2'}
+            raise ValueError('force rollback')
+    except ValueError as e:
+        LOG.exception(e)
+    assert _Department().get('9999') is None
+
+
+class _AddressedUser(crud.ResourceBase):
+    orm_meta = models.User
+    _primary_keys = 'id'
+
+    def _addtional_create(self, session, resource, created):
+        session.add(models.Address(id=created['id'] + '-1', location='loc', user_id=created['id']))
+        session.flush()
+
+
+def test_create_hook_refresh():
+    try:
+        with _AddressedUser().transaction() as session:
+            ref = _AddressedUser(transaction=session)
+            created = ref.create({'id': '9999', 'name': 'hooked', 'department_id': '1'})
+            # _addtional_create写入的关联记录体现在返回值中
+            assert [addr['id'] for addr in created['addresses']] == ['9999-1']
+            raise ValueError('force rollback')
+    except ValueError as e:
+        LOG.exception(e)
+
+
+class _PlainBusiness(crud.ResourceBase):
+    orm_meta = models.Business
+
+
+class _HookedBusiness(_PlainBusiness):
+
+    def _addtional_delete_all(self, session, resources):
+        self.deleted = resources
+
+
+def test_delete_all_returning():
+    resources = [{'id': '999%d' % i, 'name': 'test_delete_all', 'owner_dep_id': '1', 'create_user_id': '1'}
+                 for i in range(5)]
+    filters = {'name': 'test_delete_all'}
+    try:
+        with _PlainBusiness().transaction() as session:
+            ref = _PlainBusiness(transaction=session)
+            ref.create_many(resources)
+            count, records = ref.delete_all(filters, returning='keys', batch_size=2)
+            assert count == 5
+            assert sorted(records, key=lambda r: r['id']) == [{'id': r['id']} for r in resources]
+            ref.create_many(resources)
+            assert ref.delete_all(filters, returning='none') == (5, [])
+            ref.create_many(resources)
+            assert ref.delete_all(filters, returning='none', batch_size=3) == (5, [])
+            ref.create_many(resources)
+            count, records = ref.delete_all(filters, returning='keys')
+            assert count == 5 and len(records) == 5
+            ref.create_many(resources)
+            count, records = ref.delete_all(filters, returning='records', batch_size=2)
+            assert count == 5 and records[0]['owner_dep']['id'] == '1'
+            # 重写了_addtional_delete_all时始终返回记录
+            hooked = _HookedBusiness(transaction=session)
+            hooked.create_many(resources)
+            count, records = hooked.delete_all(filters, returning='none')
+            assert count == 5 and len(records) == 5 and hooked.deleted == records
+            raise ValueError('force rollback')
+    except ValueError as e:
+        LOG.exception(e)
+
+
+def test_list_fields_pushdown():
+    bus = _PlainBusiness()
+    full = bus.list()
+    results, statements = _count_statements(bus, lambda: bus.list(fields=['id', 'name']))
+    assert results == [{'id': r['id'], 'name': r['name']} for r in full]
+    assert len(statements) == 1
+    assert 'JOIN' not in statements[0] and 'owner_dep_id' not in statements[0]
+    # 请求的relationship依然被join，并额外加载其外键列
+    results, statements = _count_statements(bus, lambda: bus.list(fields=['id', 'owner_dep']))
+    assert results == [{'id': r['id'], 'owner_dep': r['owner_dep']} for r in full]
+    assert len(statements) == 1
+    assert 'JOIN department' in statements[0] and 'JOIN user' not in statements[0]
+    result, statements = _count_statements(bus, lambda: bus.get('1', fields=['name']))
+    assert result == {'name': full[0]['name']}
+    assert 'JOIN' not in statements[0]
+
+
+class _User(crud.ResourceBase):
+    orm_meta = models.User
+    _primary_keys = 'id'
+
+
+def test_adaptive_load():
+    joined = _User(dynamic_load_method='joinedload')
+    adaptive = _User(dynamic_load_method=crud.LOAD_ADAPTIVE)
+    with pool.StatementCounter(record=True) as counter:
+        result = adaptive.get('1')
+    assert result == joined.get('1')
+    # 多对一join，集合使用IN批量查询
+    assert counter.count == 2
+    assert 'JOIN department' in counter.statements[0] and 'address' not in counter.statements[0]
+    assert ' IN ' in counter.statements[1]
+    # 语句数量与记录数量无关
+    with pool.StatementCounter() as counter:
+        results = adaptive.list()
+    assert results == joined.list()
+    assert counter.count <= 2
+
+
+class _CachedUser(_User):
+    _entity_cache = True
+
+    def __init__(self, *args, **kwargs):
+        super(_CachedUser, self).__init__(*args, **kwargs)
+        self._unittest_loads = []
+
+    def _get_entity(self, rid, fields=None, readonly=True):
+        self._unittest_loads.append(rid)
+        # 放大并发加载的时间窗口
+        time.sleep(0.05)
+        return super(_CachedUser, self)._get_entity(rid, fields=fields, readonly=readonly)
+
+
+def test_entity_cache():
+    ref = _CachedUser()
+    result = ref.get('1')
+    assert result == _User().get('1')
+    partial = _User().get('1', fields=['id', 'department'])
+    with pool.StatementCounter() as counter:
+        cached = ref.get('1')
+        assert cached == result
+        # 返回的是副本
+        cached['name'] = 'changed'
+        assert ref.get('1')['name'] == result['name']
+        assert ref.get('1', fields=['id', 'department']) == partial
+    assert counter.count == 0
+    assert ref._unittest_loads == ['1']
+    ref.get('2')
+    try:
+        ref.update('1', {'age': 99})
+        assert ref.get('1')['age'] == 99
+        # 写入仅失效对应主键的实体缓存
+        ref._unittest_loads = []
+        with pool.StatementCounter() as counter:
+            ref.get('2')
+        assert counter.count == 0 and ref._unittest_loads == []
+        # 关联model变更后同样失效
+        _Department().update('1', {'name': 'dep_changed'})
+        assert ref.get('1')['department']['name'] == 'dep_changed'
+    finally:
+        ref.update('1', {'age': result['age']})
+        _Department().update('1', {'name': result['department']['name']})
+    assert ref.get('1') == result
+
+
+def test_entity_cache_default_filter():
+    ref = _CachedUser()
+    assert ref.get('1')['department_id'] == '1'
+    # 实例级default_filter(如按租户隔离)不能命中其他实例缓存的记录
+    scoped = _CachedUser()
+    scoped._default_filter = {'department_id': '2'}
+    assert scoped.get('1') is None
+    assert scoped._unittest_loads == ['1']
+    other = _CachedUser()
+    other._default_filter = {'department_id': '1'}
+    assert other.get('1') == ref.get('1')
+
+
+def test_version_invalidation_disabled(monkeypatch):
+    from talos.common import cache
+    writes = []
+    monkeypatch.setattr(crud, '_VERSION_INVALIDATION', [False])
+    monkeypatch.setattr(cache, 'set', lambda key, value: writes.append(key))
+    monkeypatch.setattr(cache, 'delete_multi', lambda keys: writes.extend(keys))
+    ref = _User()
+    age = ref.get('2')['age']
+    try:
+        # 未使用基于版本的缓存时，写入无需访问cache后端
+        ref.update('2', {'age': 17})
+        assert writes == []
+    finally:
+        ref.update('2', {'age': age})
+    monkeypatch.setattr(crud, '_VERSION_INVALIDATION', [True])
+    ref.update('2', {'age': age})
+    assert writes
+
+
+def test_entity_cache_stampede():
+    ref = _CachedUser()
+    # 冷启动：仅有一个线程访问数据库
+    ref.update('2', {'age': 17})
+    results = []
+    workers = [threading.Thread(target=lambda: results.append(ref.get('2'))) for _ in range(5)]
+    ref._unittest_loads = []
+    try:
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        assert len(results) == 5 and all(r['age'] == 17 for r in results)
+        assert ref._unittest_loads == ['2']
+    finally:
+        ref.update('2', {'age': 16})
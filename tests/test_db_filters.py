@@ -1,10 +1,20 @@
 # coding=utf-8
 
+import datetime
+import decimal
 import pytest
 import logging
 import random
+import timeit
 
+import sqlalchemy
+
+from talos.common import cache
 from talos.db import crud
+from talos.db import dictbase
+from talos.db import filter_wrapper
+from talos.db import pagination
+from talos.db import query_plan
 from talos.core import config
 from talos.core import exceptions
 
@@ -63,6 +73,11 @@ class _User(_Base):
     orm_meta = models.User
 
 
+class _UserWithPlan(_Base):
+    orm_meta = models.User
+    _query_plan_cache = True
+
+
 class _UserWithFilter(_Base):
     orm_meta = models.User
     _default_filter = {'age': {'lte': 3, 'gte': 1}}
@@ -325,6 +340,87 @@ def test_count():
     assert count == 1
 
 
+def test_list_with_count():
+    total = _User().count()
+    count, users = _User().list_with_count(orders=['id'], limit=2)
+    assert count == total
+    assert [u['id'] for u in users] == ['1', '2']
+    count, users = _User().list_with_count(filters={'department.id': '2'}, orders=['id'], offset=1, limit=1)
+    assert count == 2
+    assert [u['id'] for u in users] == ['4']
+    count, users = _User().list_with_count(filters={'id': '1'})
+    assert count == 1
+    assert users[0]['id'] == '1'
+    count, users = _User().list_with_count(offset=total + 10, limit=2)
+    assert count == total
+    assert users == []
+
+
+def test_list_by_cursor():
+    for orders in (['name'], ['-department_id', 'id']):
+        expected = [u['id'] for u in _User().list(orders=orders)]
+        ids = []
+        users, cursor = _User().list_by_cursor(orders=orders, limit=2)
+        ids.extend([u['id'] for u in users])
+        while cursor:
+            users, cursor = _User().list_by_cursor(orders=orders, limit=2, cursor=cursor)
+            assert len(users) > 0
+            ids.extend([u['id'] for u in users])
+        assert ids == expected
+    users, cursor = _User().list_by_cursor(filters={'department.id': '2'}, orders=['id'], limit=1)
+    assert [u['id'] for u in users] == ['3']
+    users, cursor = _User().list_by_cursor(filters={'department.id': '2'}, orders=['id'], limit=1, cursor=cursor)
+    assert [u['id'] for u in users] == ['4']
+    assert cursor is None
+    with pytest.raises(exceptions.ValidationError):
+        _User().list_by_cursor(orders=['name'], limit=1, cursor='not-a-cursor')
+    users, cursor = _User().list_by_cursor(orders=['name'], limit=1)
+    with pytest.raises(exceptions.ValidationError):
+        _User().list_by_cursor(orders=['-name'], limit=1, cursor=cursor)
+
+
+def test_cursor_encoding():
+    values = ['a', 1, None, datetime.datetime(2020, 1, 2, 3, 4, 5, 6), datetime.date(2020, 1, 2),
+              decimal.Decimal('1.10')]
+    orders = ['+a', '-b', '+c', '+d', '+e', '+f']
+    cursor = pagination.encode_cursor(orders, values)
+    assert '=' not in cursor
+    assert pagination.decode_cursor(cursor, orders) == values
+
+
+def test_iter_list():
+    users = _User().list(orders=['id'])
+    assert list(_User().iter_list(orders=['id'], batch_size=1)) == users
+    assert list(_User().iter_list(orders=['id'], offset=1, limit=2, batch_size=1)) == users[1:3]
+
+
+def test_count_with_strategy():
+    total = _User().count()
+
+    class _CappedUser(_User):
+        _count_strategy = 'capped'
+        _count_cap = 2
+
+    assert _CappedUser().count_with_strategy() == (2, 'capped')
+    assert _CappedUser().count_with_strategy(filters={'id': '1'}) == (1, 'exact')
+
+    class _EstimatedUser(_User):
+        _count_strategy = 'estimated'
+
+    # sqlite不支持估算，回退为精确统计
+    assert _EstimatedUser().count_with_strategy() == (total, 'exact')
+
+    class _CachedUser(_User):
+        _count_strategy = 'cached'
+        _count_cache_expires = 60
+
+    resource = _CachedUser()
+    cache.delete(resource._count_cache_key({'department.id': '1'}))
+    assert resource.count_with_strategy(filters={'department.id': '1'}) == (2, 'cached')
+    assert cache.get(resource._count_cache_key({'department.id': '1'}), 60) == 2
+    assert resource.count_with_strategy(filters={'department.id': '1'}, hooks=[lambda q, f: q]) == (2, 'exact')
+
+
 def test_default_filter():
     # WHERE user.age > ? AND user.age = ? AND user.age >= ? AND user.age <= ?
     users = _UserWithFilter().list({'age': {'eq': 3, 'gt': 1}})
@@ -365,6 +461,37 @@ def test_dynamic_relationship():
     assert 'address' in str(bs_query)
 
 
+def test_dynamic_relationship_options_cache():
+    options = _Business()._relationship_load_options(models.Business, level=3)
+    assert _Business()._relationship_load_options(models.Business, level=3) is options
+    assert _BusinessDetailSum()._relationship_load_options(models.Business, level=3) is not options
+
+    # 新增mapper并重新configure后缓存失效
+    class _OptionsCacheModel(models.Base, dictbase.DictBase):
+        __tablename__ = 'unittest_options_cache'
+        id = sqlalchemy.Column(sqlalchemy.String(36), primary_key=True)
+
+    sqlalchemy.orm.configure_mappers()
+    assert _Business()._relationship_load_options(models.Business, level=3) is not options
+
+
+def test_setup_selectin_batch_size():
+    loader = sqlalchemy.orm.strategies.SelectInLoader
+    origin = loader._chunksize
+    try:
+        assert crud.setup_selectin_batch_size(7)
+        assert loader._chunksize == 7
+        # 默认使用配置
+        assert crud.setup_selectin_batch_size()
+        assert loader._chunksize == CONF.dbcrud.selectin_batch_size
+        # 资源实例化不再修改全局设置
+        loader._chunksize = 7
+        _Business(dynamic_load_method='adaptive')
+        assert loader._chunksize == 7
+    finally:
+        loader._chunksize = origin
+
+
 def test_multi_level_relationship_error():
     origin = CONF.dbcrud.unsupported_filter_as_empty
     CONF.dbcrud.to_dict()['unsupported_filter_as_empty'] = True
@@ -443,3 +570,142 @@ def test_multi_level_relationship():
                 }
             }]
         }}) == 0
+
+
+def test_query_plan_cache():
+    cache = _UserWithPlan.query_plan_cache()
+    cache.clear()
+    users = _UserWithPlan().list({'id': '1'})
+    assert len(users) == 1 and users[0]['id'] == '1'
+    users = _UserWithPlan().list({'id': '2'})
+    assert len(users) == 1 and users[0]['id'] == '2'
+    assert cache.stats()['misses'] == 1
+    assert cache.stats()['hits'] == 1
+    # like类操作绑定前应用模板
+    users = _UserWithPlan().list({'name': {'ilike': 'ac'}})
+    assert set([u['id'] for u in users]) == set(['2', '3', '4'])
+    users = _UserWithPlan().list({'name': {'ilike': 'ek'}})
+    assert [u['id'] for u in users] == ['1']
+    # 列表长度不同为不同形态
+    assert _UserWithPlan().count({'id': ['1', '2']}) == 2
+    assert _UserWithPlan().count({'id': ['3', '4']}) == 2
+    assert _UserWithPlan().count({'id': ['1', '2', '3']}) == 3
+    assert _UserWithPlan().get('3')['id'] == '3'
+    assert _UserWithPlan().get('4')['id'] == '4'
+    # relationship过滤
+    users = _UserWithPlan().list({'department': {'name': '技术部'}, 'age': {'gt': 20}})
+    assert [u['id'] for u in users] == ['1']
+    users = _UserWithPlan().list({'department': {'name': '业务部'}, 'age': {'gt': 2}})
+    assert [u['id'] for u in users] == ['4']
+    stats = cache.stats()
+    assert stats['hits'] == 5
+    assert stats['misses'] == 6
+
+
+def test_query_plan_cache_unbindable():
+    cache = _UserWithPlan.query_plan_cache()
+    cache.clear()
+    # 不支持的过滤条件无法参数化，回退为常规查询
+    users = _UserWithPlan().list({'age': {'like': 3}})
+    assert len(users) > 1
+    users = _UserWithPlan().list({'age': {'like': 3}})
+    assert len(users) > 1
+    assert cache.stats()['misses'] == 1
+    assert cache.stats()['hits'] == 1
+
+
+class _UserWithPlanCustomApply(_UserWithPlan):
+
+    def _apply_filters(self, query, orm_meta, filters=None, orders=None):
+        self.applied.append(filters)
+        return super(_UserWithPlanCustomApply, self)._apply_filters(query, orm_meta, filters=filters, orders=orders)
+
+
+def test_query_plan_cache_custom_apply_filters():
+    cache = _UserWithPlanCustomApply.query_plan_cache()
+    cache.clear()
+    # 重写了_apply_filters(旧签名)的资源类不使用查询计划
+    ref = _UserWithPlanCustomApply()
+    ref.applied = []
+    assert [u['id'] for u in ref.list({'age': {'gt': 10}}, orders=['id'])] == ['1', '2']
+    assert {'age': {'gt': 10}} in ref.applied
+    assert ref.count({'age': {'gt': 10}}) == 2
+    assert ref.get('1')['id'] == '1'
+    assert cache.stats()['misses'] == 0
+
+
+class _UserWithPlanScoped(_Base):
+    orm_meta = models.User
+    _query_plan_cache = True
+
+    def __init__(self, department_id, **kwargs):
+        self.department_id = department_id
+        super(_UserWithPlanScoped, self).__init__(**kwargs)
+
+    @property
+    def default_filter(self):
+        return {'department_id': self.department_id}
+
+
+def test_query_plan_cache_default_filter():
+    cache = _UserWithPlanScoped.query_plan_cache()
+    cache.clear()
+    # 按实例变化的default_filter同样参数化，不能复用其他实例的过滤值
+    users = _UserWithPlanScoped('1').list({'age': {'gt': 1}})
+    assert [u['id'] for u in users] == ['1', '2']
+    users = _UserWithPlanScoped('2').list({'age': {'gt': 1}})
+    assert [u['id'] for u in users] == ['4']
+    assert cache.stats()['hits'] == 1
+
+    class _CustomFilter(filter_wrapper.Filter):
+        pass
+
+    # 自定义Filter子类未声明bindable_ops，不参与参数化
+    handler = _CustomFilter()
+    with pytest.raises(query_plan.Unbindable):
+        query_plan.Binder().bind(handler, 'eq', models.User.name, query_plan.PlanValue(0))
+
+
+# test_db_filters中使用的过滤表达式
+_FILTER_EXPRESSIONS = ['id', 'name', 'age', 'department.id', 'department.name', 'notexistscol']
+
+
+def test_filter_expression_cache():
+    # mapper configure时缓存会被清空
+    sqlalchemy.orm.configure_mappers()
+    filter_wrapper.clear_expression_cache()
+    expr_cache = filter_wrapper.expression_cache()
+    for name in _FILTER_EXPRESSIONS:
+        expected = filter_wrapper.column_from_expression(models.User, name)
+        for _ in range(2):
+            expr_wrapper, column, handler = filter_wrapper.resolve_column(models.User, name)
+            assert column is expected[1]
+            assert (expr_wrapper is None) == (expected[0] is None)
+            if column is not None:
+                assert handler is filter_wrapper.get_filter(filter_wrapper.column_visit_name(column).lower())
+    assert filter_wrapper.resolve_relationship(models.User, 'department')[1] is models.User.department
+    assert expr_cache.misses == len(_FILTER_EXPRESSIONS) + 1
+    assert expr_cache.hits == len(_FILTER_EXPRESSIONS)
+    users = _User().list(filters={'department.id': '2', 'age': None})
+    assert [u['id'] for u in users] == ['3']
+    # 注册过滤器后缓存失效
+    filter_wrapper.register_filter('string', filter_wrapper.get_filter('string'))
+    assert filter_wrapper.expression_cache().misses == 0
+
+
+def test_filter_expression_benchmark():
+
+    def _uncached():
+        for name in _FILTER_EXPRESSIONS:
+            expr_wrapper, column = filter_wrapper.column_from_expression(models.User, name)
+            if column is not None:
+                filter_wrapper.get_filter(filter_wrapper.column_visit_name(column).lower())
+
+    def _cached():
+        for name in _FILTER_EXPRESSIONS:
+            filter_wrapper.resolve_column(models.User, name)
+
+    uncached = timeit.timeit(_uncached, number=2000)
+    cached = timeit.timeit(_cached, number=2000)
+    LOG.info('resolve %d filter expressions x 2000: cached %.3fs, uncached %.3fs',
+             len(_FILTER_EXPRESSIONS), cached, uncached)
@@ -0,0 +1,123 @@
+# coding=utf-8
+
+import logging
+import timeit
+
+from sqlalchemy import Column, String, PickleType
+
+from talos.db import dictbase
+
+from tests import models
+
+LOG = logging.getLogger(__name__)
+
+
+class _SerializeModel(models.Base, dictbase.DictBase):
+    __tablename__ = 'unittest_serialize'
+    attributes = ['id', 'tags', 'upper_id', 'owner']
+    summary_attributes = ['id', 'upper_id']
+
+    id = Column(String(36), primary_key=True)
+    tags = Column(PickleType)
+
+    @property
+    def upper_id(self):
+        return self.id.upper()
+
+    @property
+    def owner(self):
+        return models.Department(id='1', name='dep')
+
+
+# 以下为预编译之前的序列化实现，用于对比结果以及性能
+def _reference_flat(obj, value, prefix):
+    if prefix and prefix.strip():
+        return obj._convert_flat_dict(value, prefix=prefix.strip())
+    return obj._convert_flat_dict(value)
+
+
+def _reference_serialize(obj, columns, child, prefix, flat_dict):
+    d = {}
+    for attr in columns:
+        value = getattr(obj, attr)
+        if isinstance(value, dictbase.DictBase):
+            value = child(value, flat_dict)
+            if flat_dict:
+                d.update(_reference_flat(obj, value, prefix))
+                continue
+        if isinstance(value, (tuple, list, set)):
+            if value:
+                if isinstance(value[0], dictbase.DictBase):
+                    value = [child(v, flat_dict) for v in value]
+            else:
+                value = []
+        if prefix and prefix.strip():
+            d[prefix.strip() + attr] = value
+        else:
+            d[attr] = value
+    return d
+
+
+def _reference_summary(obj, flat_dict=False, prefix=None):
+    return _reference_serialize(obj, obj.sum_columns(), _reference_summary, prefix, flat_dict)
+
+
+def _reference_list(obj, flat_dict=False, prefix=None):
+    return _reference_serialize(obj, obj.list_columns(), _reference_summary, prefix, flat_dict)
+
+
+def _reference_detail(obj, flat_dict=False, prefix=None, child_as_summary=False):
+    child = _reference_summary if child_as_summary else _reference_list
+    return _reference_serialize(obj, obj.get_columns(), child, prefix, flat_dict)
+
+
+def _make_users(count):
+    departments = [models.Department(id=str(i), name='dep%d' % i) for i in range(10)]
+    users = []
+    for i in range(count):
+        user = models.User(id=str(i), name='user%d' % i, department_id=str(i % 10), age=i % 100)
+        user.department = departments[i % 10]
+        user.addresses = [models.Address(id='%d-%d' % (i, j), location='loc', user_id=str(i)) for j in range(2)]
+        users.append(user)
+    return users
+
+
+def test_serializer_equivalence():
+    objs = _make_users(3) + [models.User(id='x', name='nodep'),
+                             _SerializeModel(id='s', tags=['a']),
+                             _SerializeModel(id='t', tags=[])]
+    for obj in objs:
+        for flat_dict in (False, True):
+            for prefix in (None, ' ', 'p_'):
+                assert obj.to_dict(prefix=prefix, flat_dict=flat_dict) == _reference_list(obj, flat_dict, prefix)
+                assert obj.to_summary_dict(prefix=prefix, flat_dict=flat_dict) == _reference_summary(
+                    obj, flat_dict, prefix)
+                assert obj.to_summary_dict(prefix=prefix, flat_dict=flat_dict, fields={'id'}) == dict(
+                    (k, v) for k, v in _reference_summary(obj, flat_dict, prefix).items()
+                    if k == (prefix or '').strip() + 'id')
+                for child_as_summary in (False, True):
+                    assert obj.to_detail_dict(prefix=prefix, flat_dict=flat_dict,
+                                              child_as_summary=child_as_summary) == _reference_detail(
+                                                  obj, flat_dict, prefix, child_as_summary)
+
+
+def _timed(func):
+    results = []
+    elapsed = timeit.timeit(lambda: results.append(func()), number=1)
+    return elapsed, results[0]
+
+
+def test_serializer_benchmark():
+    users = _make_users(10000)
+    for name, compiled_func, reference_func in (
+            ('to_dict', lambda: [u.to_dict() for u in users], lambda: [_reference_list(u) for u in users]),
+            ('to_detail_dict', lambda: [u.to_detail_dict() for u in users],
+             lambda: [_reference_detail(u) for u in users]),
+            ('to_summary_dict', lambda: [u.to_summary_dict() for u in users],
+             lambda: [_reference_summary(u) for u in users])):
+        compiled, compiled_result = _timed(compiled_func)
+        reference, reference_result = _timed(reference_func)
+        # 计时的结果本身也必须与预编译之前的实现一致
+        assert compiled_result == reference_result
+        assert len(compiled_result) == len(users)
+        LOG.info('%s on 10k rows: compiled %.3fs, reference %.3fs', name, compiled, reference)
@@ -1,10 +1,12 @@
 # coding=utf-8
 
+import json
 import logging
 
 from talos.db import crud, pool
 from talos.core import config
 
+from tests import MockRequest
 from tests import models
 
 LOG = logging.getLogger(__name__)
@@ -94,3 +96,274 @@ def test_db_dynamic_none():
     assert len(users) > 3
     for u in users:
         assert u['name'] not in ['multi_01_01', 'multi_01_02', 'multi_01_03']
+
+
+def _replica_pool(replicas, **kwargs):
+    param = {'connection': 'sqlite:///tests/unittest.sqlite3', 'replicas': replicas}
+    param.update(kwargs)
+    return pool.DBPool(param=param)
+
+
+def _names(users):
+    return set(u['name'] for u in users)
+
+
+def test_replica_round_robin():
+    dbpool = _replica_pool(['sqlite:///tests/multi_db_01.sqlite3',
+                            {'connection': 'sqlite:///tests/multi_db_02.sqlite3'}])
+    dbpool.unpin_primary()
+    first = _names(_User_dynamic(dbpool=dbpool).list())
+    second = _names(_User_dynamic(dbpool=dbpool).list())
+    assert first | second == set(['multi_01_01', 'multi_01_02', 'multi_01_03',
+                                  'multi_02_01', 'multi_02_02', 'multi_02_03'])
+    assert _User_dynamic(dbpool=dbpool).count() == 3
+    # 事务内的读取使用主库
+    resource = _User_dynamic(dbpool=dbpool)
+    with resource.transaction():
+        assert 'Deke' in _names(resource.list())
+
+
+def test_replica_read_your_writes():
+    dbpool = _replica_pool(['sqlite:///tests/multi_db_01.sqlite3'])
+    dbpool.unpin_primary()
+    assert _User_dynamic(dbpool=dbpool).get('1')['name'] == 'multi_01_01'
+    _User_dynamic(dbpool=dbpool).update('1', {'name': 'Deke_rw'})
+    try:
+        assert dbpool.pinned
+        assert _User_dynamic(dbpool=dbpool).get('1')['name'] == 'Deke_rw'
+        dbpool.unpin_primary()
+        assert _User_dynamic(dbpool=dbpool).get('1')['name'] == 'multi_01_01'
+    finally:
+        _User_dynamic(dbpool=dbpool).update('1', {'name': 'Deke'})
+        dbpool.unpin_primary()
+
+
+class _User_cached(_User_dynamic):
+    _entity_cache = True
+
+
+def test_replica_cache_fill_from_primary():
+    from talos.common import controller
+
+    class _Response(object):
+
+        def set_header(self, name, value):
+            pass
+
+    class _Users(controller.CollectionController):
+        resource = _User_cached
+        response_cache = True
+
+        def make_resource(self, req):
+            return self.resource(dbpool=dbpool)
+
+    dbpool = _replica_pool(['sqlite:///tests/multi_db_01.sqlite3'])
+    dbpool.unpin_primary()
+    try:
+        # 实体缓存未命中时从主库加载
+        _User_cached(dbpool=dbpool).update('1', {'name': 'Deke'})
+        dbpool.unpin_primary()
+        assert _User_cached(dbpool=dbpool).get('1')['name'] == 'Deke'
+        assert not dbpool.pinned
+        # 响应缓存未命中时，本次请求的读取固定使用主库
+        req = MockRequest()
+        req.params = {'__orders': 'id', 'id': '1'}
+        req.get_header = lambda name: None
+        resp = _Response()
+        _Users().on_get(req, resp)
+        assert dbpool.pinned
+        assert [u['name'] for u in json.loads(resp.body)['data']] == ['Deke']
+    finally:
+        dbpool.unpin_primary()
+
+
+def test_replica_policy():
+    dbpool = _replica_pool(['sqlite:///tests/multi_db_01.sqlite3', 'sqlite:///tests/multi_db_02.sqlite3'],
+                           replica_policy=pool.ROUTING_LEAST_OUTSTANDING)
+    busy, idle = dbpool.replicas
+    busy.metrics.checked_out = 2
+    assert dbpool.choose_replica() is idle
+    dbpool.replica_policy = pool.ROUTING_LATENCY
+    busy.metrics.latency, idle.metrics.latency = 1.0, 0.0001
+    chosen = [dbpool.choose_replica() for i in range(100)]
+    assert chosen.count(idle) > 90
+
+
+def test_replica_eject():
+    dbpool = _replica_pool(['sqlite:////talos_not_exist/replica.sqlite3', 'sqlite:///tests/multi_db_01.sqlite3'])
+    dbpool.unpin_primary()
+    broken = dbpool.replicas[0]
+    try:
+        _User_dynamic(dbpool=dbpool).list()
+    except Exception:
+        pass
+    # 连接失败的从库被摘除，后续读取均使用健康的从库
+    assert not broken.healthy
+    for i in range(3):
+        assert _names(_User_dynamic(dbpool=dbpool).list()) == set(['multi_01_01', 'multi_01_02', 'multi_01_03'])
+    broken.ejected_until = 0
+    assert broken.healthy
+
+
+def test_request_scoped_session():
+    import sqlalchemy.event
+    from talos.middlewares import db_session
+    from talos.utils import scoped_globals
+
+    class _Request(object):
+        method = 'GET'
+        path = '/'
+
+        def __init__(self):
+            self.context = {}
+
+    dbpool = _replica_pool([])
+    checkouts = []
+    checkins = []
+    sqlalchemy.event.listen(dbpool.engine, 'checkout', lambda *args: checkouts.append(1))
+    sqlalchemy.event.listen(dbpool.engine, 'checkin', lambda *args: checkins.append(1))
+    old_request = getattr(scoped_globals.GLOBALS, 'request', None)
+    req = _Request()
+    scoped_globals.GLOBALS.request = req
+    middleware = db_session.RequestSession()
+    try:
+        middleware.process_request(req, None)
+        resource = _User_dynamic(dbpool=dbpool)
+        assert resource.count() == len(resource.list())
+        assert resource.get('1')['name'] == 'Deke'
+        # 请求内的读取复用同一连接
+        assert len(checkouts) == 1
+        with resource.transaction():
+            assert resource.get('1')['name'] == 'Deke'
+        assert len(checkouts) == 2
+        middleware.process_response(req, None, None, True)
+        assert len(checkins) == 2
+        # 请求级会话结束后使用普通会话
+        assert resource.get('1')['name'] == 'Deke'
+        assert len(checkouts) == 3
+    finally:
+        scoped_globals.GLOBALS.request = old_request
+
+
+def test_pool_metrics():
+    import falcon
+    import falcon.testing
+    from talos.common import metrics
+    from talos.middlewares import json_translator
+    from talos.server import base
+
+    class _Sink(pool.MetricsSink):
+
+        def __init__(self):
+            self.events = []
+
+        def increment(self, pool_name, name, value=1):
+            self.events.append((pool_name, name))
+
+        def timing(self, pool_name, name, seconds):
+            self.events.append((pool_name, name))
+
+    sink = _Sink()
+    pool.add_metrics_sink(sink)
+    try:
+        dbpool = pool.DBPool(param={'connection': 'sqlite:///tests/multi_db_01.sqlite3',
+                                    'replicas': ['sqlite:///tests/multi_db_02.sqlite3'],
+                                    'slow_query_threshold': 0}, name='unittest_metrics')
+        dbpool.unpin_primary()
+        _User_dynamic(dbpool=dbpool).list()
+        resource = _User_dynamic(dbpool=dbpool)
+        with resource.transaction():
+            resource.list()
+    finally:
+        pool.remove_metrics_sink(sink)
+    data = pool.metrics()['unittest_metrics']
+    primary = data['primary']
+    replica = data['replicas']['unittest_metrics.replicas.0']
+    assert primary['connects'] == 1 and replica['connects'] == 1
+    assert primary['checked_out'] == 0
+    assert primary['query']['count'] == primary['slow_queries'] >= 1
+    assert primary['checkout_wait']['count'] == 1
+    assert primary['checkout_wait']['buckets'][-1] == ['+Inf', 1]
+    assert replica['healthy'] is True
+    assert ('unittest_metrics.replicas.0', 'query') in sink.events
+    assert ('unittest_metrics', 'checkout_wait') in sink.events
+
+    text = pool.format_metrics()
+    assert text.count('# TYPE talos_db_query_seconds histogram') == 1
+    assert 'talos_db_pool_connects_total{pool="unittest_metrics",role="primary"} 1' in text
+
+    api = falcon.API(middleware=[json_translator.JSONTranslator()])
+    api.add_error_handler(Exception, base.error_http_exception)
+    metrics.add_metrics_route(api)
+    metrics.add_metrics_route(api, '/metrics/private', allow_hosts=['10.0.0.0/8', 'fd00::/8'])
+    client = falcon.testing.TestClient(api)
+    resp = client.simulate_get('/metrics')
+    assert resp.status_code == 200 and resp.text == pool.format_metrics()
+    resp = client.simulate_get('/metrics', params={'format': 'json'})
+    assert resp.json['unittest_metrics']['primary']['connects'] == 1
+    assert client.simulate_get('/metrics/private').status_code == 403
+    assert client.simulate_get('/metrics/private', remote_addr='10.1.2.3').status_code == 200
+    assert client.simulate_get('/metrics/private', remote_addr='fd00::1').status_code == 200
+    assert client.simulate_get('/metrics/private', remote_addr='::ffff:10.1.2.3').status_code == 200
+    assert client.simulate_get('/metrics/private', remote_addr='::1').status_code == 403
+    assert client.simulate_get('/metrics/private', remote_addr='unknown').status_code == 403
+
+
+def test_pool_reflesh():
+    import time
+    import pytest
+    import sqlalchemy.event
+    import sqlalchemy.pool
+
+    dbpool = pool.DBPool(param={'connection': 'sqlite:///tests/multi_db_01.sqlite3',
+                                'poolclass': sqlalchemy.pool.QueuePool, 'pool_size': 2, 'pool_prewarm': 2})
+    old_engine = dbpool.engine
+    # 预热后连接池中保留空闲连接
+    assert old_engine.pool.checkedin() == 2
+    disposed = []
+    sqlalchemy.event.listen(old_engine, 'engine_disposed', lambda engine: disposed.append(engine))
+    in_flight = old_engine.connect()
+    dbpool.reflesh({'connection': 'sqlite:///tests/multi_db_02.sqlite3',
+                    'poolclass': sqlalchemy.pool.QueuePool, 'pool_size': 2, 'pool_prewarm': 1})
+    assert dbpool.engine is not old_engine and dbpool.engine.pool.checkedin() == 1
+    assert _names(_User_dynamic(dbpool=dbpool).list()) == set(['multi_02_01', 'multi_02_02', 'multi_02_03'])
+    # 旧引擎在借出的连接归还后才释放
+    assert in_flight.execute('select count(*) from user').scalar() == 3
+    assert not disposed
+    in_flight.close()
+    for i in range(50):
+        if disposed:
+            break
+        time.sleep(0.05)
+    assert disposed == [old_engine]
+    # 新连接池预热失败时保留原连接池
+    with pytest.raises(ValueError):
+        dbpool.reflesh({'connection': 'sqlite:////talos_not_exist/db.sqlite3', 'pool_prewarm': 1})
+    assert _names(_User_dynamic(dbpool=dbpool).list()) == set(['multi_02_01', 'multi_02_02', 'multi_02_03'])
+    dbpool.prewarm(2)
+    assert dbpool.engine.pool.checkedin() == 2
+
+
+def test_initialize_db_reuse_pools():
+    from talos.server import base
+
+    dbs = CONF.dbs.to_dict()
+    db01 = pool.POOLS.db01
+    dbs['default'] = {'connection': 'sqlite:///tests/multi_db_02.sqlite3'}
+    try:
+        base.initialize_db()
+        # 重复初始化时复用已有连接池
+        assert pool.POOLS.db01 is db01
+        # dbs中名为default的连接池与defaultPool互不影响
+        assert pool.POOLS.default is not pool.defaultPool
+        assert 'multi_db_02' in str(pool.POOLS.default.engine.url)
+        assert 'unittest' in str(pool.defaultPool.engine.url)
+        assert pool.get_pool('default') is pool.defaultPool
+        assert pool.get_pool('dbs.default') is pool.POOLS.default
+        base.initialize_db()
+        assert 'unittest' in str(pool.defaultPool.engine.url)
+    finally:
+        dbs.pop('default')
+        pool.POOLS.set_options(dict((name, dbpool) for name, dbpool in pool.POOLS.to_dict().items()
+                                    if name != 'default'))
+        pool._NAMED_POOLS.pop('dbs.default', None)
@@ -124,3 +124,20 @@ def test_xmlutils():
     LOG.info(ret)
     assert ret.startswith(u'<?xml'.encode('utf-8'))
 
+
+
+def test_lru_cache():
+    cache = utils.LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert 'b' not in cache
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.stats() == {'hits': 3, 'misses': 1, 'size': 2, 'maxsize': 2}
+    cache.delete('a')
+    assert len(cache) == 1
+    cache.clear()
+    assert cache.stats() == {'hits': 0, 'misses': 0, 'size': 0, 'maxsize': 2}